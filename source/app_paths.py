@@ -0,0 +1,24 @@
+"""
+Writable per-user locations for Cartoonizer (caches, profiles, sockets).
+Matches the launcher: ~/Library/Application Support/Cartoonizer on macOS.
+Override with CARTOONIZER_HOME.
+"""
+import os
+import sys
+from pathlib import Path
+
+
+def _default_support_dir() -> Path:
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Application Support" / "Cartoonizer"
+    xdg = os.environ.get("XDG_DATA_HOME")
+    return (Path(xdg) if xdg else Path.home() / ".local" / "share") / "cartoonizer"
+
+
+APP_SUPPORT_DIR = Path(os.environ.get("CARTOONIZER_HOME") or _default_support_dir())
+
+
+def support_path(*parts: str) -> Path:
+    """Path inside APP_SUPPORT_DIR; the directory is created on demand."""
+    APP_SUPPORT_DIR.mkdir(parents=True, exist_ok=True)
+    return APP_SUPPORT_DIR.joinpath(*parts)
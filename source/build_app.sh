@@ -17,6 +17,28 @@ chmod +x "$MACOS/cartoonizer_launcher"
 cp cartoonizer.py "$RESOURCES/cartoonizer.py"
 cp requirements.txt "$RESOURCES/requirements.txt"
 cp progress_window.py "$RESOURCES/progress_window.py"
+cp progress_channel.py "$RESOURCES/progress_channel.py"
+cp startup_timing.py "$RESOURCES/startup_timing.py"
+cp output_writer.py "$RESOURCES/output_writer.py"
+cp ingest.py "$RESOURCES/ingest.py"
+cp memory_governor.py "$RESOURCES/memory_governor.py"
+cp logs.py "$RESOURCES/logs.py"
+cp hires.py "$RESOURCES/hires.py"
+cp roi.py "$RESOURCES/roi.py"
+cp hot_folder.py "$RESOURCES/hot_folder.py"
+cp job_control.py "$RESOURCES/job_control.py"
+cp single_flight.py "$RESOURCES/single_flight.py"
+cp cpu_tuning.py "$RESOURCES/cpu_tuning.py"
+cp token_merging.py "$RESOURCES/token_merging.py"
+cp feature_cache.py "$RESOURCES/feature_cache.py"
+cp guidance.py "$RESOURCES/guidance.py"
+cp idle_unload.py "$RESOURCES/idle_unload.py"
+cp lazy_components.py "$RESOURCES/lazy_components.py"
+cp component_store.py "$RESOURCES/component_store.py"
+cp model_store.py "$RESOURCES/model_store.py"
+cp daemon.py "$RESOURCES/daemon.py"
+cp frames.py "$RESOURCES/frames.py"
+cp app_paths.py "$RESOURCES/app_paths.py"
 if [ -f assets/Cartoonizer.icns ]; then
   cp assets/Cartoonizer.icns "$RESOURCES/Cartoonizer.icns"
 fi
@@ -1,26 +1,65 @@
+import time
+
+_IMPORT_START = time.perf_counter()
+
 import argparse
+import atexit
+import fnmatch
 import os
 import inspect
+import shutil
 import socket
+import subprocess
+import sys
+import tempfile
 import threading
-import time
 import types
+import uuid
 import webbrowser
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, List, Optional, Sequence, Tuple
 
+import numpy as np
 import torch
+import diffusers
 from diffusers import StableDiffusionImg2ImgPipeline
 from PIL import Image
 import gradio as gr
 
+import cpu_tuning
+import feature_cache
+import model_store
+import token_merging
+from component_store import ComponentStore
+from cpu_tuning import CpuProfile, apply_saved_profile
+from daemon import DaemonServer, Emit
+from feature_cache import set_feature_cache
+from frames import OUTPUTS as FRAME_OUTPUTS, Frames, copy_to_uint8, group_by_size, take, to_pipeline_input
+from guidance import StepCallback, describe_guidance, guidance_kwargs
+from hires import HiresOptions, run_refine
+from hot_folder import HotFolder, ThroughputMeter
+from idle_unload import IdleUnloader
+from ingest import MAX_IMAGE_SIDE, fit_to_max_side, image_size, prepare_image
+from job_control import CancelToken, JobCancelled, SessionJobs
+from lazy_components import lazy_report, load_lazy_pipeline
+from logs import log
+from memory_governor import MemoryGovernor, calibrate, release_cached_memory, save_calibration, scaled_size
+from model_store import resolve_model
+from output_writer import EncodeOptions, OutputWriter, encode_image, format_from_path
+from roi import RegionOptions, parse_box, stylize_region
+from single_flight import SingleFlight, request_key
+from startup_timing import StageTimer
+from token_merging import set_token_merging
+
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
+
 APP_DIR = Path(__file__).resolve().parent
 FAVICON_PATH = APP_DIR / "cartoonizer_web_icon.png"
-MAX_IMAGE_SIDE = int(os.environ.get("CARTOONIZER_MAX_SIDE", "768"))
-
-
-def log(msg: str) -> None:
-    print(f"[Cartoonizer] {msg}", flush=True)
+# The GUI writes each result to a per-run temp folder (removed at exit) and
+# keeps only the newest few; Gradio copies the file it returns anyway.
+GUI_OUTPUTS_KEPT = 8
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
 
 
 CUSTOM_CSS = """
@@ -117,42 +156,8 @@ def get_device() -> str:
     return "cpu"
 
 
-def load_img2img_pipeline(
-    model_id: str,
-    device: Optional[str] = None,
-    use_half: bool = True,
-) -> StableDiffusionImg2ImgPipeline:
-    """
-    Load a Stable Diffusion img2img pipeline.
-    model_id: Hugging Face model id, e.g. 'Lykon/dreamshaper-8'.
-    """
-    if device is None:
-        device = get_device()
-
-    # MPS has issues with float16 VAE decoding (produces black images).
-    # Use float16 only on CUDA, float32 everywhere else for compatibility.
-    if use_half and device == "cuda":
-        dtype = torch.float16
-    else:
-        dtype = torch.float32
-
-    log(f"Loading pipeline '{model_id}' on {device} (dtype={dtype})")
-    pipe = StableDiffusionImg2ImgPipeline.from_pretrained(
-        model_id,
-        torch_dtype=dtype,
-        safety_checker=None,
-        low_cpu_mem_usage=True,
-        use_safetensors=True,
-    )
-
-    try:
-        pipe = pipe.to(device)
-    except (AssertionError, RuntimeError) as exc:
-        log(f"Failed to move pipeline to {device}: {exc}. Falling back to CPU.")
-        device = "cpu"
-        pipe = pipe.to(device)
-
-    final_device = torch.device(device)
+def _pin_pipeline_device(pipe: StableDiffusionImg2ImgPipeline, final_device: torch.device) -> None:
+    """Force prompt encoding, timesteps and latents onto final_device."""
     try:
         object.__setattr__(pipe, "_execution_device", final_device)
     except Exception:
@@ -193,19 +198,78 @@ def load_img2img_pipeline(
 
     pipe.prepare_latents = types.MethodType(_prepare_latents_fixed, pipe)
 
-    pipe.enable_attention_slicing()
-    try:
-        pipe.enable_vae_slicing()
-        pipe.enable_vae_tiling()
-    except Exception:
-        pass
 
-    # xFormers is CUDA-only; ignore errors on Mac.
-    try:
-        pipe.enable_xformers_memory_efficient_attention()
-    except Exception:
-        pass
+def load_img2img_pipeline(
+    model_id: str,
+    device: Optional[str] = None,
+    use_half: bool = True,
+    timer: Optional[StageTimer] = None,
+    low_memory: bool = False,
+    store: Optional[ComponentStore] = None,
+) -> StableDiffusionImg2ImgPipeline:
+    """
+    Load a Stable Diffusion img2img pipeline.
+    model_id: Hugging Face model id, e.g. 'Lykon/dreamshaper-8'. A verified
+    copy in the local model store is used without contacting the hub.
+    timer: records the resolve_model / from_pretrained / to_device / patching stages.
+    low_memory: only load each component's weights while its stage runs
+    (see lazy_components.py).
+    store: reuse identical VAE/text encoder modules already loaded for other
+    models, and offer this one's (see component_store.py).
+    """
+    if device is None:
+        device = get_device()
+    if timer is None:
+        timer = StageTimer()
+
+    # MPS has issues with float16 VAE decoding (produces black images).
+    # Use float16 only on CUDA, float32 everywhere else for compatibility.
+    if use_half and device == "cuda":
+        dtype = torch.float16
+    else:
+        dtype = torch.float32
+
+    log(f"Loading pipeline '{model_id}' on {device} (dtype={dtype})")
+    with timer.stage("resolve_model", f"Locating model files ({model_id})...", model=model_id):
+        # Hub lookups and downloads happen here, so from_pretrained only reads local files.
+        source, shared = resolve_model(model_id), {}
+        if not os.path.isdir(source):
+            source = StableDiffusionImg2ImgPipeline.download(source, use_safetensors=True)
+
+    with timer.stage("from_pretrained", f"Loading model weights ({model_id})...", model=model_id):
+        if low_memory:
+            pipe = load_lazy_pipeline(StableDiffusionImg2ImgPipeline, source, dtype)
+        else:
+            if store is not None:
+                shared = store.shared(source, dtype, device)
+            pipe = StableDiffusionImg2ImgPipeline.from_pretrained(
+                source,
+                torch_dtype=dtype,
+                safety_checker=None,
+                low_cpu_mem_usage=True,
+                use_safetensors=True,
+                **shared,
+            )
+
+    with timer.stage("to_device", f"Moving model to {device}...", device=device):
+        try:
+            pipe = pipe.to(device)
+        except (AssertionError, RuntimeError) as exc:
+            log(f"Failed to move pipeline to {device}: {exc}. Falling back to CPU.")
+            device = "cpu"
+            pipe = pipe.to(device)
+
+    with timer.stage("patching", "Preparing pipeline..."):
+        _pin_pipeline_device(pipe, torch.device(device))
+        # xFormers is CUDA-only; ignore errors on Mac.
+        try:
+            pipe.enable_xformers_memory_efficient_attention()
+        except Exception:
+            pass
+    if store is not None and not low_memory:
+        store.register(pipe, source, dtype, device)
 
+    # Attention/VAE slicing is chosen per job by MemoryGovernor.apply().
     return pipe
 
 
@@ -224,23 +288,27 @@ def pick_server_port(preferred: int = 7860) -> int:
         return sock.getsockname()[1]
 
 
-def prepare_image(path: str, max_side: int = MAX_IMAGE_SIDE) -> Image.Image:
-    """
-    Load an image and resize while keeping aspect ratio so that
-    the largest side is at most max_side.
-    """
-    img = Image.open(path).convert("RGB")
-    w, h = img.size
-    scale = min(max_side / max(w, h), 1.0)
-    if scale < 1.0:
-        img = img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
-    return img
-
-
 # ---------------------------
 # Core cartoonization functions
 # ---------------------------
 
+STYLE_PRESETS = {
+    "anime": "highly detailed anime style, clean lines, cel shading, vibrant colors",
+    "comic": "comic book style, bold ink outlines, halftone shading, dramatic lighting",
+    "pixar": "3D Pixar style, soft lighting, smooth shading, expressive eyes",
+    "sketch": "clean line art sketch, black ink, minimal shading, white background",
+    "watercolor": "soft watercolor painting, pastel colors, gentle edges",
+}
+NEGATIVE_PROMPT = "blurry, distorted, extra limbs, text, logo, low quality"
+# The GUI has always sent this shorter one; keep it so seeded GUI results reproduce.
+GUI_NEGATIVE_PROMPT = "blurry, distorted, extra limbs, text, logo"
+
+
+def style_prompt(style: str, prompt_extra: str = "") -> str:
+    base = STYLE_PRESETS.get(style.lower(), STYLE_PRESETS["anime"])
+    return base + (", " + prompt_extra if prompt_extra else "")
+
+
 def cartoonize_single(
     pipe: StableDiffusionImg2ImgPipeline,
     input_path: str,
@@ -251,90 +319,469 @@ def cartoonize_single(
     guidance_scale: float = 7.5,
     steps: int = 30,
     seed: Optional[int] = None,
+    writer: Optional[OutputWriter] = None,
+    max_side: int = MAX_IMAGE_SIDE,
+    governor: Optional[MemoryGovernor] = None,
+    hires: Optional[HiresOptions] = None,
+    region: Optional[RegionOptions] = None,
+    tome_ratio: float = 0.0,
+    cache_interval: int = 1,
+    cfg_cutoff: float = 1.0,
+    callback: Optional[StepCallback] = None,
 ) -> str:
     """
     Cartoonize one image and save it to output_path.
+    With a writer the image is handed to its encoder pool and this returns as
+    soon as inference finishes; otherwise the format is taken from the
+    output_path extension and the file is written before returning.
+    The governor picks resolution/slicing for the available memory and
+    retries in a cheaper configuration on out-of-memory errors.
+    With hires, the stylization runs at hires.base_side and the result is
+    upscaled and refined to hires.target_side (see hires.py).
+    With region, only that part of the image is stylized and blended back
+    into the original at its native resolution (see roi.py).
+    tome_ratio: fraction of UNet self-attention tokens to merge (see token_merging.py).
+    cache_interval: run the full UNet only every this many steps (see feature_cache.py).
+    cfg_cutoff: apply classifier-free guidance only for this fraction of the steps (see guidance.py).
+    callback: step-end callback for every denoising pass (e.g. progress reporting).
     """
-    presets = {
-        "anime": "highly detailed anime style, clean lines, cel shading, vibrant colors",
-        "comic": "comic book style, bold ink outlines, halftone shading, dramatic lighting",
-        "pixar": "3D Pixar style, soft lighting, smooth shading, expressive eyes",
-        "sketch": "clean line art sketch, black ink, minimal shading, white background",
-        "watercolor": "soft watercolor painting, pastel colors, gentle edges",
-    }
-
-    base = presets.get(style.lower(), presets["anime"])
-    prompt = base + (", " + prompt_extra if prompt_extra else "")
-    negative_prompt = "blurry, distorted, extra limbs, text, logo, low quality"
-
-    img = prepare_image(input_path)
-
-    generator = None    # type: ignore
-    if seed is not None:
-        generator = torch.Generator(device=pipe.device).manual_seed(seed)
-
-    result = pipe(
-        prompt=prompt,
-        image=img,
-        strength=strength,
-        guidance_scale=guidance_scale,
-        negative_prompt=negative_prompt,
-        num_inference_steps=steps,
-        generator=generator,
-    )
-    out_img = result.images[0]
-
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    out_img.save(output_path)
+    prompt = style_prompt(style, prompt_extra)
+    negative_prompt = NEGATIVE_PROMPT
+
+    if governor is None:
+        governor = MemoryGovernor.for_pipe(pipe)
+    set_token_merging(pipe, tome_ratio)
+    cache = set_feature_cache(pipe, cache_interval)
+
+    def stylize(img: Image.Image) -> Image.Image:
+        generator = None    # type: ignore
+        if seed is not None:
+            generator = torch.Generator(device=pipe.device).manual_seed(seed)
+
+        result = pipe(
+            prompt=prompt,
+            image=img,
+            strength=strength,
+            guidance_scale=guidance_scale,
+            negative_prompt=negative_prompt,
+            num_inference_steps=steps,
+            generator=generator,
+            **guidance_kwargs(cfg_cutoff, callback),
+        )
+        return result.images[0]
+
+    width, height = image_size(input_path)
+    if region is not None:
+        canvas = prepare_image(input_path, max_side=max(width, height))
+        out_img = stylize_region(pipe, governor, canvas, region, max_side, stylize)
+    else:
+        if hires is not None:
+            max_side = hires.base_side
+        plan = governor.plan(width, height, max_side)
+        out_img = governor.run(pipe, plan, lambda plan: stylize(prepare_image(input_path, max_side=plan.max_side)))
+        if hires is not None:
+            out_img = run_refine(
+                pipe, governor, out_img, prompt, negative_prompt, hires, guidance_scale, seed,
+                pipe_kwargs=guidance_kwargs(cfg_cutoff, callback),
+            )
+    if cache is not None and cache_interval > 1:
+        log(cache.describe())
+    report = lazy_report(pipe)
+    if report is not None:
+        log(report)
+
+    if writer is not None:
+        writer.submit(out_img, output_path)
+    else:
+        written = encode_image(out_img, output_path, EncodeOptions(format=format_from_path(output_path)))
+        log(f"Wrote {written.describe()}")
     return output_path
 
 
+def cartoonize_frames(
+    pipe: StableDiffusionImg2ImgPipeline,
+    frames: Frames,
+    style: str = "anime",
+    prompt_extra: str = "",
+    strength: float = 0.6,
+    guidance_scale: float = 7.5,
+    steps: int = 30,
+    seed: Optional[int] = None,
+    max_side: int = MAX_IMAGE_SIDE,
+    batch_size: int = 4,
+    output: str = "numpy",
+    governor: Optional[MemoryGovernor] = None,
+    tome_ratio: float = 0.0,
+    cache_interval: int = 1,
+    cfg_cutoff: float = 1.0,
+    callback: Optional[StepCallback] = None,
+):
+    """
+    Cartoonize frames that are already decoded and return arrays, without
+    PIL images or files in between (see frames.py).
+    frames: a uint8 HxWx3 / NxHxWx3 NumPy array, a 3xHxW / Nx3xHxW tensor
+    (uint8, or float in [0, 1]), or a list of them. Consecutive frames of the
+    same size run batch_size at a time (fewer if the governor says they do
+    not fit).
+    output: "numpy" (uint8 HxWx3 per frame), "tensor" (float 3xHxW in [0, 1]
+    on the pipeline's device) or "latent" (the final latents, not decoded).
+    A single array or tensor returns one stacked result, a list a list.
+    With seed, frame i uses seed + i however the frames are batched. The
+    remaining options work as in cartoonize_single.
+    """
+    if output not in FRAME_OUTPUTS:
+        raise ValueError(f"output must be one of {', '.join(FRAME_OUTPUTS)}")
+    stacked = isinstance(frames, (np.ndarray, torch.Tensor))
+    prompt = style_prompt(style, prompt_extra)
+    if governor is None:
+        governor = MemoryGovernor.for_pipe(pipe)
+    set_token_merging(pipe, tome_ratio)
+    cache = set_feature_cache(pipe, cache_interval)
+
+    def stylize(batch: torch.Tensor, first: int):
+        n = batch.shape[0]
+        generator = None    # type: ignore
+        if seed is not None:
+            generator = [torch.Generator(device=pipe.device).manual_seed(seed + first + i) for i in range(n)]
+        return pipe(
+            prompt=[prompt] * n,
+            image=batch,
+            strength=strength,
+            guidance_scale=guidance_scale,
+            negative_prompt=[NEGATIVE_PROMPT] * n,
+            num_inference_steps=steps,
+            generator=generator,
+            output_type="latent" if output == "latent" else "pt",
+            **guidance_kwargs(cfg_cutoff, callback),
+        ).images
+
+    results = []
+    first = 0
+    for group in group_by_size(frames):
+        count = sum(t.shape[0] for t in group)
+        height, width = group[0].shape[-2:]
+
+        def job(plan):
+            chunks, out = [], None
+            for start in range(0, count, plan.batch_size):
+                stop = min(start + plan.batch_size, count)
+                batch = to_pipeline_input(take(group, start, stop), pipe.device, pipe.dtype, plan.max_side)
+                images = stylize(batch, first + start)
+                if output != "numpy":
+                    chunks.append(images)
+                    continue
+                if out is None:
+                    out = np.empty((count, images.shape[2], images.shape[3], 3), dtype=np.uint8)
+                copy_to_uint8(images, out[start:stop])
+            return out if output == "numpy" else torch.cat(chunks)
+
+        plan = governor.plan(width, height, max_side, batch_size=min(batch_size, count))
+        results.append(governor.run(pipe, plan, job))
+        first += count
+    if cache is not None and cache_interval > 1:
+        log(cache.describe())
+    report = lazy_report(pipe)
+    if report is not None:
+        log(report)
+    if stacked:
+        return results[0]
+    return [frame for result in results for frame in result]
+
+
+def _matches_any(rel_path: str, patterns: Sequence[str]) -> bool:
+    """Match a relative POSIX path (or just its basename) against glob patterns."""
+    name = rel_path.rsplit("/", 1)[-1]
+    for pattern in patterns:
+        if fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern):
+            return True
+    return False
+
+
+def iter_input_images(
+    in_dir: str,
+    recursive: bool = False,
+    include: Optional[Sequence[str]] = None,
+    exclude: Optional[Sequence[str]] = None,
+) -> Iterator[str]:
+    """
+    Stream image paths under in_dir, relative to it and using "/" separators.
+    Directories are walked lazily with os.scandir so the first candidate is
+    yielded as soon as it is seen, no matter how large the tree is.
+    include: glob patterns a file must match (default: known image extensions).
+    exclude: glob patterns for files or directories to skip entirely.
+    """
+    exclude = list(exclude or [])
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        abs_dir = os.path.join(in_dir, rel_dir) if rel_dir else in_dir
+        try:
+            it = os.scandir(abs_dir)
+        except OSError as exc:
+            log(f"Skipping unreadable folder {abs_dir}: {exc}")
+            continue
+        subdirs = []
+        with it:
+            for entry in it:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if exclude and _matches_any(rel_path, exclude):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            subdirs.append(rel_path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                if include:
+                    if not _matches_any(rel_path, include):
+                        continue
+                elif os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTENSIONS:
+                    continue
+                yield rel_path
+        # Depth-first, visiting siblings in directory order.
+        pending.extend(reversed(subdirs))
+
+
+def folder_output_path(out_dir: str, rel_path: str, extension: str) -> str:
+    """Output path for rel_path (relative to the input folder) in the mirrored out_dir."""
+    output_name = os.path.splitext(rel_path)[0] + "_cartoon" + extension
+    return os.path.join(out_dir, *output_name.split("/"))
+
+
+def exclude_outputs(in_dir: str, out_dir: str, extension: str, exclude: Optional[Sequence[str]]) -> List[str]:
+    """
+    exclude plus whatever keeps our own outputs from being read back as
+    inputs: out_dir itself when it lies inside in_dir, or the *_cartoon files
+    when both are the same folder.
+    """
+    exclude = list(exclude or [])
+    rel_out = os.path.relpath(os.path.abspath(out_dir), os.path.abspath(in_dir))
+    if rel_out == os.curdir:
+        exclude.append("*_cartoon" + extension)
+    elif rel_out != os.pardir and not rel_out.startswith(os.pardir + os.sep):
+        exclude.append(rel_out.replace(os.sep, "/"))
+    return exclude
+
+
 def cartoonize_folder(
     pipe: StableDiffusionImg2ImgPipeline,
     in_dir: str,
     out_dir: str,
+    recursive: bool = False,
+    include: Optional[Sequence[str]] = None,
+    exclude: Optional[Sequence[str]] = None,
+    writer: Optional[OutputWriter] = None,
+    shard: Optional[Tuple[int, int]] = None,
     **kwargs,
 ):
     """
     Cartoonize all supported images in a folder.
+    With recursive=True subfolders are processed too and their layout is
+    mirrored under out_dir. Images start processing as soon as they are found,
+    and encoding overlaps with inference of the next image.
+    shard: (index, count) to process only every count-th image, starting at
+    index (used by the CPU batch workers).
     """
     os.makedirs(out_dir, exist_ok=True)
-    for fname in os.listdir(in_dir):
-        ext = os.path.splitext(fname)[1].lower()
-        if ext not in [".png", ".jpg", ".jpeg", ".webp", ".bmp"]:
-            continue
-        input_path = os.path.join(in_dir, fname)
-        output_name = os.path.splitext(fname)[0] + "_cartoon.png"
-        output_path = os.path.join(out_dir, output_name)
-        print(f"[+] {input_path} -> {output_path}")
-        cartoonize_single(pipe, input_path, output_path, **kwargs)
+    own_writer = writer is None
+    if own_writer:
+        writer = OutputWriter()
+    exclude = exclude_outputs(in_dir, out_dir, writer.options.extension, exclude)
+    count = 0
+    try:
+        for i, rel_path in enumerate(iter_input_images(in_dir, recursive=recursive, include=include, exclude=exclude)):
+            if shard is not None and i % shard[1] != shard[0]:
+                continue
+            input_path = os.path.join(in_dir, *rel_path.split("/"))
+            output_path = folder_output_path(out_dir, rel_path, writer.options.extension)
+            print(f"[+] {input_path} -> {output_path}")
+            cartoonize_single(pipe, input_path, output_path, writer=writer, **kwargs)
+            count += 1
+        writer.wait()
+    finally:
+        if own_writer:
+            writer.close()
+    log(f"Processed {count} image(s) from {in_dir} ({writer.summary()})")
+
+
+def watch_folder(
+    pipe: StableDiffusionImg2ImgPipeline,
+    in_dir: str,
+    out_dir: str,
+    recursive: bool = False,
+    include: Optional[Sequence[str]] = None,
+    exclude: Optional[Sequence[str]] = None,
+    writer: Optional[OutputWriter] = None,
+    settle: float = 2.0,
+    poll_interval: Optional[float] = None,
+    **kwargs,
+):
+    """
+    Keep the pipeline resident and cartoonize images as they land in in_dir,
+    until interrupted (Ctrl+C). Files are picked up once fully written and go
+    through the same per-file path as batch mode; images whose output is
+    already newer than the input are skipped on start-up.
+    poll_interval: poll instead of using filesystem events, at this interval.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    own_writer = writer is None
+    if own_writer:
+        writer = OutputWriter()
+    exclude = exclude_outputs(in_dir, out_dir, writer.options.extension, exclude)
+
+    def is_done(rel_path: str) -> bool:
+        output_path = folder_output_path(out_dir, rel_path, writer.options.extension)
+        try:
+            return os.path.getmtime(output_path) >= os.path.getmtime(os.path.join(in_dir, *rel_path.split("/")))
+        except OSError:
+            return False
+
+    folder = HotFolder(
+        in_dir,
+        scan=lambda: iter_input_images(in_dir, recursive=recursive, include=include, exclude=exclude),
+        recursive=recursive,
+        settle=settle,
+        poll_interval=poll_interval or 2.0,
+        polling=poll_interval is not None,
+        skip=is_done,
+        ignore_dirs=[out_dir],
+    )
+    meter = ThroughputMeter()
+    folder.start()
+    try:
+        while True:
+            rel_path = folder.queue.get()
+            input_path = os.path.join(in_dir, *rel_path.split("/"))
+            output_path = folder_output_path(out_dir, rel_path, writer.options.extension)
+            print(f"[+] {input_path} -> {output_path}")
+            try:
+                cartoonize_single(pipe, input_path, output_path, writer=writer, **kwargs)
+            except Exception as exc:
+                # One unreadable or half-copied file must not stop the watcher;
+                # it is retried if the file changes again.
+                log(f"[watch] failed on {rel_path}: {exc}")
+                continue
+            meter.tick()
+            log(f"[watch] queue depth {folder.queue.qsize()}; {meter.describe()}")
+    except KeyboardInterrupt:
+        log("[watch] stopping")
+    finally:
+        folder.stop()
+        try:
+            writer.wait()
+        finally:
+            if own_writer:
+                writer.close()
+    log(f"[watch] processed {meter.count} image(s) from {in_dir} ({writer.summary()})")
 
 
 # ---------------------------
 # Gradio GUI
 # ---------------------------
 
-def build_ui(default_model: str = "Lykon/dreamshaper-8"):
+def prune_outputs(folder: Path, keep: int) -> None:
+    """Delete all but the newest keep finished files in folder."""
+    files = []
+    for path in folder.iterdir():
+        try:
+            if not path.name.endswith(".part"):
+                files.append((path.stat().st_mtime, path))
+        except OSError:
+            pass
+    files.sort(reverse=True)
+    for _, path in files[keep:]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def build_ui(default_model: str = "Lykon/dreamshaper-8", idle_unload_minutes: float = 0.0, low_memory: bool = False):
     """
     Build the Gradio UI for interactive use.
+    idle_unload_minutes: free the pipeline after this long without requests (0 = never).
+    low_memory: load each model component only while it runs (see lazy_components.py).
     """
     device = get_device()
-    cache = {"pipe": None, "model": None}
+    cache = {"pipe": None, "model": None, "governor": None}
+    # Identical VAE/text encoder weights are shared when switching models.
+    components = ComponentStore()
+    # One encoder pool for both queue workers (options are passed per image),
+    # shut down with the app.
+    writer = OutputWriter(max_workers=2)
+    atexit.register(writer.close)
+    output_dir = Path(tempfile.mkdtemp(prefix="cartoonizer_outputs_"))
+    atexit.register(shutil.rmtree, output_dir, True)
+    output_lock = threading.Lock()
+    jobs = SessionJobs()
+    flights = SingleFlight()
+    # The queue runs two workers so an identical request can attach to one in
+    # flight; the pipeline itself still runs one job at a time.
+    pipeline_lock = threading.Lock()
+
+    def acquire_pipeline(token: CancelToken) -> None:
+        """Wait for the pipeline, giving up if the job is cancelled meanwhile."""
+        while not pipeline_lock.acquire(timeout=0.1):
+            token.raise_if_cancelled()
+
+    def unload_pipe() -> bool:
+        """Drop the pipeline (called by the idle unloader with pipeline_lock held)."""
+        if cache["pipe"] is None:
+            return False
+        cache["pipe"] = cache["governor"] = None
+        return True
+
+    idle = None
+    if idle_unload_minutes > 0:
+        idle = IdleUnloader(idle_unload_minutes * 60, unload_pipe, pipeline_lock, device)
+        idle.start()
 
     def ensure_pipe(model_id: str, progress: Optional[gr.Progress] = None):
         if cache["pipe"] is None or cache["model"] != model_id:
             if progress is not None:
                 progress(0.0, desc=f"Loading model {model_id}")
             log(f"Initializing pipeline for model '{model_id}'")
-            cache["pipe"] = load_img2img_pipeline(model_id, device=device)
+            timer = StageTimer.for_startup(
+                "gui_model_load",
+                ("resolve_model", "from_pretrained", "to_device", "patching"),
+                model=model_id,
+                device=device,
+                torch=torch.__version__,
+                diffusers=diffusers.__version__,
+            )
+            # Drop the previous model before loading the next one, but keep its
+            # shareable components alive so the store can hand them over.
+            previous = cache["pipe"]
+            keep = [previous.vae, previous.text_encoder] if previous is not None else []
+            cache["pipe"] = cache["governor"] = previous = None
+            release_cached_memory()
+            cache["pipe"] = load_img2img_pipeline(
+                model_id, device=device, timer=timer, low_memory=low_memory, store=components
+            )
+            del keep
+            timer.finish()
             cache["model"] = model_id
+            cache["governor"] = MemoryGovernor.for_pipe(cache["pipe"])
             if progress is not None:
                 progress(1.0, desc="Model ready")
             log("Pipeline ready")
         return cache["pipe"]
 
+    def submit_job(request: gr.Request) -> int:
+        """Runs outside the queue on every Generate click: supersedes the session's older jobs."""
+        return jobs.submit(request.session_hash)
+
+    def cancel_job(request: gr.Request) -> str:
+        if jobs.cancel(request.session_hash):
+            return "Cancelling... the current denoising step finishes first."
+        return "Nothing to cancel."
+
     def infer(
-        image: Image.Image,
+        job_id: int,
+        image_and_mask: Optional[dict],
         style: str,
         extra: str,
         strength: float,
@@ -346,73 +793,197 @@ def build_ui(default_model: str = "Lykon/dreamshaper-8"):
         export_format: str,
         quality: int,
         output_scale: float,
+        hires_enabled: bool,
+        hires_target: int,
+        hires_strength: float,
+        hires_steps: int,
+        hires_tile: int,
+        roi_enabled: bool,
+        roi_feather: int,
+        tome_ratio: float,
+        cache_interval: int,
+        cfg_cutoff: float,
+        request: gr.Request,
         progress: gr.Progress = gr.Progress(track_tqdm=True),
     ):
+        image = (image_and_mask or {}).get("image")
         if image is None:
             return None, "Please upload an image to begin."
+        image = image.convert("RGB")
+        mask = image_and_mask.get("mask")
+        if roi_enabled and (mask is None or mask.convert("L").getbbox() is None):
+            return None, "Region mode is on: paint over the part of the image to stylize first."
 
         status_lines = []
         status_lines.append("Loading/initializing model (first run may take several minutes)...")
-        log("Starting inference job")
-        pipe = ensure_pipe(model_id, progress=progress)
-        status_lines.append(f"Model ready on {pipe.device}. Generating image...")
-
-        presets = {
-            "Anime": "highly detailed anime style, clean lines, cel shading, vibrant colors",
-            "Comic": "comic book style, bold ink outlines, halftone shading, dramatic lighting",
-            "Pixar": "3D Pixar style, soft lighting, smooth shading, expressive eyes",
-            "Sketch": "clean line art sketch, black ink, minimal shading, white background",
-            "Watercolor": "soft watercolor painting, pastel colors, gentle edges",
-        }
-        base = presets.get(style, presets["Anime"])
-        prompt = base + (", " + extra if extra else "")
-        negative_prompt = "blurry, distorted, extra limbs, text, logo"
-
-        gen = None   # type: ignore
-        if seed >= 0:
-            gen = torch.Generator(device=pipe.device).manual_seed(seed)
-
-        # Resize image according to user setting
-        img = image.convert("RGB")
-        w, h = img.size
-        scale = min(max_side / max(w, h), 1.0)
-        if scale < 1.0:
-            img = img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
-        status_lines.append(f"Processing at resolution {img.size[0]}x{img.size[1]}...")
-
-        result = pipe(
-            prompt=prompt,
-            image=img,
-            strength=strength,
-            guidance_scale=guidance,
-            negative_prompt=negative_prompt,
-            num_inference_steps=steps,
-            generator=gen,
-        )
-        status_lines.append("Done!")
-        
-        out_img = result.images[0]
-        
-        # Handle format selection and downscaling
-        if export_format == "JPEG (smaller)":
-            if out_img.mode != 'RGB':
-                out_img = out_img.convert('RGB')
-            status_lines.append(f"Format: JPEG @ quality {quality}")
-        else:
-            status_lines.append("Format: PNG (lossless)")
-        
-        # Apply output scaling to adjust file size
-        if output_scale != 1.0:
-            new_w = int(out_img.width * output_scale)
-            new_h = int(out_img.height * output_scale)
-            # Use LANCZOS for downscaling, Resampling.LANCZOS for upscaling (best quality)
-            out_img = out_img.resize((new_w, new_h), Image.LANCZOS)
-            if output_scale > 1.0:
-                status_lines.append(f"Upscaled to {new_w}x{new_h}")
+        session = request.session_hash
+        token = jobs.begin(session, job_id)
+        try:
+            token.raise_if_cancelled()
+            log("Starting inference job")
+
+            prompt = style_prompt(style, extra)
+            negative_prompt = GUI_NEGATIVE_PROMPT
+
+            hires = None
+            if hires_enabled:
+                hires = HiresOptions(
+                    target_side=int(hires_target),
+                    base_side=int(max_side),
+                    strength=hires_strength,
+                    steps=int(hires_steps),
+                    tile_size=int(hires_tile),
+                )
+            if roi_enabled and hires is not None:
+                status_lines.append("Hires is skipped in region mode; the original resolution is kept.")
+                hires = None
+
+            def generate(run_token: CancelToken) -> Image.Image:
+                """The pipeline part of the job; run_token is shared by coalesced requests."""
+                acquire_pipeline(run_token)
+                try:
+                    reloading = cache["pipe"] is None
+                    load_start = time.perf_counter()
+                    pipe = ensure_pipe(model_id, progress=progress)
+                    unloaded = idle.take_report() if idle is not None else None
+                    if unloaded is not None and reloading:
+                        unloaded.reload_seconds = time.perf_counter() - load_start
+                        status_lines.append(unloaded.describe())
+                    run_token.raise_if_cancelled()
+                    status_lines.append(f"Model ready on {pipe.device}. Generating image...")
+                    governor = cache["governor"]
+                    set_token_merging(pipe, tome_ratio)
+                    if tome_ratio > 0:
+                        status_lines.append(f"Token merging: {tome_ratio:.0%} of self-attention tokens")
+                    feature_state = set_feature_cache(pipe, int(cache_interval))
+                    if guidance <= 1.0 or cfg_cutoff < 1.0:
+                        status_lines.append(describe_guidance(guidance, cfg_cutoff).capitalize())
+
+                    def stylize(img: Image.Image) -> Image.Image:
+                        gen = None   # type: ignore
+                        if seed >= 0:
+                            gen = torch.Generator(device=pipe.device).manual_seed(seed)
+                        result = pipe(
+                            prompt=prompt,
+                            image=img,
+                            strength=strength,
+                            guidance_scale=guidance,
+                            negative_prompt=negative_prompt,
+                            num_inference_steps=steps,
+                            generator=gen,
+                            **guidance_kwargs(cfg_cutoff, run_token.step_callback),
+                        )
+                        return result.images[0]
+
+                    if roi_enabled:
+                        region = RegionOptions(mask=mask, feather=int(roi_feather))
+                        status_lines.append(f"Stylizing the painted region only ({region.describe()})")
+                        out_img = stylize_region(pipe, governor, image, region, int(max_side), stylize)
+                    else:
+                        plan = governor.plan(image.width, image.height, int(max_side))
+                        status_lines.append(f"Memory plan: {plan.describe()}")
+                        work_w, work_h = scaled_size(image.width, image.height, plan.max_side)
+                        status_lines.append(f"Processing at resolution {work_w}x{work_h}...")
+                        used = {}
+
+                        def job(plan):
+                            used["plan"] = plan
+                            # Resize image according to user setting (possibly lowered by the governor)
+                            return stylize(fit_to_max_side(image, plan.max_side))
+
+                        out_img = governor.run(pipe, plan, job)
+                        if used["plan"] != plan:
+                            status_lines.append(f"Ran out of memory; retried with {used['plan'].describe()}")
+                    if hires is not None:
+                        status_lines.append(f"Hires refine: {hires.describe()}")
+                        out_img = run_refine(
+                            pipe,
+                            governor,
+                            out_img,
+                            prompt,
+                            negative_prompt,
+                            hires,
+                            guidance,
+                            seed if seed >= 0 else None,
+                            pipe_kwargs=guidance_kwargs(cfg_cutoff, run_token.step_callback),
+                        )
+                        status_lines.append(f"Refined to {out_img.width}x{out_img.height}")
+                    if feature_state is not None and cache_interval > 1:
+                        status_lines.append(feature_state.describe().capitalize())
+                    report = lazy_report(pipe)
+                    if report is not None:
+                        status_lines.append(report)
+                    return out_img
+                finally:
+                    if idle is not None:
+                        idle.touch()
+                    pipeline_lock.release()
+
+            if seed >= 0:
+                # Seeded requests are deterministic, so identical ones can share one computation.
+                key = request_key(
+                    image,
+                    mask if roi_enabled else None,
+                    dict(
+                        style=style, extra=extra, strength=strength, guidance=guidance, steps=int(steps),
+                        seed=int(seed), model=model_id, max_side=int(max_side), hires=hires,
+                        roi_feather=int(roi_feather) if roi_enabled else None, tome_ratio=tome_ratio,
+                        cache_interval=int(cache_interval), cfg_cutoff=cfg_cutoff,
+                    ),
+                )
+                # The computation runs on the flight's thread, where tqdm
+                # is not tracked, so report its steps to this request here.
+                def show_step(step: int, steps: int) -> None:
+                    progress((step, steps), desc="Denoising", unit="steps")
+
+                out_img, shared = flights.do(key, generate, token, on_step=show_step)
+                if shared:
+                    status_lines.append("An identical request was already running; reused its result.")
             else:
-                status_lines.append(f"Downscaled to {new_w}x{new_h}")
-        
-        return out_img, "\n".join(status_lines)
+                out_img = generate(token)
+            token.raise_if_cancelled()
+            status_lines.append("Done!")
+
+            # Apply output scaling to adjust file size
+            if output_scale != 1.0:
+                new_w = int(out_img.width * output_scale)
+                new_h = int(out_img.height * output_scale)
+                # Use LANCZOS for downscaling, Resampling.LANCZOS for upscaling (best quality)
+                out_img = out_img.resize((new_w, new_h), Image.LANCZOS)
+                if output_scale > 1.0:
+                    status_lines.append(f"Upscaled to {new_w}x{new_h}")
+                else:
+                    status_lines.append(f"Downscaled to {new_w}x{new_h}")
+
+            # Encode with the selected format so the preview/download is the real file
+            if export_format == "JPEG (smaller)":
+                options = EncodeOptions(format="jpeg", quality=quality, jpeg_progressive=True)
+            elif export_format == "WebP (smallest)":
+                options = EncodeOptions(format="webp", quality=quality)
+            else:
+                options = EncodeOptions(format="png")
+            # Gradio needs the file before infer returns; the pipeline lock is
+            # already released, so the other queue worker can run meanwhile.
+            with output_lock:
+                prune_outputs(output_dir, GUI_OUTPUTS_KEPT - 1)
+            out_name = f"cartoon_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+            written = writer.write(out_img, str(output_dir / (out_name + options.extension)), options)
+            status_lines.append(f"Format: {options.describe()}")
+            status_lines.append(
+                f"Saved {written.bytes_written / 1024:.0f} KB in {written.encode_seconds * 1000:.0f} ms"
+            )
+            log(f"Wrote {written.describe()}")
+
+            return written.path, "\n".join(status_lines)
+        except JobCancelled as exc:
+            release_cached_memory()
+            reason = token.reason or exc.reason
+            where = f" after step {exc.step}" if exc.step else " before it started"
+            status_lines.append(f"Cancelled{where} ({reason}).")
+            log(f"Inference job {job_id} {reason}{where}")
+            return gr.update(), "\n".join(status_lines)
+        finally:
+            jobs.end(session, token)
 
     def update_status_text(status: str) -> str:
         """Pass status strings from the hidden State to the visible textbox."""
@@ -462,10 +1033,11 @@ def build_ui(default_model: str = "Lykon/dreamshaper-8"):
             with gr.Column(scale=1, elem_classes="panel"):
                 img = gr.Image(
                     type="pil",
-                    label="Drop an image or click to upload",
+                    tool="sketch",
+                    label="Drop an image or click to upload (paint a region for region mode)",
                 )
                 style = gr.Radio(
-                    ["Anime", "Comic", "Pixar", "Sketch", "Watercolor"],
+                    [name.capitalize() for name in STYLE_PRESETS],
                     value="Anime",
                     label="Style palette",
                 )
@@ -477,7 +1049,7 @@ def build_ui(default_model: str = "Lykon/dreamshaper-8"):
                     0.1, 1.0, 0.6, step=0.05, label="Strength"
                 )
                 guidance = gr.Slider(
-                    3, 15, 7.5, step=0.5, label="Guidance scale"
+                    1, 15, 7.5, step=0.5, label="Guidance scale (1 = no guidance, about twice as fast)"
                 )
                 steps = gr.Slider(
                     10, 50, 30, step=1, label="Steps"
@@ -496,17 +1068,56 @@ def build_ui(default_model: str = "Lykon/dreamshaper-8"):
                     512, 4096, 768, step=128, label="Max resolution (pixels) — higher = larger file"
                 )
                 export_format = gr.Radio(
-                    ["PNG (lossless)", "JPEG (smaller)"],
+                    ["PNG (lossless)", "JPEG (smaller)", "WebP (smallest)"],
                     value="PNG (lossless)",
                     label="Export format",
                 )
                 quality = gr.Slider(
-                    70, 95, 90, step=1, label="JPEG quality (affects file size)"
+                    70, 95, 90, step=1, label="JPEG/WebP quality (affects file size)"
                 )
                 output_scale = gr.Slider(
                     0.25, 2.0, 1.0, step=0.25, label="Output scale (1.0 = full, 2.0 = upscaled 2x — larger files)"
                 )
-                btn = gr.Button("Generate", variant="primary")
+                with gr.Accordion("Hires (two-pass)", open=False):
+                    hires_enabled = gr.Checkbox(
+                        value=False,
+                        label="Stylize at max resolution, then upscale and refine",
+                    )
+                    hires_target = gr.Slider(
+                        1024, 4096, 2048, step=128, label="Hires target size (pixels)"
+                    )
+                    hires_strength = gr.Slider(
+                        0.1, 0.6, 0.3, step=0.05, label="Refine strength"
+                    )
+                    hires_steps = gr.Slider(
+                        2, 20, 8, step=1, label="Refine steps"
+                    )
+                    hires_tile = gr.Slider(
+                        0, 1536, 0, step=128, label="Refine tile size (0 = tile only when memory is short)"
+                    )
+                with gr.Accordion("Region (stylize part of the image)", open=False):
+                    roi_enabled = gr.Checkbox(
+                        value=False,
+                        label="Only stylize the region painted on the input image",
+                    )
+                    roi_feather = gr.Slider(
+                        0, 96, 24, step=4, label="Edge feather (pixels)"
+                    )
+                with gr.Accordion("Speed-ups", open=False):
+                    tome_ratio = gr.Slider(
+                        0.0, token_merging.MAX_RATIO, 0.0, step=0.05,
+                        label="Token merging (faster UNet, softer fine detail; 0 = off)",
+                    )
+                    cache_interval = gr.Slider(
+                        1, 6, 1, step=1, label="Feature cache: full UNet every N steps (1 = off)"
+                    )
+                    cfg_cutoff = gr.Slider(
+                        0.1, 1.0, 1.0, step=0.05,
+                        label="Guidance for the first fraction of steps (later steps run a single pass; 1 = all)",
+                    )
+                with gr.Row():
+                    btn = gr.Button("Generate", variant="primary")
+                    cancel_btn = gr.Button("Cancel", variant="secondary")
 
             with gr.Column(scale=1, elem_classes="output-panel"):
                 out = gr.Image(label="Cartoonized Output")
@@ -519,10 +1130,18 @@ def build_ui(default_model: str = "Lykon/dreamshaper-8"):
                     elem_classes="status-box",
                 )
                 status_state = gr.State(initial_status)
+                job_state = gr.State(0)
 
-        generate_event = btn.click(
+        # Registering the job skips the queue, so a new click supersedes the
+        # running job right away instead of waiting behind it.
+        generate_event = btn.click(submit_job, None, job_state, queue=False).then(
             infer,
-            [img, style, extra, strength, guidance, steps, seed, model_id, max_side, export_format, quality, output_scale],
+            [
+                job_state,
+                img, style, extra, strength, guidance, steps, seed, model_id, max_side, export_format, quality,
+                output_scale, hires_enabled, hires_target, hires_strength, hires_steps, hires_tile,
+                roi_enabled, roi_feather, tome_ratio, cache_interval, cfg_cutoff,
+            ],
             [out, status_state],
         )
         generate_event.then(
@@ -531,7 +1150,8 @@ def build_ui(default_model: str = "Lykon/dreamshaper-8"):
             outputs=status_box,
             show_progress=False,
         )
-        demo.queue(concurrency_count=1, max_size=8)
+        cancel_btn.click(cancel_job, None, status_box, queue=False)
+        demo.queue(concurrency_count=2, max_size=8)
 
     return demo
 
@@ -540,8 +1160,40 @@ def build_ui(default_model: str = "Lykon/dreamshaper-8"):
 # CLI
 # ---------------------------
 
-def parse_args():
-    ap = argparse.ArgumentParser(
+def parse_shard(text: str) -> Tuple[int, int]:
+    index, _, count = text.partition("/")
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError(f"invalid shard {text!r}")
+    return index, count
+
+
+def run_batch_workers(profile: CpuProfile) -> int:
+    """
+    Re-run this command as profile.workers processes, each taking one shard
+    of the folder and pinned to its CPU set; returns the worst exit code.
+    """
+    print(f"[i] Splitting the batch over {profile.describe()}")
+    procs = []
+    for worker in range(profile.workers):
+        env = dict(os.environ, **{cpu_tuning.WORKER_ENV: str(worker)})
+        cmd = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ["--shard", f"{worker}/{profile.workers}"]
+        procs.append(subprocess.Popen(cmd, env=env))
+    return max(proc.wait() for proc in procs)
+
+
+class JobArgumentParser(argparse.ArgumentParser):
+    """Parser for daemon jobs: errors and --help raise ValueError instead of printing and exiting."""
+
+    def error(self, message: str):
+        raise ValueError(f"{self.prog}: error: {message}")
+
+    def print_help(self, file=None) -> None:
+        raise ValueError(self.format_help())
+
+
+def parse_args(argv: Optional[Sequence[str]] = None, parser_cls: type = argparse.ArgumentParser):
+    ap = parser_cls(
         description="Local photo-to-cartoon converter using Stable Diffusion img2img."
     )
     ap.add_argument(
@@ -569,7 +1221,7 @@ def parse_args():
         "--guidance-scale",
         type=float,
         default=7.5,
-        help="Style intensity.",
+        help="Style intensity (1 or less turns guidance off and skips the unconditional pass).",
     )
     ap.add_argument(
         "--steps",
@@ -583,6 +1235,84 @@ def parse_args():
         default=-1,
         help="Random seed (>=0 for reproducible results, -1 for random).",
     )
+    ap.add_argument(
+        "--max-side",
+        type=int,
+        default=MAX_IMAGE_SIDE,
+        help="Largest side of the working resolution in pixels (may be lowered to fit memory).",
+    )
+    ap.add_argument(
+        "--hires",
+        type=int,
+        metavar="SIDE",
+        help="Two-pass mode: stylize at --hires-base-side, then upscale to SIDE and refine.",
+    )
+    ap.add_argument(
+        "--hires-base-side",
+        type=int,
+        default=768,
+        help="Working resolution of the first (full-strength) pass in hires mode.",
+    )
+    ap.add_argument(
+        "--hires-strength",
+        type=float,
+        default=0.3,
+        help="Strength of the hires refinement pass.",
+    )
+    ap.add_argument(
+        "--hires-steps",
+        type=int,
+        default=8,
+        help="Denoising steps run by the hires refinement pass.",
+    )
+    ap.add_argument(
+        "--hires-tile-size",
+        type=int,
+        default=0,
+        help="Refine in tiles of this size (0 = tile only when the full frame does not fit in memory).",
+    )
+    ap.add_argument(
+        "--roi",
+        type=parse_box,
+        metavar="L,T,R,B",
+        help="Only stylize this box (pixels, or fractions 0–1 of the image) and blend it into the original.",
+    )
+    ap.add_argument(
+        "--roi-mask",
+        help="Only stylize where this grayscale mask image is non-zero (scaled to the input size).",
+    )
+    ap.add_argument(
+        "--roi-padding",
+        type=float,
+        default=0.15,
+        help="Context around the region passed to the model, as a fraction of its size.",
+    )
+    ap.add_argument(
+        "--roi-feather",
+        type=int,
+        default=24,
+        help="Width in pixels of the soft edge between the region and the original.",
+    )
+    ap.add_argument(
+        "--tome-ratio",
+        type=float,
+        default=0.0,
+        help=f"Merge this fraction of UNet self-attention tokens for speed (0–{token_merging.MAX_RATIO}, 0 = off).",
+    )
+    ap.add_argument(
+        "--feature-cache",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Run the full UNet only every N steps and reuse its deep features in between (1 = off).",
+    )
+    ap.add_argument(
+        "--cfg-cutoff",
+        type=float,
+        default=1.0,
+        metavar="FRACTION",
+        help="Apply guidance only for this fraction of the steps, then run conditional-only passes (1 = all).",
+    )
     ap.add_argument(
         "--input",
         help="Input image path (single-image mode).",
@@ -600,21 +1330,293 @@ def parse_args():
         default="cartoon_out",
         help="Output folder (batch mode).",
     )
+    ap.add_argument(
+        "--recursive",
+        action="store_true",
+        help="Also process subfolders of --input-folder, mirroring them in the output folder.",
+    )
+    ap.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Only process files matching this glob (repeatable; default: common image types).",
+    )
+    ap.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Skip files or folders matching this glob (repeatable).",
+    )
+    ap.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and cartoonize images as they are added to --input-folder (Ctrl+C to stop).",
+    )
+    ap.add_argument(
+        "--watch-settle",
+        type=float,
+        default=2.0,
+        help="Seconds a new file must stay unchanged before it is processed in --watch mode.",
+    )
+    ap.add_argument(
+        "--watch-poll",
+        type=float,
+        metavar="SECONDS",
+        help="Poll the folder at this interval instead of using filesystem events (e.g. for network shares).",
+    )
+    ap.add_argument(
+        "--format",
+        choices=["png", "jpeg", "webp"],
+        default=None,
+        help="Output format (default: from the --output extension, else png).",
+    )
+    ap.add_argument(
+        "--quality",
+        type=int,
+        default=90,
+        help="JPEG/WebP quality (1–100).",
+    )
+    ap.add_argument(
+        "--png-compress-level",
+        type=int,
+        default=6,
+        choices=range(10),
+        metavar="0-9",
+        help="PNG zlib compression level (0 = fastest, 9 = smallest).",
+    )
+    ap.add_argument(
+        "--jpeg-progressive",
+        action="store_true",
+        help="Write progressive JPEGs.",
+    )
+    ap.add_argument(
+        "--jpeg-subsampling",
+        choices=["4:4:4", "4:2:2", "4:2:0"],
+        default="4:2:0",
+        help="JPEG chroma subsampling.",
+    )
+    ap.add_argument(
+        "--webp-lossless",
+        action="store_true",
+        help="Write lossless WebP.",
+    )
+    ap.add_argument(
+        "--encode-workers",
+        type=int,
+        default=2,
+        help="Threads used to encode/write outputs in parallel with inference.",
+    )
+    ap.add_argument(
+        "--calibrate",
+        action="store_true",
+        help="Measure attention/VAE memory use on this device for --model and cache it, then exit.",
+    )
+    ap.add_argument(
+        "--shard",
+        type=parse_shard,
+        help=argparse.SUPPRESS,
+    )
     ap.add_argument(
         "--gui",
         action="store_true",
         help="Launch Gradio web UI instead of CLI.",
     )
-    return ap.parse_args()
+    ap.add_argument(
+        "--low-memory",
+        action="store_true",
+        help="Load the text encoder, VAE and UNet weights only while each is needed (for 8 GB machines).",
+    )
+    ap.add_argument(
+        "--idle-unload",
+        type=float,
+        default=0.0,
+        metavar="MINUTES",
+        help="GUI: free the model after MINUTES without requests; it reloads on the next one (default 0 = never).",
+    )
+    ap.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep the model loaded and run jobs sent by 'daemon.py --input ...' over a Unix socket.",
+    )
+    ap.add_argument(
+        "--daemon-models",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Daemon: keep up to N models loaded (least recently used is unloaded first).",
+    )
+    args = ap.parse_args(argv)
+    if args.watch and not args.input_folder:
+        ap.error("--watch needs --input-folder")
+    if args.hires and (args.roi or args.roi_mask):
+        ap.error("--hires cannot be combined with --roi/--roi-mask (region mode keeps the original resolution)")
+    if not 0.0 <= args.tome_ratio <= token_merging.MAX_RATIO:
+        ap.error(f"--tome-ratio must be between 0 and {token_merging.MAX_RATIO}")
+    if not 1 <= args.feature_cache <= feature_cache.MAX_INTERVAL:
+        ap.error(f"--feature-cache must be between 1 and {feature_cache.MAX_INTERVAL}")
+    if not 0.0 < args.cfg_cutoff <= 1.0:
+        ap.error("--cfg-cutoff must be in (0, 1]")
+    if args.daemon_models < 1:
+        ap.error("--daemon-models must be at least 1")
+    return args
+
+
+def job_options(args: argparse.Namespace) -> Tuple[dict, EncodeOptions]:
+    """cartoonize_single keyword arguments (without governor) and output encoding for parsed options."""
+    kwargs = dict(
+        style=args.style,
+        prompt_extra=args.prompt_extra,
+        strength=args.strength,
+        guidance_scale=args.guidance_scale,
+        steps=args.steps,
+        seed=args.seed if args.seed >= 0 else None,
+        max_side=args.max_side,
+        tome_ratio=args.tome_ratio,
+        cache_interval=args.feature_cache,
+        cfg_cutoff=args.cfg_cutoff,
+    )
+    if args.hires:
+        kwargs["hires"] = HiresOptions(
+            target_side=args.hires,
+            base_side=args.hires_base_side,
+            strength=args.hires_strength,
+            steps=args.hires_steps,
+            tile_size=args.hires_tile_size,
+        )
+    if args.roi or args.roi_mask:
+        kwargs["region"] = RegionOptions(
+            box=args.roi,
+            mask=Image.open(args.roi_mask).convert("L") if args.roi_mask else None,
+            padding=args.roi_padding,
+            feather=args.roi_feather,
+        )
+
+    output_format = args.format
+    if output_format is None:
+        output_format = format_from_path(args.output) if args.output else "png"
+    encode_options = EncodeOptions(
+        format=output_format,
+        png_compress_level=args.png_compress_level,
+        quality=args.quality,
+        jpeg_progressive=args.jpeg_progressive,
+        jpeg_subsampling=args.jpeg_subsampling,
+        webp_lossless=args.webp_lossless,
+    )
+    return kwargs, encode_options
+
+
+def default_output_path(input_path: str, options: EncodeOptions) -> str:
+    root, _ = os.path.splitext(input_path)
+    return root + "_cartoon" + options.extension
+
+
+# ---------------------------
+# Daemon
+# ---------------------------
+
+def serve_daemon(args: argparse.Namespace) -> None:
+    """
+    Keep pipelines loaded and run the single-image jobs daemon.py clients
+    send, one at a time. A job is a cartoonizer.py command line; relative
+    paths are resolved against the client's working directory. Up to
+    args.daemon_models models stay loaded, each with its own governor.
+    """
+    device = get_device()
+    print(f"[i] Using device: {device}")
+    apply_saved_profile(device)
+    components = ComponentStore()
+    pipes: "OrderedDict[str, Tuple[StableDiffusionImg2ImgPipeline, MemoryGovernor]]" = OrderedDict()
+    lock = threading.Lock()
+
+    def get_pipe(model_id: str, emit: Emit) -> Tuple[StableDiffusionImg2ImgPipeline, MemoryGovernor]:
+        if model_id in pipes:
+            pipes.move_to_end(model_id)
+            return pipes[model_id]
+        while len(pipes) >= args.daemon_models:
+            evicted, _ = pipes.popitem(last=False)
+            log(f"Unloading '{evicted}'")
+        release_cached_memory()
+        emit({"event": "log", "message": f"Loading model {model_id}..."})
+        pipe = load_img2img_pipeline(model_id, device=device, low_memory=args.low_memory, store=components)
+        pipe.set_progress_bar_config(disable=True)
+        pipes[model_id] = (pipe, MemoryGovernor.for_pipe(pipe))
+        return pipes[model_id]
+
+    def handle(request: dict, emit: Emit) -> str:
+        if lock.locked():
+            emit({"event": "log", "message": "Waiting for the running job..."})
+        writer: Optional[OutputWriter] = None
+        try:
+            with lock:
+                job = parse_args(request["argv"], parser_cls=JobArgumentParser)
+                if not job.input or job.input_folder or job.gui or job.daemon or job.calibrate:
+                    raise ValueError("Daemon jobs take --input [--output] and per-image options only")
+                if job.low_memory:
+                    raise ValueError("--low-memory is a daemon setting; start the daemon with it instead")
+                cwd = request["cwd"]
+                job.input = os.path.join(cwd, job.input)
+                job.output = os.path.join(cwd, job.output) if job.output else None
+                job.roi_mask = os.path.join(cwd, job.roi_mask) if job.roi_mask else None
+                kwargs, encode_options = job_options(job)
+                output_path = job.output or default_output_path(job.input, encode_options)
+                pipe, governor = get_pipe(job.model, emit)
+
+                def progress(pipe, step: int, timestep, callback_kwargs: dict) -> dict:
+                    emit({"event": "progress", "step": step + 1, "steps": pipe.num_timesteps})
+                    return callback_kwargs
+
+                log(f"Cartoonizing {job.input} -> {output_path}")
+                writer = OutputWriter(
+                    encode_options,
+                    max_workers=1,
+                    on_result=lambda r: emit({"event": "log", "message": f"Wrote {r.describe()}"}),
+                )
+                cartoonize_single(
+                    pipe, job.input, output_path, writer=writer, governor=governor, callback=progress, **kwargs
+                )
+        finally:
+            # Closed outside the lock, so encoding overlaps with the next job's inference.
+            if writer is not None:
+                writer.close()
+        return output_path
+
+    with lock:
+        get_pipe(args.model, lambda message: None)
+    try:
+        DaemonServer(handle).serve_forever()
+    except KeyboardInterrupt:
+        log("Daemon stopped")
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "tune":
+        cpu_tuning.main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "models":
+        model_store.main(sys.argv[2:])
+        return
     args = parse_args()
 
     # GUI mode (used by the .app launcher)
     if args.gui:
+        timer = StageTimer.for_startup(
+            "gui",
+            ("imports", "build_ui", "server_bind"),
+            origin=_IMPORT_START,
+            model=args.model,
+            torch=torch.__version__,
+            diffusers=diffusers.__version__,
+            gradio=gr.__version__,
+        )
+        timer.record("imports", _IMPORT_SECONDS)
+        apply_saved_profile(get_device())
         log("Building Gradio UI...")
-        demo = build_ui(default_model=args.model)
+        with timer.stage("build_ui", "Building interface..."):
+            demo = build_ui(
+                default_model=args.model, idle_unload_minutes=args.idle_unload, low_memory=args.low_memory
+            )
         port = pick_server_port(7860)
         if port != 7860:
             print(f"[i] Port 7860 unavailable, using {port} instead.")
@@ -628,13 +1630,34 @@ def main():
             except Exception as exc:
                 print(f"[w] Could not open browser automatically: {exc}")
 
+        with timer.stage("server_bind", f"Starting web server on port {port}...", port=port):
+            demo.launch(
+                server_name="127.0.0.1",
+                server_port=port,
+                share=False,
+                inbrowser=False,
+                prevent_thread_lock=True,
+            )
+        timer.finish()
         threading.Thread(target=_auto_open, daemon=True).start()
-        demo.launch(
-            server_name="127.0.0.1",
-            server_port=port,
-            share=False,
-            inbrowser=False,
-        )
+        demo.block_thread()
+        return
+
+    if args.daemon:
+        serve_daemon(args)
+        return
+
+    if args.calibrate:
+        device = get_device()
+        print(f"[i] Calibrating memory strategies for {args.model} on {device}")
+        apply_saved_profile(device)
+        pipe = load_img2img_pipeline(args.model, device=device)
+        calibration = calibrate(pipe)
+        save_calibration(calibration)
+        governor = MemoryGovernor.for_pipe(pipe, calibration=calibration)
+        print(f"[i] Saved calibration '{calibration.key}'")
+        for name, side in governor.thresholds().items():
+            print(f"[i] {name}: fits up to {side}x{side} with current headroom")
         return
 
     # CLI mode
@@ -644,29 +1667,77 @@ def main():
 
     device = get_device()
     print(f"[i] Using device: {device}")
+    batch = bool(args.input_folder) and not args.watch
+    profile = apply_saved_profile(device, "batch" if batch else "interactive")
+    if batch and profile is not None and profile.workers > 1 and args.shard is None:
+        raise SystemExit(run_batch_workers(profile))
     print(f"[i] Loading model: {args.model}")
-    pipe = load_img2img_pipeline(args.model, device=device)
-
-    kwargs = dict(
-        style=args.style,
-        prompt_extra=args.prompt_extra,
-        strength=args.strength,
-        guidance_scale=args.guidance_scale,
-        steps=args.steps,
-        seed=args.seed if args.seed >= 0 else None,
+    timer = StageTimer.for_startup(
+        "cli",
+        ("imports", "resolve_model", "from_pretrained", "to_device", "patching"),
+        origin=_IMPORT_START,
+        model=args.model,
+        device=device,
+        torch=torch.__version__,
+        diffusers=diffusers.__version__,
     )
-
-    if args.input:
-        output_path = args.output
-        if not output_path:
-            root, _ = os.path.splitext(args.input)
-            output_path = root + "_cartoon.png"
-        print(f"[+] Cartoonizing {args.input} -> {output_path}")
-        cartoonize_single(pipe, args.input, output_path, **kwargs)
-
-    if args.input_folder:
-        print(f"[+] Cartoonizing folder {args.input_folder} -> {args.output_folder}")
-        cartoonize_folder(pipe, args.input_folder, args.output_folder, **kwargs)
+    timer.record("imports", _IMPORT_SECONDS)
+    pipe = load_img2img_pipeline(args.model, device=device, timer=timer, low_memory=args.low_memory)
+    timer.finish()
+
+    kwargs, encode_options = job_options(args)
+    kwargs["governor"] = MemoryGovernor.for_pipe(pipe)
+    if args.tome_ratio:
+        print(f"[i] Token merging: {args.tome_ratio:.0%} of self-attention tokens")
+    if args.feature_cache > 1:
+        print(f"[i] Feature cache: full UNet every {args.feature_cache} steps")
+    if args.guidance_scale <= 1.0 or args.cfg_cutoff < 1.0:
+        print(f"[i] {describe_guidance(args.guidance_scale, args.cfg_cutoff).capitalize()}")
+    if "hires" in kwargs:
+        print(f"[i] Hires: {kwargs['hires'].describe()}")
+    if "region" in kwargs:
+        print(f"[i] Region: {kwargs['region'].describe()}")
+    print(f"[i] Output format: {encode_options.describe()}")
+
+    with OutputWriter(
+        encode_options,
+        max_workers=max(1, args.encode_workers),
+        on_result=lambda r: print(f"[i] Wrote {r.describe()}"),
+    ) as writer:
+        # With CPU batch workers, only the first shard handles a single --input.
+        if args.input and (args.shard is None or args.shard[0] == 0):
+            output_path = args.output or default_output_path(args.input, encode_options)
+            print(f"[+] Cartoonizing {args.input} -> {output_path}")
+            cartoonize_single(pipe, args.input, output_path, writer=writer, **kwargs)
+
+        if args.input_folder and args.watch:
+            print(f"[+] Watching folder {args.input_folder} -> {args.output_folder}")
+            watch_folder(
+                pipe,
+                args.input_folder,
+                args.output_folder,
+                recursive=args.recursive,
+                include=args.include,
+                exclude=args.exclude,
+                writer=writer,
+                settle=args.watch_settle,
+                poll_interval=args.watch_poll,
+                **kwargs,
+            )
+        elif args.input_folder:
+            print(f"[+] Cartoonizing folder {args.input_folder} -> {args.output_folder}")
+            cartoonize_folder(
+                pipe,
+                args.input_folder,
+                args.output_folder,
+                recursive=args.recursive,
+                include=args.include,
+                exclude=args.exclude,
+                writer=writer,
+                shard=args.shard,
+                **kwargs,
+            )
+    print(f"[i] Output: {writer.summary()}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+"""
+Component deduplication across SD-1.5 checkpoints for Cartoonizer.
+Many fine-tunes ship byte-identical VAE and CLIP text encoder weights. The
+store identifies each component by the SHA-256 of its weight file and hands
+modules that are already loaded (in any live pipeline) to the next
+from_pretrained, so switching between such models only loads the UNet and
+every unique component is held in memory once.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+
+import torch
+
+from app_paths import support_path
+from logs import log
+
+HASH_FILE = "component_hashes.json"
+# Components that fine-tunes commonly leave untouched, and their weight files.
+SHAREABLE = {
+    "vae": os.path.join("vae", "diffusion_pytorch_model.safetensors"),
+    "text_encoder": os.path.join("text_encoder", "model.safetensors"),
+}
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+GiB = 1024 ** 3
+
+
+def _module_bytes(module: torch.nn.Module) -> int:
+    return sum(p.numel() * p.element_size() for p in module.parameters())
+
+
+class ComponentStore:
+    """
+    Live modules by (component, weight digest, dtype, device). Entries are
+    weak references: a component stays shared for as long as some pipeline
+    still uses it, and is freed with the last one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modules: Dict[Tuple[str, str, str, str], "weakref.ref[torch.nn.Module]"] = {}
+        self._hashes: Optional[Dict[str, dict]] = None
+
+    # ---------------------------
+    # Content hashes
+    # ---------------------------
+
+    def _hash_cache(self) -> Dict[str, dict]:
+        if self._hashes is None:
+            path = support_path(HASH_FILE)
+            try:
+                self._hashes = json.loads(path.read_text()) if path.exists() else {}
+            except (OSError, ValueError):
+                self._hashes = {}
+        return self._hashes
+
+    def _save_hash_cache(self) -> None:
+        path = support_path(HASH_FILE)
+        tmp = path.with_suffix(".json.part")
+        tmp.write_text(json.dumps(self._hashes, indent=2))
+        os.replace(tmp, path)
+
+    def digest(self, path: str) -> str:
+        """
+        SHA-256 of a weight file. Hugging Face cache blobs are already named
+        by it; other files are hashed once per (size, mtime).
+        """
+        real = os.path.realpath(path)
+        name = os.path.basename(real)
+        if _SHA256.match(name):
+            return name
+        st = os.stat(real)
+        cache = self._hash_cache()
+        entry = cache.get(real)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            return entry["sha256"]
+        sha = hashlib.sha256()
+        with open(real, "rb") as f:
+            for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+                sha.update(chunk)
+        cache[real] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha.hexdigest()}
+        self._save_hash_cache()
+        return sha.hexdigest()
+
+    # ---------------------------
+    # Sharing
+    # ---------------------------
+
+    def _keys(self, folder: str, dtype: torch.dtype, device: str) -> Dict[str, Tuple[str, str, str, str]]:
+        keys = {}
+        for name, rel_path in SHAREABLE.items():
+            path = os.path.join(folder, rel_path)
+            if os.path.exists(path):
+                keys[name] = (name, self.digest(path), str(dtype), device)
+        return keys
+
+    def shared(self, folder: str, dtype: torch.dtype, device: str) -> Dict[str, torch.nn.Module]:
+        """Already loaded modules that can stand in for this model's components."""
+        found = {}
+        keys = self._keys(folder, dtype, device)
+        with self._lock:
+            for name, key in keys.items():
+                ref = self._modules.get(key)
+                module = ref() if ref is not None else None
+                if module is not None:
+                    found[name] = module
+        if found:
+            saved = sum(_module_bytes(m) for m in found.values())
+            log(f"Reusing loaded {', '.join(found)} ({saved / GiB:.2f} GB not loaded again)")
+        return found
+
+    def register(self, pipe, folder: str, dtype: torch.dtype, device: str) -> None:
+        """Offer pipe's shareable components to later loads."""
+        keys = self._keys(folder, dtype, device)
+        with self._lock:
+            for name, key in keys.items():
+                module = getattr(pipe, name, None)
+                if module is not None:
+                    self._modules[key] = weakref.ref(module)
+            self._modules = {k: r for k, r in self._modules.items() if r() is not None}
+
+    def describe(self) -> str:
+        with self._lock:
+            live = [r() for r in self._modules.values()]
+        live = [m for m in live if m is not None]
+        return f"{len(live)} shared components ({sum(_module_bytes(m) for m in live) / GiB:.2f} GB)"
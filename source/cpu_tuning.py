@@ -0,0 +1,291 @@
+"""
+CPU thread/affinity tuning for Cartoonizer.
+`cartoonizer.py tune` benchmarks img2img on this machine across intra-op
+thread counts, inter-op settings and splits of the CPUs into several worker
+processes (one per NUMA node where there are several). The best single-process
+profile (used by the GUI, single images and --watch) and the best batch
+profile (used by --input-folder) are saved to cpu_profile.json and applied
+at start-up whenever the device is the CPU.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import torch
+
+from app_paths import support_path
+from logs import log
+
+PROFILE_FILE = "cpu_profile.json"
+WORKER_ENV = "CARTOONIZER_CPU_WORKER"
+
+
+@dataclass
+class CpuProfile:
+    """
+    workers: processes that split a batch; each gets cpu_sets[i] (if any)
+    and intra_op_threads / inter_op_threads torch threads.
+    """
+
+    workers: int
+    intra_op_threads: int
+    inter_op_threads: int
+    cpu_sets: List[List[int]] = field(default_factory=list)
+    images_per_minute: float = 0.0
+
+    def describe(self) -> str:
+        split = f"{self.workers} workers x " if self.workers > 1 else ""
+        pinned = ", pinned" if self.cpu_sets else ""
+        rate = f", {self.images_per_minute:.2f} img/min" if self.images_per_minute else ""
+        return f"{split}{self.intra_op_threads} threads (inter-op {self.inter_op_threads}{pinned}{rate})"
+
+
+# ---------------------------
+# Topology
+# ---------------------------
+
+def available_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _parse_cpulist(text: str) -> List[int]:
+    cpus: List[int] = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cpus.extend(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+
+def numa_nodes() -> List[List[int]]:
+    """Usable CPUs grouped by NUMA node (one group where sysfs has no topology)."""
+    usable = set(available_cpus())
+    nodes = []
+    root = "/sys/devices/system/node"
+    try:
+        names = sorted(n for n in os.listdir(root) if n.startswith("node") and n[4:].isdigit())
+    except OSError:
+        names = []
+    for name in names:
+        try:
+            with open(os.path.join(root, name, "cpulist")) as f:
+                cpus = [c for c in _parse_cpulist(f.read()) if c in usable]
+        except OSError:
+            continue
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [sorted(usable)]
+
+
+def machine_key() -> str:
+    return f"{platform.node()}|{platform.machine()}|cpus={len(available_cpus())}|torch{torch.__version__}"
+
+
+# ---------------------------
+# Profile file
+# ---------------------------
+
+def _read_profiles() -> Dict[str, dict]:
+    path = support_path(PROFILE_FILE)
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError) as exc:
+        log(f"Ignoring unreadable CPU profile {path}: {exc}")
+        return {}
+
+
+def load_profile(mode: str = "interactive") -> Optional[CpuProfile]:
+    """Saved profile for this machine; mode is "interactive" or "batch"."""
+    data = _read_profiles().get(machine_key(), {}).get(mode)
+    return CpuProfile(**data) if data else None
+
+
+def save_profiles(interactive: Optional[CpuProfile], batch: CpuProfile) -> None:
+    """interactive may be None when no single-process configuration could be measured."""
+    entries = _read_profiles()
+    entries[machine_key()] = {
+        "interactive": asdict(interactive) if interactive is not None else None,
+        "batch": asdict(batch),
+        "created": time.time(),
+    }
+    path = support_path(PROFILE_FILE)
+    tmp = path.with_suffix(".json.part")
+    tmp.write_text(json.dumps(entries, indent=2))
+    os.replace(tmp, path)
+
+
+def apply_profile(profile: CpuProfile, worker: int = 0) -> None:
+    """Pin this process to the worker's CPU set and set torch's thread pools."""
+    if profile.cpu_sets and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, profile.cpu_sets[worker % len(profile.cpu_sets)])
+        except OSError as exc:
+            log(f"Could not pin to CPUs {profile.cpu_sets[worker % len(profile.cpu_sets)]}: {exc}")
+    torch.set_num_threads(profile.intra_op_threads)
+    try:
+        torch.set_num_interop_threads(profile.inter_op_threads)
+    except RuntimeError:
+        # Only settable before the first inter-op parallel work in this process.
+        pass
+
+
+def apply_saved_profile(device: str, mode: str = "interactive") -> Optional[CpuProfile]:
+    """Apply the tuned profile when running on the CPU; returns it (None if untuned)."""
+    if device != "cpu":
+        return None
+    profile = load_profile(mode)
+    if profile is None:
+        log("No CPU profile for this machine yet; using torch defaults (run `cartoonizer.py tune`)")
+        return None
+    worker = int(os.environ.get(WORKER_ENV, "0"))
+    apply_profile(profile, worker)
+    log(f"Applied CPU profile ({mode}): {profile.describe()}")
+    return profile
+
+
+# ---------------------------
+# Benchmark
+# ---------------------------
+
+def candidate_profiles(cpus: Sequence[int], nodes: Sequence[Sequence[int]]) -> List[CpuProfile]:
+    """Configurations to measure, from one big process to per-node/per-slice workers."""
+    n = len(cpus)
+    candidates = []
+    for threads in sorted({n, max(1, n // 2), max(1, n // 4)}, reverse=True):
+        for inter in (1, 2):
+            candidates.append(CpuProfile(1, threads, inter, [list(cpus[:threads])] if threads < n else []))
+    splits = {}
+    if len(nodes) > 1:
+        splits[len(nodes)] = [list(node) for node in nodes]
+    for workers in (2, 4):
+        if workers not in splits and n // workers >= 2:
+            size = n // workers
+            splits[workers] = [list(cpus[i * size:(i + 1) * size]) for i in range(workers)]
+    for workers, sets in sorted(splits.items()):
+        candidates.append(CpuProfile(workers, min(len(s) for s in sets), 1, sets))
+    return candidates
+
+
+def _bench_worker(args: argparse.Namespace) -> None:
+    """One benchmark process: load, report ready, wait for "go", time a few images."""
+    from PIL import Image
+
+    from cartoonizer import load_img2img_pipeline
+
+    profile = CpuProfile(1, args.threads, args.interop, [args.cpus] if args.cpus else [])
+    apply_profile(profile)
+    pipe = load_img2img_pipeline(args.model, device="cpu")
+    pipe.set_progress_bar_config(disable=True)
+    image = Image.new("RGB", (args.side, args.side), (128, 128, 128))
+
+    def run():
+        pipe(prompt="a cartoon", image=image, strength=0.5, num_inference_steps=2 * args.steps, guidance_scale=7.5)
+
+    run()  # warm-up
+    print("ready", flush=True)
+    sys.stdin.readline()
+    start = time.perf_counter()
+    for _ in range(args.repeats):
+        run()
+    print(json.dumps({"seconds": time.perf_counter() - start, "images": args.repeats}), flush=True)
+
+
+def measure(profile: CpuProfile, model: str, side: int, steps: int, repeats: int) -> float:
+    """Aggregate images per minute of profile, all workers running at once."""
+    procs = []
+    for worker in range(profile.workers):
+        cmd = [
+            sys.executable, os.path.abspath(__file__), "bench-worker",
+            "--model", model, "--threads", str(profile.intra_op_threads),
+            "--interop", str(profile.inter_op_threads),
+            "--side", str(side), "--steps", str(steps), "--repeats", str(repeats),
+        ]
+        if profile.cpu_sets:
+            cmd += ["--cpus", ",".join(str(c) for c in profile.cpu_sets[worker])]
+        procs.append(subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True))
+    try:
+        for proc in procs:
+            for line in proc.stdout:
+                if line.strip() == "ready":
+                    break
+            else:
+                raise RuntimeError(f"benchmark worker exited with {proc.wait()}")
+        for proc in procs:
+            proc.stdin.write("go\n")
+            proc.stdin.flush()
+        rate = 0.0
+        for proc in procs:
+            lines = [line for line in proc.stdout if line.startswith("{")]
+            if proc.wait() != 0 or not lines:
+                raise RuntimeError(f"benchmark worker exited with {proc.returncode}")
+            result = json.loads(lines[-1])
+            rate += result["images"] / result["seconds"] * 60
+        return rate
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+
+
+def tune(model: str, side: int = 384, steps: int = 4, repeats: int = 2) -> None:
+    cpus = available_cpus()
+    nodes = numa_nodes()
+    log(f"Tuning CPU settings on {len(cpus)} CPUs in {len(nodes)} NUMA node(s) with {model}")
+    results = []
+    for profile in candidate_profiles(cpus, nodes):
+        log(f"Measuring {profile.describe()}...")
+        try:
+            profile.images_per_minute = measure(profile, model, side, steps, repeats)
+        except (OSError, RuntimeError) as exc:
+            log(f"  failed: {exc}")
+            continue
+        log(f"  {profile.images_per_minute:.2f} images/min")
+        results.append(profile)
+    if not results:
+        log("No configuration could be measured; nothing saved")
+        return
+    interactive = max((p for p in results if p.workers == 1), key=lambda p: p.images_per_minute, default=None)
+    batch = max(results, key=lambda p: p.images_per_minute)
+    save_profiles(interactive, batch)
+    if interactive is None:
+        log("No single-process configuration could be measured; keeping torch defaults for interactive use")
+    else:
+        log(f"Interactive profile: {interactive.describe()}")
+    log(f"Batch profile: {batch.describe()}")
+    log(f"Saved to {support_path(PROFILE_FILE)}")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    ap = argparse.ArgumentParser(prog="cartoonizer.py tune", description="Benchmark and save CPU thread settings.")
+    ap.add_argument("--model", default="Lykon/dreamshaper-8", help="Model to benchmark with.")
+    ap.add_argument("--side", type=int, default=384, help="Benchmark image size in pixels.")
+    ap.add_argument("--steps", type=int, default=4, help="Denoising steps per benchmark image.")
+    ap.add_argument("--repeats", type=int, default=2, help="Timed images per configuration and worker.")
+    args = ap.parse_args(argv)
+    tune(args.model, side=args.side, steps=args.steps, repeats=args.repeats)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench-worker":
+        ap = argparse.ArgumentParser()
+        ap.add_argument("--model", required=True)
+        ap.add_argument("--threads", type=int, required=True)
+        ap.add_argument("--interop", type=int, required=True)
+        ap.add_argument("--cpus", type=lambda s: [int(c) for c in s.split(",")], default=None)
+        ap.add_argument("--side", type=int, default=384)
+        ap.add_argument("--steps", type=int, default=4)
+        ap.add_argument("--repeats", type=int, default=2)
+        _bench_worker(ap.parse_args(sys.argv[2:]))
+    else:
+        main()
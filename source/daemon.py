@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Persistent daemon and thin client for the Cartoonizer CLI.
+`cartoonizer.py --daemon` loads the pipeline once and serves jobs on a Unix
+domain socket in the support folder. `python3 daemon.py --input IN
+[--output OUT] [other cartoonizer.py options]` forwards one job there and
+prints the progress the daemon streams back. This module only uses the
+standard library, so the client starts instantly; the torch side lives in
+cartoonizer.py and is passed to DaemonServer as the job handler.
+
+Wire format: one JSON object per line. The client sends {"argv", "cwd"};
+the daemon answers with {"event": "log"|"progress", ...} lines and ends with
+{"event": "done", "output"} or {"event": "error", "message"}.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+from typing import Callable, Dict, Iterator, Optional, Sequence
+
+from app_paths import APP_SUPPORT_DIR
+from logs import log
+
+SOCKET_PATH = str(APP_SUPPORT_DIR / "daemon.sock")
+
+Emit = Callable[[Dict], None]
+
+
+def send(conn: socket.socket, message: Dict) -> None:
+    conn.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+def messages(conn: socket.socket) -> Iterator[Dict]:
+    """Messages received on conn until the peer closes it."""
+    with conn.makefile("r", encoding="utf-8") as stream:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+# ---------------------------
+# Daemon
+# ---------------------------
+
+class DaemonServer:
+    """
+    Accept clients on socket_path, one thread each. handle(request, emit)
+    runs the job (serializing jobs is up to the handler), reports through
+    emit and returns the output path; exceptions become an error reply.
+    A client that goes away does not cancel its job.
+    """
+
+    def __init__(self, handle: Callable[[Dict, Emit], str], socket_path: str = SOCKET_PATH):
+        self.handle = handle
+        self.socket_path = socket_path
+        self._sock: Optional[socket.socket] = None
+
+    def _bind(self) -> socket.socket:
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.socket_path)  # left over from a daemon that died
+            finally:
+                probe.close()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)  # only this user may submit jobs
+        try:
+            sock.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        sock.listen()
+        return sock
+
+    def _serve(self, conn: socket.socket) -> None:
+        connected = True
+
+        def emit(message: Dict) -> None:
+            nonlocal connected
+            if connected:
+                try:
+                    send(conn, message)
+                except OSError:
+                    connected = False
+
+        with conn:
+            try:
+                request = next(messages(conn))
+            except (StopIteration, OSError, ValueError):
+                return
+            try:
+                emit({"event": "done", "output": self.handle(request, emit)})
+            except Exception as exc:
+                emit({"event": "error", "message": str(exc) or type(exc).__name__})
+
+    def serve_forever(self) -> None:
+        self._sock = self._bind()
+        log(f"Daemon listening on {self.socket_path}")
+        try:
+            while True:
+                conn, _ = self._sock.accept()
+                threading.Thread(target=self._serve, args=(conn,), name="daemon-client", daemon=True).start()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+
+# ---------------------------
+# Client
+# ---------------------------
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Send a job to a running 'cartoonizer.py --daemon'. Every other option "
+        "(--input, --output, --style, ...) is passed on as for cartoonizer.py.",
+    )
+    ap.add_argument("--socket", default=SOCKET_PATH, help="Daemon socket path.")
+    args, job_argv = ap.parse_known_args(argv)
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(args.socket)
+    except (ConnectionRefusedError, FileNotFoundError):
+        print(f"[!] No daemon on {args.socket}; start one with: python3 cartoonizer.py --daemon", file=sys.stderr)
+        return 2
+    interactive = sys.stderr.isatty()
+    with conn:
+        send(conn, {"argv": job_argv, "cwd": os.getcwd()})
+        for message in messages(conn):
+            event = message.get("event")
+            if event == "progress":
+                if interactive:
+                    print(f"\r[i] Step {message['step']}/{message['steps']}", end="", file=sys.stderr, flush=True)
+                    if message["step"] == message["steps"]:
+                        print(file=sys.stderr)
+            elif event == "log":
+                print(f"[i] {message['message']}", flush=True)
+            elif event == "done":
+                print(f"[+] {message['output']}", flush=True)
+                return 0
+            elif event == "error":
+                print(f"[!] {message['message']}", file=sys.stderr)
+                return 1
+    print("[!] The daemon closed the connection before the job finished", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Cross-step UNet feature caching (DeepCache-style) for Cartoonizer.
+The deep part of the UNet changes little from one denoising step to the
+next. With an interval N, every Nth step runs the full network and keeps the
+input of the last up block; the steps in between run only the shallow branch
+(conv_in, the first down block, the last up block and conv_out) on top of
+that cached feature. The pipeline is patched once; the interval is per
+request, so it can change between jobs without reloading the model.
+"""
+from typing import List, Optional
+
+import torch
+
+from logs import log
+
+MAX_INTERVAL = 10
+
+
+class CacheState:
+    """Per-pipeline cache settings, the cached feature and step counters."""
+
+    def __init__(self):
+        self.interval = 1
+        self.feature: Optional[torch.Tensor] = None
+        self.step = 0
+        self.last_timestep: Optional[float] = None
+        self.full_steps = 0
+        self.cached_steps = 0
+
+    def reset(self) -> None:
+        self.feature = None
+        self.step = 0
+        self.last_timestep = None
+
+    def describe(self) -> str:
+        total = self.full_steps + self.cached_steps
+        if self.interval <= 1 or not total:
+            return "feature cache off"
+        return f"feature cache: {self.cached_steps} of {total} UNet passes reused deep features"
+
+
+def _down_outputs(block) -> int:
+    """Number of skip connections a down block contributes."""
+    return len(block.resnets) + len(getattr(block, "downsamplers", None) or ())
+
+
+def _skip_down(count: int):
+    def forward(hidden_states, *args, **kwargs):
+        return hidden_states, (hidden_states,) * count
+
+    return forward
+
+
+def _skip_mid(sample, *args, **kwargs):
+    return sample
+
+
+def _skip_up(hidden_states, *args, **kwargs):
+    return hidden_states
+
+
+class _DeepBranch:
+    """Swaps the deep blocks' forward for pass-throughs on cached steps."""
+
+    def __init__(self, unet):
+        self.deep_down = list(unet.down_blocks)[1:]
+        self.mid = unet.mid_block
+        self.deep_up = list(unet.up_blocks)[:-1]
+        self.skipping = False
+
+    def _modules(self) -> List[torch.nn.Module]:
+        return self.deep_down + [m for m in (self.mid,) if m is not None] + self.deep_up
+
+    def skip(self, feature: torch.Tensor) -> None:
+        for block in self.deep_down:
+            block.forward = _skip_down(_down_outputs(block))
+        if self.mid is not None:
+            self.mid.forward = _skip_mid
+        for block in self.deep_up[:-1]:
+            block.forward = _skip_up
+        # The last deep up block hands the cached feature to the shallow one.
+        self.deep_up[-1].forward = lambda *args, **kwargs: feature
+        self.skipping = True
+
+    def restore(self) -> None:
+        if not self.skipping:
+            return
+        for module in self._modules():
+            module.__dict__.pop("forward", None)
+        self.skipping = False
+
+
+def _install(pipe) -> CacheState:
+    state = getattr(pipe, "_feature_cache", None)
+    if state is not None:
+        return state
+    unet = pipe.unet
+    state = CacheState()
+    branch = _DeepBranch(unet)
+
+    def before_unet(module, args):
+        branch.restore()
+        if state.interval <= 1 or len(args) < 2:
+            return
+        sample, timestep = args[0], args[1]
+        t = float(timestep.flatten()[0]) if torch.is_tensor(timestep) else float(timestep)
+        # Timesteps fall within a run, so a rise (or repeat) means a new run.
+        if state.last_timestep is None or t >= state.last_timestep:
+            state.reset()
+        state.last_timestep = t
+        feature = state.feature
+        usable = feature is not None and feature.shape[0] == sample.shape[0]
+        if usable and state.step % state.interval != 0:
+            branch.skip(feature)
+            state.cached_steps += 1
+        else:
+            state.full_steps += 1
+        state.step += 1
+
+    def after_last_deep_up(module, args, output):
+        if state.interval > 1 and not branch.skipping:
+            state.feature = output
+
+    def after_unet(module, args, output):
+        branch.restore()
+
+    unet.register_forward_pre_hook(before_unet)
+    unet.up_blocks[-2].register_forward_hook(after_last_deep_up)
+    unet.register_forward_hook(after_unet)
+    pipe._feature_cache = state
+    return state
+
+
+def set_feature_cache(pipe, interval: int) -> Optional[CacheState]:
+    """
+    Run the full UNet only every interval steps of the pipeline's following
+    runs (1 or 0 = every step, i.e. off). Cheap; call it before every request.
+    Returns the state, whose counters say how many passes were reused.
+    """
+    if not 0 <= interval <= MAX_INTERVAL:
+        raise ValueError(f"feature cache interval must be between 0 and {MAX_INTERVAL}, got {interval}")
+    if interval <= 1 and getattr(pipe, "_feature_cache", None) is None:
+        return None
+    state = _install(pipe)
+    if max(interval, 1) != state.interval:
+        log(f"Feature cache: full UNet every {interval} steps" if interval > 1 else "Feature cache off")
+    state.interval = max(interval, 1)
+    state.reset()
+    state.full_steps = state.cached_steps = 0
+    return state
@@ -0,0 +1,97 @@
+"""
+Array input/output for Cartoonizer's library API (cartoonize_frames).
+Frames that are already decoded never go through PIL: NumPy arrays are
+wrapped with torch.from_numpy (no copy) and permuted as views, frames move
+to the device as uint8 (a quarter of the bytes of float) and are converted
+and resized there, and results are quantized to uint8 on the device and
+copied straight into the returned array.
+"""
+from typing import List, Sequence, Union
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from memory_governor import scaled_size
+
+Frame = Union[np.ndarray, torch.Tensor]
+Frames = Union[Frame, Sequence[Frame]]
+OUTPUTS = ("numpy", "tensor", "latent")
+
+
+def as_nchw(frame: Frame) -> torch.Tensor:
+    """
+    View of a frame or stack as an Nx3xHxW tensor (no copy). NumPy input is
+    uint8 HxWx3 or NxHxWx3; tensors are 3xHxW or Nx3xHxW, uint8 or float in [0, 1].
+    """
+    if isinstance(frame, np.ndarray):
+        if frame.dtype != np.uint8:
+            raise ValueError(f"NumPy frames must be uint8, got {frame.dtype}")
+        tensor = torch.from_numpy(frame)
+        tensor = tensor.unsqueeze(0) if tensor.ndim == 3 else tensor
+        if tensor.ndim != 4 or tensor.shape[-1] != 3:
+            raise ValueError(f"NumPy frames must be HxWx3 or NxHxWx3, got {tuple(frame.shape)}")
+        return tensor.permute(0, 3, 1, 2)
+    if isinstance(frame, torch.Tensor):
+        tensor = frame.unsqueeze(0) if frame.ndim == 3 else frame
+        if tensor.ndim != 4 or tensor.shape[1] != 3:
+            raise ValueError(f"Tensor frames must be 3xHxW or Nx3xHxW, got {tuple(frame.shape)}")
+        return tensor
+    raise TypeError(f"Expected a NumPy array or torch tensor, got {type(frame).__name__}")
+
+
+def group_by_size(frames: Frames) -> List[List[torch.Tensor]]:
+    """
+    Split frames into runs of consecutive same-size Nx3xHxW views, so each
+    run can be batched. A single array or tensor is one run.
+    """
+    items = [frames] if isinstance(frames, (np.ndarray, torch.Tensor)) else list(frames)
+    groups: List[List[torch.Tensor]] = []
+    for item in items:
+        tensor = as_nchw(item)
+        if groups and groups[-1][0].shape[-2:] == tensor.shape[-2:]:
+            groups[-1].append(tensor)
+        else:
+            groups.append([tensor])
+    return groups
+
+
+def take(group: Sequence[torch.Tensor], start: int, stop: int) -> List[torch.Tensor]:
+    """Views of frames start..stop (over the whole run) of a group."""
+    views, offset = [], 0
+    for tensor in group:
+        n = tensor.shape[0]
+        lo, hi = max(start - offset, 0), min(stop - offset, n)
+        if lo < hi:
+            views.append(tensor[lo:hi])
+        offset += n
+    return views
+
+
+def working_size(width: int, height: int, max_side: int, multiple: int = 8):
+    """Size after fitting max_side, rounded down to the VAE's multiple."""
+    width, height = scaled_size(width, height, max_side)
+    return max(multiple, width // multiple * multiple), max(multiple, height // multiple * multiple)
+
+
+def to_pipeline_input(views: Sequence[torch.Tensor], device, dtype: torch.dtype, max_side: int) -> torch.Tensor:
+    """
+    Same-size frames as one float Nx3xHxW batch in [0, 1] on device, fitted
+    to max_side (area-averaged on the device).
+    """
+    batch = torch.cat([v.to(device) for v in views]) if len(views) > 1 else views[0].to(device)
+    if batch.is_floating_point():
+        batch = batch.to(dtype)
+    else:
+        batch = batch.to(dtype).div_(255)
+    height, width = batch.shape[-2:]
+    new_width, new_height = working_size(width, height, max_side)
+    if (new_width, new_height) != (width, height):
+        batch = F.interpolate(batch, size=(new_height, new_width), mode="area")
+    return batch
+
+
+def copy_to_uint8(images: torch.Tensor, out: np.ndarray) -> None:
+    """Quantize float Nx3xHxW images in [0, 1] on their device and copy them into out (NxHxWx3 uint8)."""
+    quantized = images.mul(255).round_().clamp_(0, 255).to(torch.uint8).permute(0, 2, 3, 1)
+    torch.from_numpy(out).copy_(quantized)
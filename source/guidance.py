@@ -0,0 +1,57 @@
+"""
+Classifier-free guidance schedule for Cartoonizer.
+With guidance every step runs the UNet on a conditional and an
+unconditional batch. Late steps only refine detail and barely respond to
+guidance, so CFG can stop after the first part of the run: from then on the
+pipeline's step callback drops the unconditional prompt embeddings and the
+remaining steps run a single conditional pass. (With guidance_scale <= 1 the
+pipeline skips the unconditional pass on every step by itself.)
+"""
+import math
+from typing import Callable, Dict, Optional
+
+StepCallback = Callable[[object, int, object, Dict], Dict]
+
+
+def describe_guidance(guidance_scale: float, cfg_cutoff: float) -> str:
+    if guidance_scale <= 1.0:
+        return f"guidance {guidance_scale:g}: conditional pass only"
+    if cfg_cutoff >= 1.0:
+        return f"guidance {guidance_scale:g} on every step"
+    return f"guidance {guidance_scale:g} for the first {cfg_cutoff:.0%} of steps, then conditional only"
+
+
+class GuidanceCutoff:
+    """
+    callback_on_step_end that turns CFG off once cutoff (0-1] of the run's
+    steps are done. then: another step callback (e.g. cancellation) run first.
+    """
+
+    tensor_inputs = ["latents", "prompt_embeds"]
+
+    def __init__(self, cutoff: float, then: Optional[StepCallback] = None):
+        self.cutoff = cutoff
+        self.then = then
+
+    def __call__(self, pipe, step: int, timestep, callback_kwargs: Dict) -> Dict:
+        if self.then is not None:
+            callback_kwargs = self.then(pipe, step, timestep, callback_kwargs)
+        last_guided = max(1, math.ceil(self.cutoff * pipe.num_timesteps))
+        if step + 1 == last_guided and pipe.do_classifier_free_guidance:
+            # prompt_embeds is [negative, positive]; keep the positive half.
+            callback_kwargs["prompt_embeds"] = callback_kwargs["prompt_embeds"].chunk(2)[1]
+            pipe._guidance_scale = 1.0
+        return callback_kwargs
+
+
+def guidance_kwargs(cfg_cutoff: float = 1.0, callback: Optional[StepCallback] = None) -> Dict:
+    """
+    Pipeline keyword arguments for a CFG cutoff (1.0 = guidance on every
+    step), chained after callback when one is given.
+    """
+    if cfg_cutoff >= 1.0:
+        return {"callback_on_step_end": callback} if callback is not None else {}
+    return {
+        "callback_on_step_end": GuidanceCutoff(cfg_cutoff, callback),
+        "callback_on_step_end_tensor_inputs": GuidanceCutoff.tensor_inputs,
+    }
@@ -0,0 +1,185 @@
+"""
+Two-pass "hires" generation for Cartoonizer.
+The full stylization runs at a base resolution (512–768 px), the result is
+upscaled to the target size with LANCZOS, and a short low-strength img2img
+pass puts back detail. The refinement runs on the whole frame when it fits in
+memory and in overlapping, feathered tiles when it does not.
+"""
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+
+from logs import log
+from memory_governor import MemoryGovernor
+
+# Stable Diffusion works on 8x downsampled latents.
+LATENT_FACTOR = 8
+
+
+@dataclass
+class HiresOptions:
+    """
+    target_side: largest side of the final image.
+    base_side: largest side of the full-strength first pass.
+    strength / steps: refinement strength and the number of denoising steps
+    it actually runs (img2img only runs strength * num_inference_steps).
+    tile_size: refine in tiles of this side; 0 tiles only when the memory
+    governor says the full frame does not fit.
+    """
+
+    target_side: int = 2048
+    base_side: int = 768
+    strength: float = 0.3
+    steps: int = 8
+    tile_size: int = 0
+    tile_overlap: int = 96
+
+    @property
+    def inference_steps(self) -> int:
+        """num_inference_steps to request so the refinement runs `steps` steps."""
+        return max(self.steps, math.ceil(self.steps / max(self.strength, 1e-3)))
+
+    def describe(self) -> str:
+        tiles = f"{self.tile_size}px tiles" if self.tile_size else "auto tiling"
+        return (
+            f"base {self.base_side}px -> {self.target_side}px, "
+            f"refine strength {self.strength:.2f} x {self.steps} steps, {tiles}"
+        )
+
+
+def _snap(value: int) -> int:
+    return max(LATENT_FACTOR, int(value) // LATENT_FACTOR * LATENT_FACTOR)
+
+
+def upscale(img: Image.Image, target_side: int) -> Image.Image:
+    """LANCZOS-resize img so its largest side is target_side, in multiples of 8."""
+    scale = target_side / max(img.size)
+    size = (_snap(round(img.width * scale)), _snap(round(img.height * scale)))
+    if size == img.size:
+        return img
+    return img.resize(size, Image.LANCZOS)
+
+
+def _axis_starts(length: int, tile: int, overlap: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    span = length - tile
+    starts = {round(i * span / (count - 1)) // LATENT_FACTOR * LATENT_FACTOR for i in range(count - 1)}
+    return sorted(starts | {span})
+
+
+def tile_boxes(width: int, height: int, tile: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    """(left, top, right, bottom) tiles covering the image, overlapping by about overlap."""
+    tile = _snap(tile)
+    overlap = min(_snap(overlap), tile // 2)
+    return [
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in _axis_starts(height, tile, overlap)
+        for x in _axis_starts(width, tile, overlap)
+    ]
+
+
+def _feather(box: Tuple[int, int, int, int], width: int, height: int, overlap: int) -> np.ndarray:
+    """Blend weights for one tile: linear ramps on edges shared with other tiles."""
+    left, top, right, bottom = box
+
+    def ramp(n: int, fade_start: bool, fade_end: bool) -> np.ndarray:
+        w = np.ones(n, dtype=np.float32)
+        k = min(overlap, n // 2)
+        if k > 0:
+            edge = (np.arange(k, dtype=np.float32) + 1) / (k + 1)
+            if fade_start:
+                w[:k] = edge
+            if fade_end:
+                w[-k:] = edge[::-1]
+        return w
+
+    wx = ramp(right - left, left > 0, right < width)
+    wy = ramp(bottom - top, top > 0, bottom < height)
+    return (wy[:, None] * wx[None, :])[..., None]
+
+
+def refine(
+    pipe,
+    image: Image.Image,
+    prompt: str,
+    negative_prompt: str,
+    options: HiresOptions,
+    guidance_scale: float = 7.5,
+    seed: Optional[int] = None,
+    tile_size: Optional[int] = None,
+    pipe_kwargs: Optional[Dict] = None,
+) -> Image.Image:
+    """
+    Low-strength img2img over image. tile_size=None refines the whole frame;
+    otherwise overlapping tiles are refined one by one and feather-blended.
+    pipe_kwargs: extra pipeline arguments (e.g. callback_on_step_end).
+    """
+
+    def run(crop: Image.Image) -> Image.Image:
+        generator = None
+        if seed is not None:
+            generator = torch.Generator(device=pipe.device).manual_seed(seed)
+        out = pipe(
+            prompt=prompt,
+            image=crop,
+            strength=options.strength,
+            guidance_scale=guidance_scale,
+            negative_prompt=negative_prompt,
+            num_inference_steps=options.inference_steps,
+            generator=generator,
+            **(pipe_kwargs or {}),
+        ).images[0]
+        # The pipeline rounds sizes down to multiples of 8.
+        return out if out.size == crop.size else out.resize(crop.size, Image.LANCZOS)
+
+    width, height = image.size
+    if tile_size is None or tile_size >= max(width, height):
+        return run(image)
+
+    boxes = tile_boxes(width, height, tile_size, options.tile_overlap)
+    log(f"Hires: refining {width}x{height} in {len(boxes)} tiles of up to {_snap(tile_size)}px")
+    acc = np.zeros((height, width, 3), dtype=np.float32)
+    weight = np.zeros((height, width, 1), dtype=np.float32)
+    for box in boxes:
+        left, top, right, bottom = box
+        w = _feather(box, width, height, options.tile_overlap)
+        acc[top:bottom, left:right] += np.asarray(run(image.crop(box)), dtype=np.float32) * w
+        weight[top:bottom, left:right] += w
+    return Image.fromarray(np.clip(acc / weight + 0.5, 0, 255).astype(np.uint8))
+
+
+def run_refine(
+    pipe,
+    governor: MemoryGovernor,
+    base: Image.Image,
+    prompt: str,
+    negative_prompt: str,
+    options: HiresOptions,
+    guidance_scale: float = 7.5,
+    seed: Optional[int] = None,
+    pipe_kwargs: Optional[Dict] = None,
+) -> Image.Image:
+    """
+    Upscale the first-pass result and refine it under the memory governor.
+    The output always keeps the target size: when the governor lowers the
+    plan's max_side (up front or after an OOM) the refinement is tiled at
+    that side instead of shrinking the image.
+    """
+    image = upscale(base, options.target_side)
+    full_side = max(image.size)
+    plan = governor.plan(image.width, image.height, full_side)
+
+    def job(plan):
+        tile = options.tile_size or None
+        if plan.max_side < full_side:
+            tile = min(tile or plan.max_side, plan.max_side)
+        return refine(pipe, image, prompt, negative_prompt, options, guidance_scale, seed, tile, pipe_kwargs)
+
+    log(f"Hires: {base.width}x{base.height} -> {image.width}x{image.height} ({options.describe()})")
+    return governor.run(pipe, plan, job)
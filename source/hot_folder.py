@@ -0,0 +1,315 @@
+"""
+Hot-folder watching for Cartoonizer (--watch).
+A background thread waits for changes in the input folder (inotify on
+Linux, kqueue on macOS/BSD, polling elsewhere), waits until new files have
+stopped changing, and queues them for the resident pipeline. Event-driven
+backends still rescan now and then, so files on network shares that do not
+deliver events are picked up too.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from logs import log
+
+Signature = Tuple[int, int]  # (size, mtime_ns)
+
+
+# ---------------------------
+# Change notification backends
+# ---------------------------
+
+class PollingEvents:
+    """Fallback: report a (possible) change every interval seconds."""
+
+    name = "polling"
+
+    def __init__(self, interval: float = 2.0):
+        self.interval = interval
+        self._wake = threading.Event()
+
+    def add_dirs(self, paths: Iterable[str]) -> None:
+        pass
+
+    def wait(self, timeout: float) -> bool:
+        self._wake.wait(min(timeout, self.interval))
+        return True
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def close(self) -> None:
+        pass
+
+
+class _PipeWake:
+    """Self-pipe so stop() can interrupt a blocking wait."""
+
+    def _open_wake_pipe(self) -> None:
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+
+    def wake(self) -> None:
+        try:
+            os.write(self._wake_w, b"x")
+        except OSError:
+            pass
+
+    def _close_wake_pipe(self) -> None:
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+
+class InotifyEvents(_PipeWake):
+    """Linux inotify through libc; one watch per directory."""
+
+    name = "inotify"
+    MASK = 0x8 | 0x40 | 0x80 | 0x100 | 0x200  # CLOSE_WRITE, MOVED_FROM/TO, CREATE, DELETE
+    IN_ISDIR = 0x40000000
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._libc = libc
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, str] = {}
+        self._watched = set()
+        self._open_wake_pipe()
+
+    def add_dirs(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            if path in self._watched:
+                continue
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.MASK)
+            if wd >= 0:
+                self._dirs[wd] = path
+                self._watched.add(path)
+
+    def wait(self, timeout: float) -> bool:
+        ready, _, _ = select.select([self._fd, self._wake_r], [], [], timeout)
+        if self._fd not in ready:
+            return False
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+        new_dirs = []
+        offset = 0
+        while offset + self.EVENT.size <= len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b"\0")
+            offset += self.EVENT.size + length
+            if mask & self.IN_ISDIR and wd in self._dirs and name:
+                new_dirs.append(os.path.join(self._dirs[wd], os.fsdecode(name)))
+        self.add_dirs(new_dirs)
+        return True
+
+    def close(self) -> None:
+        os.close(self._fd)
+        self._close_wake_pipe()
+
+
+class KqueueEvents(_PipeWake):
+    """macOS/BSD kqueue: a directory's vnode fires NOTE_WRITE when entries change."""
+
+    name = "kqueue"
+
+    def __init__(self):
+        self._kq = select.kqueue()
+        self._fds: Dict[str, int] = {}
+        self._open_wake_pipe()
+        self._kq.control([select.kevent(self._wake_r, filter=select.KQ_FILTER_READ, flags=select.KQ_EV_ADD)], 0, 0)
+
+    def add_dirs(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            if path in self._fds:
+                continue
+            try:
+                fd = os.open(path, getattr(os, "O_EVTONLY", os.O_RDONLY))
+            except OSError:
+                continue
+            self._fds[path] = fd
+            event = select.kevent(
+                fd,
+                filter=select.KQ_FILTER_VNODE,
+                flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                fflags=select.KQ_NOTE_WRITE | select.KQ_NOTE_EXTEND | select.KQ_NOTE_RENAME | select.KQ_NOTE_DELETE,
+            )
+            self._kq.control([event], 0, 0)
+
+    def wait(self, timeout: float) -> bool:
+        events = self._kq.control(None, 64, timeout)
+        return any(event.ident != self._wake_r for event in events)
+
+    def close(self) -> None:
+        for fd in self._fds.values():
+            os.close(fd)
+        self._kq.close()
+        self._close_wake_pipe()
+
+
+def open_events(poll_interval: float = 2.0, polling: bool = False):
+    """Best available change notification for this platform."""
+    if not polling:
+        for backend in (InotifyEvents, KqueueEvents):
+            try:
+                if backend is KqueueEvents and not hasattr(select, "kqueue"):
+                    continue
+                return backend()
+            except (OSError, AttributeError):
+                continue
+    return PollingEvents(poll_interval)
+
+
+# ---------------------------
+# Hot folder
+# ---------------------------
+
+class ThroughputMeter:
+    """Images per minute, overall and over a sliding window."""
+
+    def __init__(self, window: float = 600.0):
+        self.window = window
+        self.started = time.monotonic()
+        self.count = 0
+        self._recent = deque()
+
+    def tick(self) -> None:
+        now = time.monotonic()
+        self.count += 1
+        self._recent.append(now)
+        while self._recent and now - self._recent[0] > self.window:
+            self._recent.popleft()
+
+    def describe(self) -> str:
+        now = time.monotonic()
+        overall = self.count / max(now - self.started, 1e-9) * 60
+        span = min(self.window, now - self.started)
+        recent = len(self._recent) / max(span, 1e-9) * 60
+        return (
+            f"{self.count} done, {recent:.1f}/min over the last {self.window / 60:g} min, "
+            f"{overall:.1f}/min overall"
+        )
+
+
+class HotFolder:
+    """
+    Watch in_dir and put relative paths of new, fully written files on queue.
+    scan: returns the candidate relative paths (the batch mode's filter).
+    settle: seconds a file's size and mtime must stay unchanged before it is
+    considered completely written.
+    skip: rel_path -> True for files already handled (e.g. output is newer).
+    ignore_dirs: absolute directories not to watch (such as the output folder).
+    """
+
+    def __init__(
+        self,
+        in_dir: str,
+        scan: Callable[[], Iterable[str]],
+        recursive: bool = False,
+        settle: float = 2.0,
+        poll_interval: float = 2.0,
+        rescan_interval: float = 60.0,
+        polling: bool = False,
+        skip: Optional[Callable[[str], bool]] = None,
+        ignore_dirs: Sequence[str] = (),
+    ):
+        self.in_dir = os.path.abspath(in_dir)
+        self.scan = scan
+        self.recursive = recursive
+        self.settle = settle
+        self.rescan_interval = rescan_interval
+        self.skip = skip
+        self.ignore_dirs = {os.path.abspath(d) for d in ignore_dirs}
+        self.queue: "queue.Queue[str]" = queue.Queue()
+        self.events = open_events(poll_interval, polling)
+        # rel_path -> (signature, when it was first seen with that signature)
+        self._pending: Dict[str, Tuple[Signature, float]] = {}
+        self._handled: Dict[str, Signature] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _signature(self, rel_path: str) -> Optional[Signature]:
+        try:
+            st = os.stat(os.path.join(self.in_dir, *rel_path.split("/")))
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _dirs(self) -> Iterable[str]:
+        yield self.in_dir
+        if not self.recursive:
+            return
+        for root, dirs, _ in os.walk(self.in_dir):
+            dirs[:] = [d for d in dirs if os.path.join(root, d) not in self.ignore_dirs]
+            for d in dirs:
+                yield os.path.join(root, d)
+
+    def _check(self, rel_path: str, now: float) -> None:
+        sig = self._signature(rel_path)
+        if sig is None or self._handled.get(rel_path) == sig:
+            self._pending.pop(rel_path, None)
+            return
+        seen_sig, since = self._pending.get(rel_path, (None, now))
+        if seen_sig != sig:
+            self._pending[rel_path] = (sig, now)
+            return
+        if now - since < self.settle:
+            return
+        del self._pending[rel_path]
+        self._handled[rel_path] = sig
+        self.queue.put(rel_path)
+        log(f"[watch] queued {rel_path} (queue depth {self.queue.qsize()})")
+
+    def _scan_all(self, first: bool = False) -> None:
+        self.events.add_dirs(self._dirs())
+        now = time.monotonic()
+        for rel_path in self.scan():
+            if first and self.skip is not None and self.skip(rel_path):
+                self._handled[rel_path] = self._signature(rel_path)
+            else:
+                self._check(rel_path, now)
+
+    def _recheck_pending(self) -> None:
+        now = time.monotonic()
+        for rel_path in list(self._pending):
+            self._check(rel_path, now)
+
+    def _run(self) -> None:
+        self._scan_all(first=True)
+        last_scan = time.monotonic()
+        while not self._stop.is_set():
+            # While files are settling, wake up to re-check them even without events.
+            timeout = self.settle if self._pending else self.rescan_interval
+            changed = self.events.wait(timeout)
+            if self._stop.is_set():
+                break
+            if changed or time.monotonic() - last_scan >= self.rescan_interval:
+                self._scan_all()
+                last_scan = time.monotonic()
+            else:
+                self._recheck_pending()
+
+    def start(self) -> None:
+        log(f"[watch] watching {self.in_dir} ({self.events.name}, settle {self.settle:g}s)")
+        self._thread = threading.Thread(target=self._run, name="hot-folder", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.events.wake()
+        if self._thread is not None:
+            self._thread.join()
+        self.events.close()
@@ -0,0 +1,106 @@
+"""
+Idle model unloading for the Cartoonizer GUI.
+A background thread frees the resident pipeline once nobody has used it for
+a configurable time, so a GUI left open on a shared machine gives its RAM and
+VRAM back. Weights are safetensors loaded through mmap, so the next request
+reloads them mostly from the OS page cache; the status panel then reports
+how much memory was reclaimed and how long the reload took.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from logs import log
+from memory_governor import device_free_bytes, process_rss_bytes, release_cached_memory
+
+GiB = 1024 ** 3
+
+
+@dataclass
+class UnloadReport:
+    """What one unload gave back; byte counts are None where unknown."""
+
+    idle_seconds: float
+    rss_freed: Optional[int]
+    device_freed: Optional[int]
+    reload_seconds: Optional[float] = None
+
+    def describe(self) -> str:
+        freed = []
+        if self.rss_freed is not None:
+            freed.append(f"{max(self.rss_freed, 0) / GiB:.2f} GB RAM")
+        if self.device_freed is not None:
+            freed.append(f"{max(self.device_freed, 0) / GiB:.2f} GB device memory")
+        text = f"Model was unloaded after {self.idle_seconds / 60:.0f} min idle"
+        if freed:
+            text += f" (reclaimed {', '.join(freed)})"
+        if self.reload_seconds is not None:
+            text += f"; reloaded in {self.reload_seconds:.1f} s"
+        return text
+
+
+class IdleUnloader:
+    """
+    Call unload() under lock once the model has been idle for timeout seconds.
+    unload: drops every reference to the pipeline; returns False if nothing
+    was loaded. lock: the pipeline lock jobs hold, so a running job is never
+    unloaded. touch() marks activity; take_report() hands the last unload's
+    report to the next request (once).
+    """
+
+    def __init__(self, timeout: float, unload: Callable[[], bool], lock: threading.Lock, device: str):
+        self.timeout = timeout
+        self.unload = unload
+        self.lock = lock
+        self.device = device
+        self._last_used = time.monotonic()
+        self._report: Optional[UnloadReport] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def touch(self) -> None:
+        self._last_used = time.monotonic()
+
+    def take_report(self) -> Optional[UnloadReport]:
+        report, self._report = self._report, None
+        return report
+
+    def _unload_now(self, idle: float) -> None:
+        rss_before = process_rss_bytes()
+        device_before = device_free_bytes(self.device) if self.device != "cpu" else None
+        if not self.unload():
+            return
+        release_cached_memory()
+        rss_after = process_rss_bytes()
+        device_after = device_free_bytes(self.device) if self.device != "cpu" else None
+        self._report = UnloadReport(
+            idle_seconds=idle,
+            rss_freed=rss_before - rss_after if rss_before is not None and rss_after is not None else None,
+            device_freed=device_after - device_before if device_before is not None and device_after is not None else None,
+        )
+        log(self._report.describe())
+
+    def _run(self) -> None:
+        interval = min(60.0, max(1.0, self.timeout / 4))
+        while not self._stop.wait(interval):
+            idle = time.monotonic() - self._last_used
+            if idle < self.timeout or not self.lock.acquire(blocking=False):
+                continue
+            try:
+                # Re-check under the lock: a job may have finished meanwhile.
+                idle = time.monotonic() - self._last_used
+                if idle >= self.timeout:
+                    self._unload_now(idle)
+            finally:
+                self.lock.release()
+
+    def start(self) -> None:
+        log(f"Unloading the model after {self.timeout / 60:g} min without requests")
+        self._thread = threading.Thread(target=self._run, name="idle-unload", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
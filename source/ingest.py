@@ -0,0 +1,65 @@
+"""
+Image ingest for Cartoonizer.
+Decodes inputs close to the working resolution instead of at native size.
+"""
+import os
+
+from PIL import ExifTags, Image, ImageOps
+
+MAX_IMAGE_SIDE = int(os.environ.get("CARTOONIZER_MAX_SIDE", "768"))
+
+
+def fit_to_max_side(img: Image.Image, max_side: int) -> Image.Image:
+    """
+    Downscale img so its largest side is at most max_side.
+    Large reductions first shrink by an integer box filter (reducing_gap)
+    before the final LANCZOS pass, which is much cheaper than a full LANCZOS.
+    """
+    w, h = img.size
+    scale = min(max_side / max(w, h), 1.0)
+    if scale < 1.0:
+        img = img.resize((int(w * scale), int(h * scale)), Image.LANCZOS, reducing_gap=3.0)
+    return img
+
+
+def image_size(path: str):
+    """
+    Width and height from the file header, without decoding pixels, as
+    prepare_image() returns them: EXIF orientations 5-8 (rotated by 90
+    degrees) swap the two.
+    """
+    with Image.open(path) as img:
+        w, h = img.size
+        if img.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8):
+            return h, w
+        return w, h
+
+
+def prepare_image(path: str, max_side: int = MAX_IMAGE_SIDE, fast: bool = True) -> Image.Image:
+    """
+    Load an image and resize while keeping aspect ratio so that
+    the largest side is at most max_side.
+    With fast=True, JPEGs are decoded directly at a reduced DCT scale
+    (1/2, 1/4 or 1/8) close to the target size, so a 24 MP photo never
+    materializes at full resolution, and EXIF orientation is applied.
+    fast=False keeps the original full-resolution decode for comparison.
+    """
+    if not fast:
+        img = Image.open(path).convert("RGB")
+        w, h = img.size
+        scale = min(max_side / max(w, h), 1.0)
+        if scale < 1.0:
+            img = img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+        return img
+
+    img = Image.open(path)
+    w, h = img.size
+    scale = min(max_side / max(w, h), 1.0)
+    if scale < 1.0 and img.format == "JPEG":
+        # draft() keeps the decoded size >= the requested size, so the
+        # LANCZOS pass below still only ever downsamples.
+        img.draft("RGB", (max(1, int(w * scale)), max(1, int(h * scale))))
+    ImageOps.exif_transpose(img, in_place=True)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return fit_to_max_side(img, max_side)
@@ -0,0 +1,129 @@
+"""
+Cancellation of in-flight GUI jobs.
+Each Generate click registers a job for its browser session; a newer click
+supersedes the session's older jobs and the Cancel button cancels them.
+Running jobs notice through the pipeline's step callback and stop at the next
+denoising step boundary; queued jobs stop as soon as they start.
+"""
+import itertools
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+SUPERSEDED = "superseded by a newer request"
+CANCELLED = "cancelled by user"
+
+
+class JobCancelled(Exception):
+    """Raised inside a job (usually from the step callback) once it is cancelled."""
+
+    def __init__(self, reason: str, step: int = 0):
+        super().__init__(reason)
+        self.reason = reason
+        self.step = step
+
+
+class CancelToken:
+    """Cancellation flag for one job, plus the last denoising step it finished (of steps)."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[str], None]] = []
+        self.reason: Optional[str] = None
+        self.step = 0
+        self.steps = 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(reason)
+
+    def on_cancel(self, callback: Callable[[str], None]) -> None:
+        """Call callback(reason) once the token is cancelled (now, if it already is)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self.reason)
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise JobCancelled(self.reason or CANCELLED, self.step)
+
+    def step_callback(self, pipe, step: int, timestep, callback_kwargs: Dict) -> Dict:
+        """callback_on_step_end for diffusers pipelines."""
+        self.step = step + 1
+        self.steps = pipe.num_timesteps
+        self.raise_if_cancelled()
+        return callback_kwargs
+
+
+class SessionJobs:
+    """
+    Track the latest job per session.
+    submit() runs outside the queue when the user clicks Generate and returns
+    the new job id; begin() runs when the queued job actually starts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._latest: Dict[str, int] = {}
+        self._cancelled_upto: Dict[str, int] = {}
+        self._begun: Dict[str, int] = {}
+        self._running: Dict[str, Tuple[int, CancelToken]] = {}
+
+    def submit(self, session: str) -> int:
+        with self._lock:
+            job_id = next(self._ids)
+            self._latest[session] = job_id
+            running = self._running.get(session)
+        if running is not None:
+            running[1].cancel(SUPERSEDED)
+        return job_id
+
+    def begin(self, session: str, job_id: int) -> CancelToken:
+        token = CancelToken()
+        with self._lock:
+            if job_id != self._latest.get(session, job_id):
+                token.cancel(SUPERSEDED)
+            elif job_id <= self._cancelled_upto.get(session, 0):
+                token.cancel(CANCELLED)
+            self._begun[session] = max(job_id, self._begun.get(session, 0))
+            self._running[session] = (job_id, token)
+        return token
+
+    def end(self, session: str, token: CancelToken) -> None:
+        with self._lock:
+            running = self._running.get(session)
+            if running is None or running[1] is not token:
+                return
+            del self._running[session]
+            if self._latest.get(session, 0) <= running[0]:
+                # Nothing newer is queued for this session: forget it, so a
+                # long-running GUI does not keep an entry per browser session.
+                self._latest.pop(session, None)
+                self._cancelled_upto.pop(session, None)
+                self._begun.pop(session, None)
+
+    def cancel(self, session: str) -> bool:
+        """Cancel the session's running and queued jobs; True if there was any."""
+        with self._lock:
+            latest = self._latest.get(session, 0)
+            queued = latest > max(self._begun.get(session, 0), self._cancelled_upto.get(session, 0))
+            if latest:
+                self._cancelled_upto[session] = latest
+            running = self._running.get(session)
+        if running is not None and not running[1].cancelled:
+            running[1].cancel(CANCELLED)
+            return True
+        return queued
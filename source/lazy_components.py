@@ -0,0 +1,270 @@
+"""
+Low-memory execution mode (--low-memory) for Cartoonizer.
+The pipeline is assembled from empty component shells. Each stage's weights
+are loaded only when the stage starts (text encoder -> VAE encoder -> UNet ->
+VAE decoder) and dropped once the next stage runs, while the following
+stage's weights load on a background thread. Each safetensors file is
+memory-mapped once when the pipeline is built; entering a stage only points
+its parameters at the mapped tensors (plus a dtype conversion or device copy
+where needed), so no stage is deserialized again and its pages come from the
+OS page cache. Peak memory and the time spent (re)loading weights are
+tracked per run and reported next to the full model's footprint.
+"""
+import json
+import mmap
+import os
+import threading
+import time
+import warnings
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+
+from logs import log
+from memory_governor import process_rss_bytes
+
+GiB = 1024 ** 3
+
+
+def device_allocated_bytes(device: str) -> Optional[int]:
+    if device == "cuda" and torch.cuda.is_available():
+        return torch.cuda.memory_allocated()
+    if device == "mps" and hasattr(torch, "mps"):
+        try:
+            return torch.mps.current_allocated_memory()
+        except (AttributeError, RuntimeError):
+            return None
+    return None
+
+
+def _release(modules: List[torch.nn.Module]) -> None:
+    """Swap every parameter for an empty tensor (same dtype and device)."""
+    for module in modules:
+        for param in module.parameters():
+            param.data = torch.empty(0, dtype=param.dtype, device=param.device)
+
+
+def _empty_shell(module: torch.nn.Module, dtype: torch.dtype) -> None:
+    """Replace a module's meta parameters with empty CPU ones of dtype."""
+    for submodule in module.modules():
+        for name, param in list(submodule._parameters.items()):
+            if param is not None:
+                submodule._parameters[name] = torch.nn.Parameter(
+                    torch.empty(0, dtype=dtype), requires_grad=False
+                )
+
+
+# safetensors dtype names -> torch dtypes
+_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8, "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def map_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Tensors of a safetensors file as zero-copy views of a private memory
+    map: nothing is read until a tensor is used, and the pages stay file
+    backed, so the OS can drop them again instead of swapping.
+    """
+    with open(path, "rb") as f:
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # frombuffer warns about non-resizable buffers
+        data = torch.frombuffer(mapped, dtype=torch.uint8)
+    tensors = {}
+    base = 8 + header_len
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        begin, end = info["data_offsets"]
+        raw = data[base + begin:base + end]
+        tensors[name] = raw.view(_DTYPES[info["dtype"]]).reshape(info["shape"])
+    return tensors
+
+
+class Stage:
+    """
+    One component's weights. parts: (shell module, key prefix) pairs the stage
+    needs; weights: the component's tensors by state-dict key, loaded once.
+    materialize() points the shells' parameters at them on the device.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        parts: List[Tuple[torch.nn.Module, str]],
+        weights: Dict[str, torch.Tensor],
+        device: Callable[[], torch.device],
+        dtype: torch.dtype,
+    ):
+        self.name = name
+        self.parts = parts
+        self.modules = [module for module, _ in parts]
+        self.weights = weights
+        self.device = device
+        self.dtype = dtype
+        self.loaded = False
+        self.load_seconds = 0.0
+
+    def materialize(self) -> None:
+        start = time.perf_counter()
+        device = self.device()
+        for module, prefix in self.parts:
+            for name, param in module.named_parameters():
+                # A no-op on the CPU when the file already has the pipeline's dtype.
+                param.data = self.weights[prefix + name].to(device=device, dtype=self.dtype)
+        self.load_seconds = time.perf_counter() - start
+        self.loaded = True
+
+    def release(self) -> None:
+        _release(self.modules)
+        self.loaded = False
+
+
+class LazyComponents:
+    """
+    Stage switching for a pipeline built from shells. enter(i) runs from a
+    forward pre-hook of stage i: it waits for (or loads) its weights, drops
+    every other stage except the next one, and starts prefetching that.
+    """
+
+    def __init__(self, stages: List[Stage], device: Callable[[], str], full_bytes: int):
+        self.stages = stages
+        self.device = device
+        self.full_bytes = full_bytes
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._pending: Dict[int, Future] = {}
+        self._current: Optional[int] = None
+        self.peak_rss = 0
+        self.peak_device = 0
+        self.waited = 0.0
+        self.load_seconds = 0.0
+
+    def _sample(self) -> None:
+        rss = process_rss_bytes()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss, rss)
+        allocated = device_allocated_bytes(self.device())
+        if allocated is not None:
+            self.peak_device = max(self.peak_device, allocated)
+
+    def _prefetch(self, index: int) -> None:
+        stage = self.stages[index]
+        if stage.loaded or index in self._pending:
+            return
+        self._pending[index] = self._pool.submit(stage.materialize)
+
+    def enter(self, index: int) -> None:
+        with self._lock:
+            self._sample()
+            if index == self._current:
+                return
+            if index == 0:
+                # A new run: start the peak measurement over.
+                self.peak_rss = self.peak_device = 0
+                self.waited = self.load_seconds = 0.0
+            self._current = index
+            pending = self._pending.pop(index, None)
+            start = time.perf_counter()
+            if pending is not None:
+                pending.result()
+                self.load_seconds += self.stages[index].load_seconds
+            elif not self.stages[index].loaded:
+                self.stages[index].materialize()
+                self.load_seconds += self.stages[index].load_seconds
+            self.waited += time.perf_counter() - start
+            keep = {index, index + 1}
+            for i, stage in enumerate(self.stages):
+                if i not in keep and i not in self._pending and stage.loaded:
+                    stage.release()
+            if index + 1 < len(self.stages):
+                self._prefetch(index + 1)
+            self._sample()
+
+    def sample(self) -> None:
+        self._sample()
+
+    def describe(self) -> str:
+        parts = [f"peak RSS {self.peak_rss / GiB:.2f} GB"]
+        if self.peak_device:
+            parts.append(f"peak {self.device()} {self.peak_device / GiB:.2f} GB")
+        return (
+            f"Low-memory mode: {', '.join(parts)} (all weights: {self.full_bytes / GiB:.2f} GB); "
+            f"{self.load_seconds:.2f} s loading weights this run, {self.waited:.2f} s of it waited for"
+        )
+
+
+def _hook_stage(lazy: LazyComponents, index: int, module: torch.nn.Module) -> None:
+    module.register_forward_pre_hook(lambda _module, _args: lazy.enter(index))
+    module.register_forward_hook(lambda _module, _args, _output: lazy.sample())
+
+
+def _component_weights(
+    folder: str, subfolder: str, filename: str, shell: torch.nn.Module, cls
+) -> Dict[str, torch.Tensor]:
+    """
+    Memory-mapped tensors of one component. Files whose keys do not match the
+    model (legacy layouts that from_pretrained converts) are loaded once
+    through from_pretrained and kept as CPU tensors instead.
+    """
+    path = os.path.join(folder, subfolder, filename)
+    weights = map_safetensors(path) if os.path.exists(path) else {}
+    if all(name in weights for name, _ in shell.named_parameters()):
+        return weights
+    log(f"Low-memory mode: {subfolder} weights need conversion; keeping a CPU copy")
+    return dict(cls.from_pretrained(folder, subfolder=subfolder, low_cpu_mem_usage=True).state_dict())
+
+
+def load_lazy_pipeline(pipeline_cls, model_id: str, dtype: torch.dtype):
+    """
+    Build pipeline_cls for model_id with empty UNet, VAE and text encoder
+    shells; their weights are memory-mapped now and bound per stage, on
+    whatever device the pipeline has been moved to, while it runs.
+    """
+    from accelerate import init_empty_weights
+    from diffusers import AutoencoderKL, UNet2DConditionModel
+    from transformers import CLIPTextConfig, CLIPTextModel
+
+    folder = model_id if os.path.isdir(model_id) else pipeline_cls.download(model_id, use_safetensors=True)
+    with init_empty_weights():
+        unet = UNet2DConditionModel.from_config(UNet2DConditionModel.load_config(folder, subfolder="unet"))
+        vae = AutoencoderKL.from_config(AutoencoderKL.load_config(folder, subfolder="vae"))
+        text_encoder = CLIPTextModel(CLIPTextConfig.from_pretrained(folder, subfolder="text_encoder"))
+    item_bytes = torch.empty(0, dtype=dtype).element_size()
+    full_bytes = sum(p.numel() * item_bytes for m in (unet, vae, text_encoder) for p in m.parameters())
+    weights = {
+        "unet": _component_weights(folder, "unet", "diffusion_pytorch_model.safetensors", unet, UNet2DConditionModel),
+        "vae": _component_weights(folder, "vae", "diffusion_pytorch_model.safetensors", vae, AutoencoderKL),
+        "text_encoder": _component_weights(folder, "text_encoder", "model.safetensors", text_encoder, CLIPTextModel),
+    }
+    for shell in (unet, vae, text_encoder):
+        _empty_shell(shell, dtype)
+    pipe = pipeline_cls.from_pretrained(folder, unet=unet, vae=vae, text_encoder=text_encoder, safety_checker=None)
+
+    def make_stage(name: str, component: str, parts: List[Tuple[torch.nn.Module, str]]) -> Stage:
+        return Stage(name, parts, weights[component], lambda: pipe.device, dtype)
+
+    stages = [
+        make_stage("text encoder", "text_encoder", [(text_encoder, "")]),
+        make_stage("VAE encoder", "vae", [(vae.encoder, "encoder."), (vae.quant_conv, "quant_conv.")]),
+        make_stage("UNet", "unet", [(unet, "")]),
+        make_stage("VAE decoder", "vae", [(vae.post_quant_conv, "post_quant_conv."), (vae.decoder, "decoder.")]),
+    ]
+    lazy = LazyComponents(stages, lambda: pipe.device.type, full_bytes)
+    for index, stage in enumerate(stages):
+        _hook_stage(lazy, index, stage.modules[0])
+    pipe._lazy_components = lazy
+    log(f"Low-memory mode: weights bind per stage ({full_bytes / GiB:.2f} GB in total)")
+    return pipe
+
+
+def lazy_report(pipe) -> Optional[str]:
+    """Peak-memory summary of the last run in low-memory mode (None otherwise)."""
+    lazy = getattr(pipe, "_lazy_components", None)
+    return lazy.describe() if lazy is not None else None
@@ -0,0 +1,9 @@
+"""
+Console logging shared by the Cartoonizer modules. Every line carries the
+[Cartoonizer] prefix and is flushed at once, so the launcher log and the
+progress window see it immediately.
+"""
+
+
+def log(msg: str) -> None:
+    print(f"[Cartoonizer] {msg}", flush=True)
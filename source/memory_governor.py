@@ -0,0 +1,556 @@
+"""
+Memory governor for Cartoonizer.
+Tracks process RSS and device memory, picks a job configuration (batch size,
+resolution, attention/VAE strategy) that fits the current headroom, and
+retries jobs that still run out of memory in a cheaper configuration.
+Every downgrade is logged.
+
+Attention (fused SDPA vs. sliced) and VAE (untiled vs. tiled) are chosen per
+request from memory models of each stage. `calibrate()` measures those models
+once on the current device; results are cached in calibration.json.
+"""
+import gc
+import json
+import os
+import platform
+import threading
+import time
+from dataclasses import asdict, dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+import torch
+
+from app_paths import support_path
+from logs import log
+
+try:
+    import psutil
+except ImportError:  # psutil ships with accelerate, but stay usable without it
+    psutil = None
+
+T = TypeVar("T")
+
+MIN_SIDE = 384
+SIDE_STEP = 64
+VAE_TILE_SIDE = 512
+GiB = 1024 ** 3
+
+
+def _fmt_bytes(n: Optional[int]) -> str:
+    if n is None:
+        return "unknown"
+    return f"{n / GiB:.2f} GB"
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Current resident set size of this process."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def system_available_bytes() -> Optional[int]:
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def device_free_bytes(device: str) -> Optional[int]:
+    """Memory a new job on device can still allocate, or None if unknown."""
+    if device == "cuda" and torch.cuda.is_available():
+        free, _total = torch.cuda.mem_get_info()
+        # Blocks the caching allocator holds but does not use are reusable too.
+        return free + torch.cuda.memory_reserved() - torch.cuda.memory_allocated()
+    available = system_available_bytes()
+    if device == "mps" and hasattr(torch, "mps"):
+        # Unified memory: bounded by both system RAM and the MPS allocator cap.
+        try:
+            cap = torch.mps.recommended_max_memory() - torch.mps.driver_allocated_memory()
+        except (AttributeError, RuntimeError):
+            cap = None
+        if cap is not None:
+            available = cap if available is None else min(available, cap)
+    return available
+
+
+def is_oom_error(exc: BaseException) -> bool:
+    if isinstance(exc, MemoryError):
+        return True
+    oom_type = getattr(torch.cuda, "OutOfMemoryError", None)
+    if oom_type is not None and isinstance(exc, oom_type):
+        return True
+    return isinstance(exc, RuntimeError) and "out of memory" in str(exc).lower()
+
+
+def release_cached_memory() -> None:
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    if hasattr(torch, "mps") and hasattr(torch.mps, "empty_cache"):
+        try:
+            torch.mps.empty_cache()
+        except RuntimeError:
+            pass
+
+
+@dataclass(frozen=True)
+class MemoryPlan:
+    """One job configuration, from fastest (no slicing) to cheapest."""
+
+    max_side: int
+    batch_size: int = 1
+    attention_slicing: bool = False
+    vae_slicing: bool = False
+    vae_tiling: bool = False
+
+    def describe(self) -> str:
+        flags = [
+            name
+            for name, on in (
+                ("attention slicing", self.attention_slicing),
+                ("VAE slicing", self.vae_slicing),
+                ("VAE tiling", self.vae_tiling),
+            )
+            if on
+        ]
+        return f"max_side={self.max_side}, batch={self.batch_size}, " + (", ".join(flags) or "no slicing")
+
+
+def scaled_size(width: int, height: int, max_side: int):
+    scale = min(max_side / max(width, height), 1.0)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def estimate_stage_bytes(
+    width: int,
+    height: int,
+    plan: MemoryPlan,
+    dtype_bytes: int = 4,
+    fused_attention: bool = False,
+) -> Tuple[int, int]:
+    """
+    Rough peak working memory of the UNet and VAE-decode stages of one SD-1.5
+    img2img call, on top of the resident weights. Used until the device has
+    been calibrated; deliberately conservative, OOM retries cover misses.
+    fused_attention: the device has memory-efficient SDPA kernels (CUDA), so
+    attention scores are never materialized as a full tokens x tokens matrix.
+    """
+    width, height = scaled_size(width, height, plan.max_side)
+    tokens = (width // 8) * (height // 8)
+    cfg_batch = 2 * plan.batch_size
+    # UNet activations at the highest-resolution level dominate.
+    unet = cfg_batch * tokens * 320 * dtype_bytes * 40
+    if fused_attention and not plan.attention_slicing:
+        attention = cfg_batch * 8 * tokens * 64 * dtype_bytes * 4
+    else:
+        # 8 heads per batch item; "auto" slicing runs 4 batch*head slices at a time.
+        heads_at_once = 4 if plan.attention_slicing else cfg_batch * 8
+        attention = heads_at_once * tokens * tokens * dtype_bytes
+    vae_images = 1 if plan.vae_slicing else plan.batch_size
+    vae_pixels = min(width * height, VAE_TILE_SIDE * VAE_TILE_SIDE) if plan.vae_tiling else width * height
+    vae = vae_images * vae_pixels * 128 * dtype_bytes * 4
+    return unet + attention, vae
+
+
+# ---------------------------
+# Calibration
+# ---------------------------
+
+CALIBRATION_FILE = "calibration.json"
+CALIBRATION_SIDES = (384, 512, 640, 768)
+
+
+@dataclass
+class Calibration:
+    """
+    Measured peak-memory models for one device/dtype/UNet architecture.
+    UNet stage (batch of 2 for CFG): a + b*tokens + c*tokens**2 bytes.
+    VAE decode (one image): d + e*pixels bytes.
+    """
+
+    key: str
+    unet_fused: Tuple[float, float, float]
+    unet_sliced: Tuple[float, float, float]
+    vae_untiled: Tuple[float, float]
+    vae_tiled: Tuple[float, float]
+    samples: List[dict] = field(default_factory=list)
+    created: float = 0.0
+
+    def unet_bytes(self, tokens: int, batch_size: int, sliced: bool) -> int:
+        a, b, c = self.unet_sliced if sliced else self.unet_fused
+        return int(a + batch_size * (b * tokens + c * tokens * tokens))
+
+    def vae_bytes(self, pixels: int, images: int, tiled: bool) -> int:
+        d, e = self.vae_tiled if tiled else self.vae_untiled
+        if tiled:
+            pixels = min(pixels, VAE_TILE_SIDE * VAE_TILE_SIDE)
+        return int(d + images * e * pixels)
+
+
+def calibration_key(pipe) -> str:
+    device = pipe.device.type
+    if device == "cuda":
+        name = torch.cuda.get_device_name(pipe.device)
+    else:
+        name = f"{platform.system()}-{platform.machine()}"
+    blocks = "-".join(str(c) for c in pipe.unet.config.block_out_channels)
+    return f"{device}|{name}|torch{torch.__version__}|{pipe.unet.dtype}|unet{blocks}"
+
+
+def _read_calibrations() -> Dict[str, dict]:
+    path = support_path(CALIBRATION_FILE)
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError) as exc:
+        log(f"Ignoring unreadable calibration cache {path}: {exc}")
+        return {}
+
+
+def load_calibration(key: str) -> Optional[Calibration]:
+    data = _read_calibrations().get(key)
+    if data is None:
+        return None
+    for name in ("unet_fused", "unet_sliced", "vae_untiled", "vae_tiled"):
+        data[name] = tuple(data[name])
+    return Calibration(**data)
+
+
+def save_calibration(calibration: Calibration) -> None:
+    entries = _read_calibrations()
+    entries[calibration.key] = asdict(calibration)
+    path = support_path(CALIBRATION_FILE)
+    tmp = path.with_suffix(".json.part")
+    tmp.write_text(json.dumps(entries, indent=2))
+    os.replace(tmp, path)
+
+
+def _synchronize(device: str) -> None:
+    if device == "cuda":
+        torch.cuda.synchronize()
+    elif device == "mps" and hasattr(torch, "mps"):
+        torch.mps.synchronize()
+
+
+def _measure(device: str, fn: Callable[[], object]) -> Tuple[int, float]:
+    """Peak extra memory (bytes) and wall time of fn() on device."""
+    release_cached_memory()
+    if device == "cuda":
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+        start = time.perf_counter()
+        fn()
+        _synchronize(device)
+        return torch.cuda.max_memory_allocated() - base, time.perf_counter() - start
+    if device == "mps":
+        # The MPS allocator keeps freed blocks pooled until empty_cache(), so
+        # its driver allocation after the call approximates the peak.
+        base = torch.mps.driver_allocated_memory()
+        start = time.perf_counter()
+        fn()
+        _synchronize(device)
+        return torch.mps.driver_allocated_memory() - base, time.perf_counter() - start
+    # CPU: sample RSS while fn runs.
+    base = process_rss_bytes() or 0
+    peak = [base]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.002):
+            peak[0] = max(peak[0], process_rss_bytes() or 0)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        fn()
+    finally:
+        elapsed = time.perf_counter() - start
+        done.set()
+        sampler.join()
+    peak[0] = max(peak[0], process_rss_bytes() or 0)
+    return peak[0] - base, elapsed
+
+
+def _fit(xs: Sequence[float], ys: Sequence[float], degree: int) -> Tuple[float, ...]:
+    """Least-squares polynomial fit with non-negative coefficients (low order first)."""
+    if len(xs) <= degree:
+        degree = max(0, len(xs) - 1)
+    x = torch.tensor(xs, dtype=torch.float64)
+    design = torch.stack([x ** k for k in range(degree + 1)], dim=1)
+    y = torch.tensor(ys, dtype=torch.float64).unsqueeze(1)
+    coeffs = [max(0.0, c) for c in torch.linalg.lstsq(design, y).solution.squeeze(1).tolist()]
+    return tuple(coeffs + [0.0] * (3 - len(coeffs)))
+
+
+@torch.no_grad()
+def calibrate(pipe, sides: Sequence[int] = CALIBRATION_SIDES) -> Calibration:
+    """
+    Measure UNet (fused vs. sliced attention) and VAE decode (untiled vs.
+    tiled) peak memory at a few square resolutions and fit memory models.
+    Sizes that run out of memory stop that strategy's sweep.
+    """
+    device = pipe.device.type
+    dtype = pipe.unet.dtype
+    tokenizer = pipe.tokenizer
+    ids = tokenizer(
+        [""], padding="max_length", max_length=tokenizer.model_max_length, return_tensors="pt"
+    ).input_ids.to(pipe.device)
+    embeds = pipe.text_encoder(ids)[0].repeat(2, 1, 1)
+    timestep = torch.tensor(500, device=pipe.device)
+    scaling = getattr(pipe.vae.config, "scaling_factor", 0.18215)
+
+    samples: List[dict] = []
+    failed = set()
+    for side in sides:
+        latents = torch.randn(2, 4, side // 8, side // 8, device=pipe.device, dtype=dtype)
+        for strategy in ("fused", "sliced", "untiled", "tiled"):
+            if strategy in failed:
+                continue
+            if strategy == "fused":
+                pipe.disable_attention_slicing()
+                fn = lambda: pipe.unet(latents, timestep, encoder_hidden_states=embeds)
+            elif strategy == "sliced":
+                pipe.enable_attention_slicing()
+                fn = lambda: pipe.unet(latents, timestep, encoder_hidden_states=embeds)
+            else:
+                if strategy == "tiled":
+                    pipe.vae.enable_tiling()
+                else:
+                    pipe.vae.disable_tiling()
+                fn = lambda: pipe.vae.decode(latents[:1] / scaling)
+            try:
+                peak, seconds = _measure(device, fn)
+            except Exception as exc:
+                if not is_oom_error(exc):
+                    raise
+                release_cached_memory()
+                log(f"Calibration: {strategy} ran out of memory at {side}px")
+                failed.add(strategy)
+                continue
+            samples.append({"side": side, "strategy": strategy, "bytes": int(peak), "seconds": seconds})
+            log(f"Calibration: {side}px {strategy}: {_fmt_bytes(int(peak))} in {seconds:.2f}s")
+    pipe.disable_attention_slicing()
+    pipe.vae.disable_tiling()
+
+    def points(strategy: str, per_token: bool):
+        xs, ys = [], []
+        for sample in samples:
+            if sample["strategy"] == strategy:
+                side = sample["side"]
+                xs.append((side // 8) ** 2 if per_token else side * side)
+                ys.append(sample["bytes"])
+        return xs, ys
+
+    def fit_unet(strategy: str) -> Tuple[float, float, float]:
+        xs, ys = points(strategy, per_token=True)
+        if not xs:
+            raise RuntimeError(f"Calibration failed: no successful {strategy} UNet run")
+        a, b, c = _fit(xs, ys, degree=2)
+        # Measured at CFG batch 2; the model scales the size terms per batch item.
+        return a, b / 2, c / 2
+
+    def fit_vae(strategy: str) -> Tuple[float, float]:
+        xs, ys = points(strategy, per_token=False)
+        if not xs:
+            raise RuntimeError(f"Calibration failed: no successful {strategy} VAE run")
+        d, e, _ = _fit(xs, ys, degree=1)
+        return d, e
+
+    return Calibration(
+        key=calibration_key(pipe),
+        unet_fused=fit_unet("fused"),
+        unet_sliced=fit_unet("sliced"),
+        vae_untiled=fit_vae("untiled"),
+        vae_tiled=fit_vae("tiled"),
+        samples=samples,
+        created=time.time(),
+    )
+
+
+class MemoryGovernor:
+    """Choose and apply memory settings for jobs on one pipeline/device."""
+
+    def __init__(
+        self,
+        device: str,
+        dtype_bytes: int = 4,
+        safety_margin: float = 0.15,
+        min_side: int = MIN_SIDE,
+        calibration: Optional[Calibration] = None,
+    ):
+        self.device = device
+        self.dtype_bytes = dtype_bytes
+        self.safety_margin = safety_margin
+        self.min_side = min_side
+        self.calibration = calibration
+        # Attention processors are switched through the pipeline, so remember the last setting.
+        self._attention_slicing: Optional[bool] = None
+
+    @classmethod
+    def for_pipe(cls, pipe, **kwargs) -> "MemoryGovernor":
+        """Governor for pipe's device, using its cached calibration if there is one."""
+        device = pipe.device.type
+        dtype_bytes = 2 if pipe.unet.dtype == torch.float16 else 4
+        if "calibration" not in kwargs:
+            kwargs["calibration"] = load_calibration(calibration_key(pipe))
+            if kwargs["calibration"] is None:
+                log("Memory governor: no calibration for this device yet, using estimates (run --calibrate)")
+        return cls(device, dtype_bytes=dtype_bytes, **kwargs)
+
+    def headroom_bytes(self) -> Optional[int]:
+        free = device_free_bytes(self.device)
+        if free is None:
+            return None
+        return int(free * (1.0 - self.safety_margin))
+
+    def snapshot(self) -> str:
+        return f"rss={_fmt_bytes(process_rss_bytes())}, {self.device} free={_fmt_bytes(device_free_bytes(self.device))}"
+
+    def estimate_stages(self, width: int, height: int, plan: MemoryPlan) -> Tuple[int, int]:
+        """Peak bytes of the (UNet, VAE decode) stages under plan."""
+        if self.calibration is None:
+            return estimate_stage_bytes(
+                width, height, plan, dtype_bytes=self.dtype_bytes, fused_attention=self.device == "cuda"
+            )
+        width, height = scaled_size(width, height, plan.max_side)
+        tokens = (width // 8) * (height // 8)
+        vae_images = 1 if plan.vae_slicing else plan.batch_size
+        return (
+            self.calibration.unet_bytes(tokens, plan.batch_size, plan.attention_slicing),
+            self.calibration.vae_bytes(width * height, vae_images, plan.vae_tiling),
+        )
+
+    def estimate(self, width: int, height: int, plan: MemoryPlan) -> int:
+        # The stages run one after the other, so the job peaks at the larger.
+        return max(self.estimate_stages(width, height, plan))
+
+    def choose_strategies(self, width: int, height: int, plan: MemoryPlan, headroom: int) -> MemoryPlan:
+        """
+        Per-request policy: fused attention unless the UNet stage would not fit,
+        then untiled VAE unless decoding would not fit (VAE slicing first for
+        batches, tiling after that).
+        """
+        fused = replace(plan, attention_slicing=False)
+        unet_need, _ = self.estimate_stages(width, height, fused)
+        plan = replace(plan, attention_slicing=unet_need > headroom)
+        for vae_slicing, vae_tiling in ((False, False), (True, False), (True, True)):
+            if vae_slicing and plan.batch_size == 1 and not vae_tiling:
+                continue
+            candidate = replace(plan, vae_slicing=vae_slicing, vae_tiling=vae_tiling)
+            _, vae_need = self.estimate_stages(width, height, candidate)
+            if vae_need <= headroom:
+                return candidate
+        return candidate
+
+    def thresholds(self, headroom: Optional[int] = None, batch_size: int = 1) -> Dict[str, int]:
+        """Largest square side each strategy fits at the given (default: current) headroom."""
+        if headroom is None:
+            headroom = self.headroom_bytes() or 0
+        strategies = {
+            "fused_attention": (0, MemoryPlan(0, batch_size)),
+            "sliced_attention": (0, MemoryPlan(0, batch_size, attention_slicing=True)),
+            "untiled_vae": (1, MemoryPlan(0, batch_size)),
+            "tiled_vae": (1, MemoryPlan(0, batch_size, vae_slicing=True, vae_tiling=True)),
+        }
+        result = {}
+        for name, (stage, plan) in strategies.items():
+            best = 0
+            for side in range(SIDE_STEP, 4096 + 1, SIDE_STEP):
+                if self.estimate_stages(side, side, replace(plan, max_side=side))[stage] > headroom:
+                    break
+                best = side
+            result[name] = best
+        return result
+
+    def downgrade(self, plan: MemoryPlan, reason: str, strategies: bool = True) -> Optional[MemoryPlan]:
+        """
+        Return the next cheaper plan (logging the step), or None if exhausted.
+        strategies=False skips straight to a smaller batch or resolution.
+        """
+        if strategies and not plan.attention_slicing:
+            cheaper = replace(plan, attention_slicing=True)
+        elif strategies and not (plan.vae_slicing and plan.vae_tiling):
+            cheaper = replace(plan, vae_slicing=True, vae_tiling=True)
+        elif plan.batch_size > 1:
+            cheaper = replace(plan, batch_size=max(1, plan.batch_size // 2))
+        elif plan.max_side > self.min_side:
+            side = int(plan.max_side * 0.75) // SIDE_STEP * SIDE_STEP
+            cheaper = replace(plan, max_side=max(self.min_side, side))
+        else:
+            log(f"Memory governor: no cheaper configuration left ({reason})")
+            return None
+        log(f"Memory governor: downgrade ({reason}): {plan.describe()} -> {cheaper.describe()}")
+        return cheaper
+
+    def plan(self, width: int, height: int, max_side: int, batch_size: int = 1) -> MemoryPlan:
+        """Pick the fastest configuration whose estimate fits the current headroom."""
+        plan = MemoryPlan(max_side=max_side, batch_size=batch_size)
+        headroom = self.headroom_bytes()
+        if headroom is None:
+            log(f"Memory governor: headroom unknown ({self.snapshot()}); using {plan.describe()}")
+            return plan
+        while True:
+            plan = self.choose_strategies(width, height, plan, headroom)
+            need = self.estimate(width, height, plan)
+            if need <= headroom:
+                break
+            reason = f"needs ~{_fmt_bytes(need)}, headroom {_fmt_bytes(headroom)}"
+            # The strategies are already as cheap as needed; shrink batch/resolution
+            # and let the policy re-pick strategies for the smaller job.
+            cheaper = self.downgrade(plan, reason, strategies=False)
+            if cheaper is None:
+                break
+            plan = replace(cheaper, attention_slicing=False, vae_slicing=False, vae_tiling=False)
+        log(f"Memory governor: {self.snapshot()}; plan {plan.describe()}")
+        return plan
+
+    def apply(self, pipe, plan: MemoryPlan) -> None:
+        """
+        Switch the pipeline's slicing options to match plan. VAE slicing and
+        tiling are set on the VAE itself (the img2img pipeline does not forward
+        enable_vae_*()), and its current state is read from there.
+        """
+        if self._attention_slicing != plan.attention_slicing:
+            if plan.attention_slicing:
+                pipe.enable_attention_slicing()
+            else:
+                pipe.disable_attention_slicing()
+            self._attention_slicing = plan.attention_slicing
+        vae = pipe.vae
+        if vae.use_slicing != plan.vae_slicing:
+            if plan.vae_slicing:
+                vae.enable_slicing()
+            else:
+                vae.disable_slicing()
+        if vae.use_tiling != plan.vae_tiling:
+            if plan.vae_tiling:
+                vae.enable_tiling()
+            else:
+                vae.disable_tiling()
+
+    def run(self, pipe, plan: MemoryPlan, job: Callable[[MemoryPlan], T]) -> T:
+        """
+        Run job(plan) with plan applied to pipe. On out-of-memory, free cached
+        memory, downgrade and retry until a configuration succeeds or none is left.
+        """
+        while True:
+            self.apply(pipe, plan)
+            try:
+                return job(plan)
+            except Exception as exc:
+                if not is_oom_error(exc):
+                    raise
+                release_cached_memory()
+                cheaper = self.downgrade(plan, f"out of memory: {str(exc).splitlines()[0][:120]}")
+                if cheaper is None:
+                    raise
+                plan = cheaper
@@ -0,0 +1,176 @@
+"""
+Local model store and offline-first model resolution for Cartoonizer.
+`cartoonizer.py models fetch ID` downloads a model's pipeline files into the
+store (support folder/models, Hugging Face cache layout), hashes every file
+and records it in models.json. `models verify` re-hashes the copies and
+`models list` shows them. Copy the support folder to an air-gapped machine
+to take the store along.
+
+load_img2img_pipeline resolves a model id through resolve_model(): a
+verified copy whose files are all present with their recorded sizes loads
+straight from disk without contacting the hub, so start-up time does not
+depend on the network. Anything else falls back to the hub id as before.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from app_paths import support_path
+from logs import log
+
+MANIFEST_FILE = "models.json"
+STORE_DIR = "models"
+GiB = 1024 ** 3
+
+
+# ---------------------------
+# Manifest
+# ---------------------------
+
+def _read_manifest() -> Dict[str, dict]:
+    path = support_path(MANIFEST_FILE)
+    try:
+        return json.loads(path.read_text()) if path.exists() else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(manifest: Dict[str, dict]) -> None:
+    path = support_path(MANIFEST_FILE)
+    tmp = path.with_suffix(".json.part")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def _sha256(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _snapshot_files(folder: Path) -> List[Path]:
+    return sorted(p for p in folder.rglob("*") if p.is_file())
+
+
+def _check_files(folder: Path, files: Dict[str, dict], full: bool) -> List[str]:
+    """Relative paths that are missing or differ (size only unless full)."""
+    bad = []
+    for rel_path, info in files.items():
+        path = folder / rel_path
+        if not path.is_file() or path.stat().st_size != info["size"]:
+            bad.append(rel_path)
+        elif full and _sha256(path) != info["sha256"]:
+            bad.append(rel_path)
+    return bad
+
+
+# ---------------------------
+# Resolution
+# ---------------------------
+
+def resolve_model(model_id: str) -> str:
+    """
+    Local folder for model_id when the store holds a verified, complete copy;
+    otherwise model_id unchanged (a folder path or a hub id).
+    """
+    if os.path.isdir(model_id):
+        return model_id
+    entry = _read_manifest().get(model_id)
+    if not entry or not entry.get("verified"):
+        return model_id
+    folder = support_path(STORE_DIR, entry["path"])
+    bad = _check_files(folder, entry["files"], full=False)
+    if bad:
+        log(f"Local copy of '{model_id}' has {len(bad)} missing or changed files; using the hub")
+        return model_id
+    log(f"Using local copy of '{model_id}' (revision {entry['revision'][:10]})")
+    return str(folder)
+
+
+# ---------------------------
+# Commands
+# ---------------------------
+
+def fetch(model_id: str) -> None:
+    """Download model_id's pipeline files into the store, hash and record them."""
+    from diffusers import StableDiffusionImg2ImgPipeline
+
+    log(f"Fetching '{model_id}'...")
+    folder = Path(
+        StableDiffusionImg2ImgPipeline.download(
+            model_id, cache_dir=str(support_path(STORE_DIR)), use_safetensors=True
+        )
+    )
+    files = {}
+    for path in _snapshot_files(folder):
+        files[path.relative_to(folder).as_posix()] = {"size": path.stat().st_size, "sha256": _sha256(path)}
+    manifest = _read_manifest()
+    manifest[model_id] = {
+        # Relative to the store, so the support folder can be copied elsewhere.
+        "path": folder.relative_to(support_path(STORE_DIR)).as_posix(),
+        "revision": folder.name,
+        "files": files,
+        "fetched": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "verified": True,
+    }
+    _write_manifest(manifest)
+    total = sum(info["size"] for info in files.values())
+    log(f"Stored '{model_id}': {len(files)} files, {total / GiB:.2f} GB in {folder}")
+
+
+def verify(model_ids: Sequence[str]) -> bool:
+    """Re-hash stored copies (all when model_ids is empty); True if all match."""
+    manifest = _read_manifest()
+    ok = True
+    for model_id in model_ids or sorted(manifest):
+        entry = manifest.get(model_id)
+        if entry is None:
+            log(f"'{model_id}' is not in the store")
+            ok = False
+            continue
+        bad = _check_files(support_path(STORE_DIR, entry["path"]), entry["files"], full=True)
+        entry["verified"] = not bad
+        if bad:
+            more = ", ..." if len(bad) > 3 else ""
+            log(f"'{model_id}': {len(bad)} files missing or changed ({', '.join(bad[:3])}{more})")
+            ok = False
+        else:
+            log(f"'{model_id}': {len(entry['files'])} files OK")
+    _write_manifest(manifest)
+    return ok
+
+
+def list_models() -> None:
+    manifest = _read_manifest()
+    if not manifest:
+        log(f"No models in the store ({support_path(STORE_DIR)})")
+        return
+    for model_id, entry in sorted(manifest.items()):
+        total = sum(info["size"] for info in entry["files"].values())
+        state = "verified" if entry.get("verified") else "NOT verified"
+        print(f"{model_id:<40} {entry['revision'][:10]}  {total / GiB:6.2f} GB  {state}  (fetched {entry['fetched']})")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    ap = argparse.ArgumentParser(prog="cartoonizer.py models", description="Manage the local model store.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("fetch", help="Download models into the store and record their hashes.")
+    p.add_argument("model_ids", nargs="+", metavar="MODEL")
+    p = sub.add_parser("verify", help="Re-hash stored models (all by default).")
+    p.add_argument("model_ids", nargs="*", metavar="MODEL")
+    sub.add_parser("list", help="Show stored models.")
+    args = ap.parse_args(argv)
+    if args.command == "fetch":
+        for model_id in args.model_ids:
+            fetch(model_id)
+    elif args.command == "verify":
+        if not verify(args.model_ids):
+            raise SystemExit(1)
+    else:
+        list_models()
@@ -0,0 +1,234 @@
+"""
+Output encoding for Cartoonizer.
+Shared by the CLI and the Gradio GUI so both honour the same format/quality
+settings. Encoding runs on a small thread pool so the inference thread can
+move on to the next image while the previous one is compressed and written.
+"""
+import io
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait as futures_wait
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Set
+
+from PIL import Image
+
+FORMAT_EXTENSIONS = {
+    "png": ".png",
+    "jpeg": ".jpg",
+    "webp": ".webp",
+}
+EXTENSION_FORMATS = {
+    ".png": "png",
+    ".jpg": "jpeg",
+    ".jpeg": "jpeg",
+    ".webp": "webp",
+}
+JPEG_SUBSAMPLING = ("4:4:4", "4:2:2", "4:2:0")
+
+
+def format_from_path(path: str, default: str = "png") -> str:
+    """Guess the output format from a file extension."""
+    return EXTENSION_FORMATS.get(os.path.splitext(path)[1].lower(), default)
+
+
+@dataclass
+class EncodeOptions:
+    """Format and quality settings for written images."""
+
+    format: str = "png"
+    png_compress_level: int = 6
+    quality: int = 90
+    jpeg_progressive: bool = False
+    jpeg_subsampling: str = "4:2:0"
+    webp_lossless: bool = False
+
+    def __post_init__(self):
+        self.format = self.format.lower()
+        if self.format == "jpg":
+            self.format = "jpeg"
+        if self.format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unsupported output format: {self.format}")
+        if self.jpeg_subsampling not in JPEG_SUBSAMPLING:
+            raise ValueError(f"Unsupported JPEG subsampling: {self.jpeg_subsampling}")
+
+    @property
+    def extension(self) -> str:
+        return FORMAT_EXTENSIONS[self.format]
+
+    def save_kwargs(self) -> dict:
+        """Keyword arguments for PIL's Image.save."""
+        if self.format == "png":
+            return {"format": "PNG", "compress_level": int(self.png_compress_level)}
+        if self.format == "jpeg":
+            return {
+                "format": "JPEG",
+                "quality": int(self.quality),
+                "progressive": bool(self.jpeg_progressive),
+                "subsampling": self.jpeg_subsampling,
+                "optimize": True,
+            }
+        return {
+            "format": "WEBP",
+            "quality": int(self.quality),
+            "lossless": bool(self.webp_lossless),
+            "method": 4,
+        }
+
+    def describe(self) -> str:
+        if self.format == "png":
+            return f"PNG (compress level {self.png_compress_level})"
+        if self.format == "jpeg":
+            mode = ", progressive" if self.jpeg_progressive else ""
+            return f"JPEG @ quality {self.quality}, {self.jpeg_subsampling}{mode}"
+        if self.webp_lossless:
+            return "WebP (lossless)"
+        return f"WebP @ quality {self.quality}"
+
+
+@dataclass
+class EncodeResult:
+    """What a single encode produced."""
+
+    path: str
+    format: str
+    bytes_written: int
+    encode_seconds: float
+
+    def describe(self) -> str:
+        return (
+            f"{self.format.upper()} {self.bytes_written / 1024:.0f} KB "
+            f"in {self.encode_seconds * 1000:.0f} ms -> {self.path}"
+        )
+
+
+def encode_image(img: Image.Image, path: str, options: EncodeOptions) -> EncodeResult:
+    """Encode img with options and write it to path (atomically)."""
+    if options.format == "jpeg" and img.mode != "RGB":
+        img = img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGB")
+
+    start = time.perf_counter()
+    buf = io.BytesIO()
+    img.save(buf, **options.save_kwargs())
+    encode_seconds = time.perf_counter() - start
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "wb") as f:
+        f.write(buf.getbuffer())
+    os.replace(tmp_path, path)
+    return EncodeResult(path, options.format, buf.tell(), encode_seconds)
+
+
+class OutputWriter:
+    """
+    Encode and write images on a background thread pool.
+    submit() returns immediately with a Future; at most max_pending images
+    are held in memory at once, after which submit() blocks. Both submit()
+    and write() may override the writer's options per image.
+    """
+
+    def __init__(
+        self,
+        options: Optional[EncodeOptions] = None,
+        max_workers: int = 2,
+        max_pending: Optional[int] = None,
+        on_result: Optional[Callable[[EncodeResult], None]] = None,
+    ):
+        self.options = options or EncodeOptions()
+        self.on_result = on_result
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="encode")
+        self._slots = threading.Semaphore(max_pending or max_workers * 2)
+        self._lock = threading.Lock()
+        self._pending: Set[Future] = set()
+        self._errors: List[BaseException] = []
+        self.images_written = 0
+        self.bytes_written = 0
+        self.encode_seconds = 0.0
+
+    def submit(
+        self, img: Image.Image, path: str, options: Optional[EncodeOptions] = None
+    ) -> "Future[EncodeResult]":
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(encode_image, img, path, options or self.options)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        with self._lock:
+            if not future.done():
+                self._pending.add(future)
+        return future
+
+    def write(self, img: Image.Image, path: str, options: Optional[EncodeOptions] = None) -> EncodeResult:
+        """Encode on the pool and wait for the result; errors propagate to the caller."""
+        result = self._pool.submit(encode_image, img, path, options or self.options).result()
+        self._record(result)
+        return result
+
+    def _done(self, future: Future) -> None:
+        self._slots.release()
+        if future.cancelled():
+            with self._lock:
+                self._pending.discard(future)
+            return
+        exc = future.exception()
+        if exc is not None:
+            # Record the error in the same critical section that drops the
+            # future, so a concurrent wait() sees one or the other.
+            with self._lock:
+                self._errors.append(exc)
+                self._pending.discard(future)
+            return
+        self._record(future.result(), future)
+
+    def _record(self, result: EncodeResult, future: Optional[Future] = None) -> None:
+        with self._lock:
+            self.images_written += 1
+            self.bytes_written += result.bytes_written
+            self.encode_seconds += result.encode_seconds
+            if future is not None:
+                self._pending.discard(future)
+        if self.on_result is not None:
+            self.on_result(result)
+
+    def wait(self) -> None:
+        """Block until every submitted image is written; re-raise the first failure."""
+        # A future leaves _pending only once _done has recorded its outcome
+        # (done callbacks can run after result() returns), so wait for that.
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            futures_wait(pending)
+            time.sleep(0.001)
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def summary(self) -> str:
+        with self._lock:
+            return (
+                f"{self.images_written} image(s), {self.bytes_written / (1024 * 1024):.1f} MB written, "
+                f"{self.encode_seconds:.2f}s encoding"
+            )
+
+    def close(self) -> None:
+        try:
+            self.wait()
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def __enter__(self) -> "OutputWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
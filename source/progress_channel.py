@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Progress channel between the launcher / cartoonizer.py and the progress window.
+Messages are small JSON datagrams ({"stage", "message", "percent", "eta"})
+sent over a Unix domain socket the window binds, so the window sleeps in
+recv() and only wakes on real updates. When nobody is listening (or Unix
+sockets are unavailable) publishers fall back to the legacy status file.
+
+Shell usage (from the launcher):
+    python3 progress_channel.py send --stage deps "Installing Python packages..."
+    python3 progress_channel.py close
+"""
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from app_paths import APP_SUPPORT_DIR
+
+SOCKET_PATH = str(APP_SUPPORT_DIR / "progress.sock")
+STATUS_FILE = str(APP_SUPPORT_DIR / "progress_status.txt")
+CLOSE = "CLOSE"
+MAX_DATAGRAM = 8192
+
+
+def encode_message(stage: str, message: str, percent: Optional[float] = None, eta: Optional[float] = None) -> bytes:
+    payload = {"stage": stage, "message": message, "ts": time.time()}
+    if percent is not None:
+        payload["percent"] = float(percent)
+    if eta is not None:
+        payload["eta"] = float(eta)
+    return json.dumps(payload).encode("utf-8")
+
+
+def decode_message(data: bytes) -> Dict:
+    """Parse a datagram; plain text (the legacy format) becomes a bare message."""
+    text = data.decode("utf-8", errors="replace").strip()
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        payload = {"stage": "", "message": text}
+    if payload.get("message", "").upper() == CLOSE:
+        payload["stage"] = "close"
+    return payload
+
+
+class ProgressPublisher:
+    """
+    Send progress updates to the window. Never raises: progress reporting
+    must not take the app down. ETA is derived from percent when not given.
+    """
+
+    def __init__(self, socket_path: str = SOCKET_PATH, status_file: str = STATUS_FILE):
+        self.socket_path = socket_path
+        self.status_file = status_file
+        self._sock = None
+        self._stage_started: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        if hasattr(socket, "AF_UNIX"):
+            try:
+                self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            except OSError:
+                self._sock = None
+
+    def update(self, stage: str, message: str, percent: Optional[float] = None, eta: Optional[float] = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            started = self._stage_started.setdefault(stage, now)
+            if eta is None and percent is not None and 0 < percent < 100:
+                eta = (now - started) * (100 - percent) / percent
+            data = encode_message(stage, message, percent, eta)
+            if self._sock is not None:
+                try:
+                    self._sock.sendto(data, self.socket_path)
+                    return
+                except OSError:
+                    pass
+            self._write_file(CLOSE if stage == "close" else message)
+
+    def close_window(self) -> None:
+        self.update("close", CLOSE)
+
+    def _write_file(self, text: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.status_file), exist_ok=True)
+            tmp = self.status_file + ".part"
+            with open(tmp, "w") as f:
+                f.write(text)
+            os.replace(tmp, self.status_file)
+        except OSError:
+            pass
+
+
+class ProgressListener:
+    """
+    Receive progress messages, calling on_message(payload) for each.
+    listen() blocks in recv() on the socket; if the socket cannot be bound it
+    polls the legacy status file instead.
+    """
+
+    def __init__(
+        self,
+        on_message: Callable[[Dict], None],
+        socket_path: str = SOCKET_PATH,
+        status_file: str = STATUS_FILE,
+        poll_interval: float = 0.2,
+    ):
+        self.on_message = on_message
+        self.socket_path = socket_path
+        self.status_file = status_file
+        self.poll_interval = poll_interval
+        self.running = True
+        self._sock = self._bind()
+
+    def _bind(self):
+        if not hasattr(socket, "AF_UNIX"):
+            return None
+        try:
+            os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(self.socket_path)
+            return sock
+        except OSError:
+            return None
+
+    @property
+    def event_driven(self) -> bool:
+        return self._sock is not None
+
+    def listen(self) -> None:
+        if self._sock is None:
+            self._poll_file()
+            return
+        self._replay_recent_file()
+        try:
+            while self.running:
+                data = self._sock.recv(MAX_DATAGRAM)
+                if not self.running:
+                    break
+                payload = decode_message(data)
+                self.on_message(payload)
+                if payload.get("stage") == "close":
+                    break
+        except OSError:
+            pass
+        finally:
+            self._cleanup()
+
+    def stop(self) -> None:
+        """Wake a blocked listen() and make it return."""
+        self.running = False
+        if self._sock is not None:
+            try:
+                wake = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                wake.sendto(b"", self.socket_path)
+                wake.close()
+            except OSError:
+                pass
+
+    def _cleanup(self) -> None:
+        try:
+            self._sock.close()
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+    def _replay_recent_file(self, max_age: float = 300.0) -> None:
+        """Show a status written to the file before the socket was bound."""
+        try:
+            if time.time() - os.path.getmtime(self.status_file) > max_age:
+                return
+            with open(self.status_file, "r") as f:
+                status = f.read().strip()
+        except OSError:
+            return
+        payload = decode_message(status.encode("utf-8"))
+        if status and payload.get("stage") != "close":
+            self.on_message(payload)
+
+    def _poll_file(self) -> None:
+        last = ""
+        while self.running:
+            try:
+                if os.path.exists(self.status_file):
+                    with open(self.status_file, "r") as f:
+                        status = f.read().strip()
+                    if status and status != last:
+                        last = status
+                        payload = decode_message(status.encode("utf-8"))
+                        self.on_message(payload)
+                        if payload.get("stage") == "close":
+                            break
+            except OSError:
+                pass
+            time.sleep(self.poll_interval)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Send a progress update to the Cartoonizer progress window.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    send = sub.add_parser("send")
+    send.add_argument("message")
+    send.add_argument("--stage", default="launcher")
+    send.add_argument("--percent", type=float)
+    send.add_argument("--eta", type=float)
+    sub.add_parser("close")
+    args = ap.parse_args()
+
+    publisher = ProgressPublisher()
+    if args.command == "close":
+        publisher.close_window()
+    else:
+        publisher.update(args.stage, args.message, percent=args.percent, eta=args.eta)
+
+
+if __name__ == "__main__":
+    main()
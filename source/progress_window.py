@@ -3,14 +3,18 @@
 Progress window for Cartoonizer startup.
 Displays startup progress while the app initializes.
 """
+import argparse
+import os
 import tkinter as tk
 from tkinter import ttk
-import os
 import threading
-import time
+
+from progress_channel import ProgressListener
+
+PARENT_CHECK_MS = 2000
 
 class ProgressWindow:
-    def __init__(self):
+    def __init__(self, parent_pid=None):
         self.root = tk.Tk()
         self.root.title("Cartoonizer")
         self.root.geometry("450x220")
@@ -55,42 +59,70 @@ class ProgressWindow:
         self.details_label = tk.Label(self.root, text="This may take 1-2 minutes on first run", font=("Helvetica", 10), fg="#999999", bg='#f0f0f0')
         self.details_label.pack(pady=10)
         
-        self.status_file = os.path.expanduser("~/Library/Application Support/Cartoonizer/progress_status.txt")
         self.running = True
-        self.last_status = ""
+        self.determinate = False
         
-        # Start monitoring thread
-        self.monitor_thread = threading.Thread(target=self._monitor_status, daemon=True)
+        # Start listening thread (blocks until a message arrives)
+        self.listener = ProgressListener(self._on_message)
+        self.monitor_thread = threading.Thread(target=self.listener.listen, daemon=True)
         self.monitor_thread.start()
         
+        # Close with the launcher if the app exits before it could close us
+        self.parent_pid = parent_pid
+        if parent_pid:
+            self.root.after(PARENT_CHECK_MS, self._check_parent)
+        
         # Bring window to front
         self.root.lift()
         self.root.attributes('-topmost', True)
         self.root.after_idle(self.root.attributes, '-topmost', False)
     
-    def _monitor_status(self):
-        """Monitor the status file for updates."""
-        while self.running:
+    def _check_parent(self):
+        """Quit once the parent process is gone."""
+        try:
+            os.kill(self.parent_pid, 0)
+        except ProcessLookupError:
+            self.running = False
+            self.root.quit()
+            return
+        except OSError:
+            pass
+        self.root.after(PARENT_CHECK_MS, self._check_parent)
+    
+    def _on_message(self, payload):
+        """Handle one progress message from the listener thread."""
+        if payload.get("stage") == "close":
+            self.running = False
+            try:
+                self.root.after(0, self.root.quit)
+            except:
+                pass
+            return
+        message = payload.get("message")
+        if message:
+            self.update_status(message)
+        percent = payload.get("percent")
+        if percent is not None:
+            eta = payload.get("eta")
             try:
-                if os.path.exists(self.status_file):
-                    with open(self.status_file, 'r') as f:
-                        status = f.read().strip()
-                    
-                    if status and status != self.last_status:
-                        self.last_status = status
-                        if status.upper() == "CLOSE":
-                            self.running = False
-                            try:
-                                self.root.quit()
-                            except:
-                                pass
-                            break
-                        else:
-                            self.update_status(status)
-            except Exception as e:
+                self.root.after(0, lambda: self._update_progress_main(percent, eta))
+            except:
                 pass
-            
-            time.sleep(0.2)
+    
+    def _update_progress_main(self, percent, eta):
+        """Switch to a determinate bar and show the ETA, on the main thread."""
+        try:
+            if not self.determinate:
+                self.progress.stop()
+                self.progress.config(mode='determinate', maximum=100)
+                self.determinate = True
+            self.progress['value'] = max(0.0, min(100.0, percent))
+            if eta is not None:
+                self.details_label.config(text=f"{percent:.0f}% — about {int(eta) + 1}s remaining")
+            else:
+                self.details_label.config(text=f"{percent:.0f}%")
+        except:
+            pass
     
     def update_status(self, message):
         """Update the status message from the main thread."""
@@ -115,9 +147,13 @@ class ProgressWindow:
             pass
         except Exception:
             pass
+        finally:
+            self.listener.stop()
 
 if __name__ == "__main__":
-    window = ProgressWindow()
+    parser = argparse.ArgumentParser(description="Cartoonizer startup progress window.")
+    parser.add_argument("--parent-pid", type=int, help="Close when this process exits.")
+    window = ProgressWindow(parser.parse_args().parent_pid)
     window.run()
 
 
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Benchmark image ingest: full decode + LANCZOS vs. reduced-size JPEG decode.
+
+Usage:
+    python3 source/scripts/bench_ingest.py [IMAGE ...] [--max-side 768] [--repeat 5]
+
+Without IMAGE arguments a synthetic 6000x4000 (24 MP) JPEG is generated.
+Each mode runs in a fresh subprocess so its peak RSS is measured in isolation;
+"+decode" is the growth of the peak over the post-import baseline.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux.
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def make_sample(path: Path, size=(6000, 4000)) -> None:
+    from PIL import Image
+
+    w, h = size
+    gradient = Image.linear_gradient("L").resize((w, h))
+    noise = Image.effect_noise((w, h), 48)
+    img = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+    img.save(path, quality=92)
+
+
+def worker(mode: str, path: str, max_side: int, repeat: int) -> None:
+    from ingest import prepare_image
+
+    fast = mode == "fast"
+    baseline = peak_rss_mb()
+    times = []
+    size = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        img = prepare_image(path, max_side=max_side, fast=fast)
+        times.append(time.perf_counter() - start)
+        size = img.size
+        del img
+    print(json.dumps({
+        "mode": mode,
+        "best_ms": min(times) * 1000,
+        "mean_ms": sum(times) / len(times) * 1000,
+        "peak_mb": peak_rss_mb(),
+        "peak_delta_mb": peak_rss_mb() - baseline,
+        "size": size,
+    }))
+
+
+def run_mode(mode: str, path: str, max_side: int, repeat: int) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--worker", mode, path, "--max-side", str(max_side), "--repeat", str(repeat)],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("images", nargs="*")
+    ap.add_argument("--max-side", type=int, default=768)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--worker", choices=["legacy", "fast"], help=argparse.SUPPRESS)
+    ap.add_argument("--make-sample", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.make_sample:
+        make_sample(Path(args.make_sample))
+        return
+    if args.worker:
+        worker(args.worker, args.images[0], args.max_side, args.repeat)
+        return
+
+    images = args.images
+    tmp = None
+    if not images:
+        tmp = tempfile.TemporaryDirectory()
+        sample = Path(tmp.name) / "sample_24mp.jpg"
+        print("Generating synthetic 24 MP JPEG...")
+        # In a subprocess: Linux carries ru_maxrss across fork/exec, so the
+        # sample's footprint would otherwise leak into every measurement.
+        subprocess.run([sys.executable, __file__, "--make-sample", str(sample)], check=True)
+        images = [str(sample)]
+
+    print(f"{'image':<32} {'mode':<7} {'best ms':>9} {'mean ms':>9} {'peak MB':>9} {'+decode':>9}  output")
+    for path in images:
+        for mode in ("legacy", "fast"):
+            r = run_mode(mode, path, args.max_side, args.repeat)
+            print(
+                f"{os.path.basename(path)[:32]:<32} {mode:<7} {r['best_ms']:>9.1f} "
+                f"{r['mean_ms']:>9.1f} {r['peak_mb']:>9.1f} {r['peak_delta_mb']:>9.1f}  {r['size'][0]}x{r['size'][1]}"
+            )
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
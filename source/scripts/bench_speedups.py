@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Benchmark UNet speed-ups: time per image and drift from the unaccelerated output.
+
+Usage:
+    python3 source/scripts/bench_speedups.py [IMAGE] [--model ID] [--side 512] [--steps 30]
+        [--tome 0.3,0.5,0.6] [--cache 2,3,5] [--cfg 0.4,0.6] [--repeat 2]
+
+Every variant runs with the same seed, so the only difference from the first
+(baseline) row is the speed-up itself. "PSNR" and "mean abs" compare each
+output with the baseline's (higher PSNR / lower mean abs = closer); add
+--save DIR to keep the images for a visual check. Without IMAGE a synthetic
+gradient portrait is used, which hides fine-detail loss; use a real photo.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def ratios(text: str) -> list:
+    return [float(v) for v in text.split(",") if v]
+
+
+def intervals(text: str) -> list:
+    return [int(v) for v in text.split(",") if v]
+
+
+def make_sample(side: int):
+    from PIL import Image, ImageDraw
+
+    img = Image.linear_gradient("L").resize((side, side)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((side * 0.3, side * 0.15, side * 0.7, side * 0.6), fill=(225, 190, 160))
+    draw.rectangle((side * 0.2, side * 0.6, side * 0.8, side), fill=(60, 80, 140))
+    return img
+
+
+def drift(out, base) -> tuple:
+    a = np.asarray(out, dtype=np.float32)
+    b = np.asarray(base, dtype=np.float32)
+    mse = float(np.mean((a - b) ** 2))
+    psnr = math.inf if mse == 0 else 10 * math.log10(255.0 ** 2 / mse)
+    return psnr, float(np.mean(np.abs(a - b)))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("image", nargs="?")
+    ap.add_argument("--model", default="Lykon/dreamshaper-8")
+    ap.add_argument("--side", type=int, default=512)
+    ap.add_argument("--steps", type=int, default=30)
+    ap.add_argument("--strength", type=float, default=0.6)
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--repeat", type=int, default=2)
+    ap.add_argument("--tome", type=ratios, default=[0.3, 0.5, 0.6], help="Token merging ratios to measure.")
+    ap.add_argument("--cache", type=intervals, default=[2, 3, 5], help="Feature cache intervals to measure.")
+    ap.add_argument("--cfg", type=ratios, default=[0.4, 0.6], help="CFG cutoffs (fraction of guided steps) to measure.")
+    ap.add_argument("--save", help="Write each variant's output to this folder.")
+    args = ap.parse_args()
+
+    import torch
+    from PIL import Image
+
+    from cartoonizer import load_img2img_pipeline
+    from feature_cache import set_feature_cache
+    from guidance import guidance_kwargs
+    from ingest import fit_to_max_side
+    from token_merging import set_token_merging
+
+    image = Image.open(args.image).convert("RGB") if args.image else make_sample(args.side)
+    image = fit_to_max_side(image, args.side)
+    pipe = load_img2img_pipeline(args.model)
+    pipe.set_progress_bar_config(disable=True)
+
+    def run(cfg_cutoff: float):
+        generator = torch.Generator(device=pipe.device).manual_seed(args.seed)
+        return pipe(
+            prompt="highly detailed anime style, clean lines, cel shading, vibrant colors",
+            image=image,
+            strength=args.strength,
+            guidance_scale=7.5,
+            num_inference_steps=args.steps,
+            generator=generator,
+            **guidance_kwargs(cfg_cutoff),
+        ).images[0]
+
+    # (name, token merging ratio, feature cache interval, CFG cutoff)
+    variants = [("baseline", 0.0, 1, 1.0)]
+    variants += [(f"tome {r:.2f}", r, 1, 1.0) for r in args.tome if r > 0]
+    variants += [(f"cache {n}", 0.0, n, 1.0) for n in args.cache if n > 1]
+    variants += [(f"cfg {c:.2f}", 0.0, 1, c) for c in args.cfg if 0 < c < 1]
+    print(f"{pipe.device}, {image.width}x{image.height}, {args.steps} steps x strength {args.strength}")
+    print(f"{'variant':<14} {'s/img':>8} {'speed-up':>9} {'PSNR dB':>8} {'mean abs':>9}")
+    base_img = base_time = None
+    for name, ratio, interval, cfg_cutoff in variants:
+        set_token_merging(pipe, ratio)
+        set_feature_cache(pipe, interval)
+        run(cfg_cutoff)  # warm-up
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            out = run(cfg_cutoff)
+        seconds = (time.perf_counter() - start) / args.repeat
+        if base_img is None:
+            base_img, base_time = out, seconds
+        psnr, mean_abs = drift(out, base_img)
+        print(f"{name:<14} {seconds:>8.2f} {base_time / seconds:>8.2f}x {psnr:>8.1f} {mean_abs:>9.2f}")
+        if args.save:
+            Path(args.save).mkdir(parents=True, exist_ok=True)
+            out.save(Path(args.save) / f"{name.replace(' ', '_')}.png")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,25 +2,40 @@
 """Generate the Cartoonizer app icon PNGs and ICNS bundle."""
 from __future__ import annotations
 
+import argparse
+import binascii
+import hashlib
+import json
 import math
 import os
 import struct
+import tempfile
 import zlib
-import binascii
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:  # fall back to the pure-Python renderer
+    np = None
+
 ROOT = Path(__file__).resolve().parents[1]
 ASSETS = ROOT / "assets"
 ICONSET = ASSETS / "Cartoonizer.iconset"
 BASE_SIZE = 1024
+SPARKLES = [(220, 260), (780, 260), (230, 800), (700, 820)]
+ICON_SIZES = (16, 32, 128, 256, 512)
+WEB_ICON_SIZE = 512
 
 
 def render_base(size: int = BASE_SIZE):
+    """Pure-Python reference renderer; geometry is laid out for 1024 px and scaled by size."""
+    k = size / BASE_SIZE
     cx = size / 2
-    cy = size / 2 + 50
-    lens_radius = 250
-    smile_y = cy - 40
-    smile_r = 320
+    cy = size / 2 + 50 * k
+    lens_radius = 250 * k
+    smile_y = cy - 40 * k
+    smile_r = 320 * k
     data = []
     for y in range(size):
         t = y / (size - 1)
@@ -39,8 +54,8 @@ def render_base(size: int = BASE_SIZE):
                 g = int(g * (1 - fade) + 20 * fade)
                 b = int(b * (1 - fade) + 30 * fade)
 
-            glow_dx = (x - size / 2) / 350
-            glow_dy = (y - (size * 0.45)) / 350
+            glow_dx = (x - size / 2) / (350 * k)
+            glow_dy = (y - (size * 0.45)) / (350 * k)
             glow = math.exp(-(glow_dx * glow_dx + glow_dy * glow_dy))
             r = min(255, int(r + 80 * glow))
             g = min(255, int(g + 70 * glow))
@@ -55,21 +70,21 @@ def render_base(size: int = BASE_SIZE):
                 r = int(r * (1 - mix) + lens_color[0] * mix)
                 g = int(g * (1 - mix) + lens_color[1] * mix)
                 b = int(b * (1 - mix) + lens_color[2] * mix)
-                if lens_radius - 10 < d < lens_radius:
+                if lens_radius - 10 * k < d < lens_radius:
                     r = int(r * 0.7)
                     g = int(g * 0.7)
                     b = int(b * 0.7)
 
-            hx = cx - 90
-            hy = cy - 90
-            if ((x - hx) / 160) ** 2 + ((y - hy) / 120) ** 2 < 1:
+            hx = cx - 90 * k
+            hy = cy - 90 * k
+            if ((x - hx) / (160 * k)) ** 2 + ((y - hy) / (120 * k)) ** 2 < 1:
                 r = min(255, int(r * 0.6 + 255 * 0.4))
                 g = min(255, int(g * 0.6 + 255 * 0.4))
                 b = min(255, int(b * 0.6 + 255 * 0.4))
 
-            hx2 = cx + 120
-            hy2 = cy - 10
-            if ((x - hx2) / 90) ** 2 + ((y - hy2) / 60) ** 2 < 1:
+            hx2 = cx + 120 * k
+            hy2 = cy - 10 * k
+            if ((x - hx2) / (90 * k)) ** 2 + ((y - hy2) / (60 * k)) ** 2 < 1:
                 r = min(255, int(r * 0.7 + 255 * 0.3))
                 g = min(255, int(g * 0.7 + 255 * 0.3))
                 b = min(255, int(b * 0.7 + 255 * 0.3))
@@ -78,30 +93,30 @@ def render_base(size: int = BASE_SIZE):
                 val = smile_r ** 2 - (x - cx) ** 2
                 if val >= 0:
                     arc_y = smile_y + math.sqrt(val)
-                    if smile_y - 10 < y < arc_y + 5 and abs(y - arc_y) < 4:
+                    if smile_y - 10 * k < y < arc_y + 5 * k and abs(y - arc_y) < 4 * k:
                         r, g, b = 200, 90, 70
 
-            bx = (x - (cx + 40))
-            by = (y - (cy - 250))
+            bx = (x - (cx + 40 * k))
+            by = (y - (cy - 250 * k))
             proj = (bx * 0.6 + by * 0.8)
             perp = (-bx * 0.8 + by * 0.6)
-            if 0 < proj < 420 and abs(perp) < 55:
+            if 0 < proj < 420 * k and abs(perp) < 55 * k:
                 r = 255
-                g = int(140 + perp * 0.2)
+                g = int(140 + perp / k * 0.2)
                 b = 100
 
-            hx_rect1 = cx + 150
-            hy_rect1 = cy - 50
-            if hx_rect1 < x < hx_rect1 + 70 and hy_rect1 < y < hy_rect1 + 280:
+            hx_rect1 = cx + 150 * k
+            hy_rect1 = cy - 50 * k
+            if hx_rect1 < x < hx_rect1 + 70 * k and hy_rect1 < y < hy_rect1 + 280 * k:
                 r, g, b = 60, 50, 80
 
-            tx = cx + 180
-            ty = cy + 230
-            if tx < x < tx + 80 and ty < y < ty + 120:
+            tx = cx + 180 * k
+            ty = cy + 230 * k
+            if tx < x < tx + 80 * k and ty < y < ty + 120 * k:
                 r, g, b = 240, 210, 150
 
-            for sx, sy in [(220, 260), (780, 260), (230, 800), (700, 820)]:
-                if (x - sx) ** 2 + (y - sy) ** 2 < 35 ** 2:
+            for sx, sy in SPARKLES:
+                if (x - sx * k) ** 2 + (y - sy * k) ** 2 < (35 * k) ** 2:
                     r = g = b = 255
                     break
 
@@ -110,6 +125,163 @@ def render_base(size: int = BASE_SIZE):
     return data
 
 
+def render_base_array(size: int = BASE_SIZE):
+    """
+    NumPy version of render_base: every layer is evaluated as a whole-array
+    mask in the same order and with the same arithmetic, so the result matches
+    the reference pixel for pixel (--check verifies this). Returns uint8
+    (size, size, 4).
+    """
+    k = size / BASE_SIZE
+    cx = size / 2
+    cy = size / 2 + 50 * k
+    lens_radius = 250 * k
+    smile_y = cy - 40 * k
+    smile_r = 320 * k
+    y = np.arange(size, dtype=np.float64)[:, None]
+    x = np.arange(size, dtype=np.float64)[None, :]
+    shape = (size, size)
+
+    t = y / (size - 1)
+    r = np.broadcast_to(np.trunc(70 * (1 - t) + 40 * t), shape)
+    g = np.broadcast_to(np.trunc(60 * (1 - t) + 150 * t), shape)
+    b = np.broadcast_to(np.trunc(180 * (1 - t) + 160 * t), shape)
+
+    dx = (x - size / 2) / size
+    dy = (y - size / 2) / size
+    dist = np.sqrt(dx * dx + dy * dy)
+    mask = dist > 0.7
+    fade = np.minimum((dist - 0.7) / 0.3, 1)
+    r = np.where(mask, np.trunc(r * (1 - fade) + 20 * fade), r)
+    g = np.where(mask, np.trunc(g * (1 - fade) + 20 * fade), g)
+    b = np.where(mask, np.trunc(b * (1 - fade) + 30 * fade), b)
+
+    glow_dx = (x - size / 2) / (350 * k)
+    glow_dy = (y - (size * 0.45)) / (350 * k)
+    glow = np.exp(-(glow_dx * glow_dx + glow_dy * glow_dy))
+    r = np.minimum(255, np.trunc(r + 80 * glow))
+    g = np.minimum(255, np.trunc(g + 70 * glow))
+    b = np.minimum(255, np.trunc(b + 40 * glow))
+
+    d = np.hypot(x - cx, y - cy)
+    lens = d < lens_radius
+    mix = 0.75 * (1 - (d / lens_radius) * 0.3)
+    r = np.where(lens, np.trunc(r * (1 - mix) + 255 * mix), r)
+    g = np.where(lens, np.trunc(g * (1 - mix) + 210 * mix), g)
+    b = np.where(lens, np.trunc(b * (1 - mix) + 140 * mix), b)
+    ring = lens & (d > lens_radius - 10 * k)
+    r = np.where(ring, np.trunc(r * 0.7), r)
+    g = np.where(ring, np.trunc(g * 0.7), g)
+    b = np.where(ring, np.trunc(b * 0.7), b)
+
+    for hx, hy, rx, ry, keep in (
+        (cx - 90 * k, cy - 90 * k, 160 * k, 120 * k, 0.6),
+        (cx + 120 * k, cy - 10 * k, 90 * k, 60 * k, 0.7),
+    ):
+        mask = ((x - hx) / rx) ** 2 + ((y - hy) / ry) ** 2 < 1
+        add = 255 * (1 - keep)
+        r = np.where(mask, np.minimum(255, np.trunc(r * keep + add)), r)
+        g = np.where(mask, np.minimum(255, np.trunc(g * keep + add)), g)
+        b = np.where(mask, np.minimum(255, np.trunc(b * keep + add)), b)
+
+    val = smile_r ** 2 - (x - cx) ** 2
+    arc_y = smile_y + np.sqrt(np.maximum(val, 0))
+    mask = (
+        (np.abs(x - cx) < smile_r)
+        & (val >= 0)
+        & (smile_y - 10 * k < y)
+        & (y < arc_y + 5 * k)
+        & (np.abs(y - arc_y) < 4 * k)
+    )
+    r, g, b = (np.where(mask, v, c) for v, c in ((200, r), (90, g), (70, b)))
+
+    bx = x - (cx + 40 * k)
+    by = y - (cy - 250 * k)
+    proj = bx * 0.6 + by * 0.8
+    perp = -bx * 0.8 + by * 0.6
+    mask = (0 < proj) & (proj < 420 * k) & (np.abs(perp) < 55 * k)
+    r = np.where(mask, 255, r)
+    g = np.where(mask, np.trunc(140 + perp / k * 0.2), g)
+    b = np.where(mask, 100, b)
+
+    for (left, top, width, height), color in (
+        ((cx + 150 * k, cy - 50 * k, 70 * k, 280 * k), (60, 50, 80)),
+        ((cx + 180 * k, cy + 230 * k, 80 * k, 120 * k), (240, 210, 150)),
+    ):
+        mask = (left < x) & (x < left + width) & (top < y) & (y < top + height)
+        r, g, b = (np.where(mask, v, c) for v, c in zip(color, (r, g, b)))
+
+    for sx, sy in SPARKLES:
+        mask = (x - sx * k) ** 2 + (y - sy * k) ** 2 < (35 * k) ** 2
+        r, g, b = (np.where(mask, 255, c) for c in (r, g, b))
+
+    out = np.empty((size, size, 4), dtype=np.uint8)
+    out[..., 0] = r
+    out[..., 1] = g
+    out[..., 2] = b
+    out[..., 3] = 255
+    return out
+
+
+def _filter_weights(src: int, dst: int, kind: str):
+    """
+    (dst, src) resampling matrix. "box" weights each source pixel by its
+    exact overlap with the destination pixel (area averaging); "lanczos" is
+    Lanczos-3 with its support widened by the reduction ratio.
+    """
+    scale = src / dst
+    centers = (np.arange(dst) + 0.5) * scale
+    pos = np.arange(src) + 0.5
+    if kind == "box":
+        lo = np.maximum(pos[None, :] - 0.5, (centers - scale / 2)[:, None])
+        hi = np.minimum(pos[None, :] + 0.5, (centers + scale / 2)[:, None])
+        weights = np.clip(hi - lo, 0, None)
+    else:
+        xs = (pos[None, :] - centers[:, None]) / max(scale, 1.0)
+        weights = np.sinc(xs) * np.sinc(xs / 3) * (np.abs(xs) < 3)
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+def premultiply(arr):
+    """uint8 RGBA -> float64 premultiplied RGBA, so transparent pixels don't bleed."""
+    out = arr.astype(np.float64)
+    out[..., :3] *= out[..., 3:4] / 255
+    return out
+
+
+def unpremultiply(arr):
+    alpha = arr[..., 3:4]
+    rgb = np.divide(arr[..., :3] * 255, alpha, out=np.zeros_like(arr[..., :3]), where=alpha > 0)
+    out = np.concatenate([rgb, alpha], axis=2)
+    return np.clip(np.rint(out), 0, 255).astype(np.uint8)
+
+
+def downscale(arr, target: int, kind: str = "box"):
+    """Resample a premultiplied float (h, w, 4) array to target x target."""
+    h, w = arr.shape[:2]
+    out = _filter_weights(h, target, kind) @ arr.reshape(h, -1)
+    out = out.reshape(target, w, 4)
+    return np.matmul(_filter_weights(w, target, kind)[None], out)
+
+
+def build_mip_chain(base, min_size: int):
+    """Halve the base with exact 2x2 area averaging down to min_size; {side: level}."""
+    level = premultiply(base)
+    levels = {level.shape[0]: level}
+    while level.shape[0] // 2 >= min_size:
+        level = downscale(level, level.shape[0] // 2, "box")
+        levels[level.shape[0]] = level
+    return levels
+
+
+def from_mip_chain(levels, target: int):
+    """target x target uint8 RGBA, derived from the nearest level at least that large."""
+    if target in levels:
+        return unpremultiply(levels[target])
+    src = min((side for side in levels if side >= target), default=max(levels))
+    return unpremultiply(downscale(levels[src], target, "lanczos"))
+
+
 def resize(pixels, target):
     src = len(pixels)
     if target == src:
@@ -143,54 +315,265 @@ def resize(pixels, target):
     return result
 
 
-def save_png(pixels, path: Path):
-    height = len(pixels)
-    width = len(pixels[0])
-    raw = bytearray()
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_COMPRESS_LEVEL = 9
+IDAT_CHUNK_SIZE = 1 << 16
+FILTER_STRIP_ROWS = 64
+BPP = 4  # bytes per RGBA pixel
+
+
+def png_chunk(tag: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + tag
+        + data
+        + struct.pack(">I", binascii.crc32(tag + data) & 0xFFFFFFFF)
+    )
+
+
+def _paeth(a: int, b: int, c: int) -> int:
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+
+def _filter_cost(data) -> int:
+    """Sum of bytes read as signed values: the usual heuristic for picking a filter."""
+    return sum(v if v < 128 else 256 - v for v in data)
+
+
+def filter_scanline(row: bytes, prev: bytes) -> bytes:
+    """Pure-Python adaptive filter: the cheapest of None/Sub/Up/Paeth, prefixed with its type byte."""
+    n = len(row)
+    sub = bytes((row[i] - (row[i - BPP] if i >= BPP else 0)) & 0xFF for i in range(n))
+    up = bytes((row[i] - prev[i]) & 0xFF for i in range(n))
+    paeth = bytes(
+        (row[i] - _paeth(row[i - BPP] if i >= BPP else 0, prev[i], prev[i - BPP] if i >= BPP else 0)) & 0xFF
+        for i in range(n)
+    )
+    candidates = [(0, row), (1, sub), (2, up), (4, paeth)]
+    kind, data = min(candidates, key=lambda c: _filter_cost(c[1]))
+    return bytes((kind,)) + data
+
+
+def filter_strip(strip, prev):
+    """
+    Adaptive filtering for a (rows, stride) uint8 block; prev is the scanline
+    above the block. PNG filters predict from raw (unfiltered) neighbours, so
+    every row of the block is filtered at once.
+    """
+    rows = strip.astype(np.int16)
+    up = np.vstack([prev.astype(np.int16)[None], rows[:-1]])
+    left = np.zeros_like(rows)
+    left[:, BPP:] = rows[:, :-BPP]
+    upleft = np.zeros_like(rows)
+    upleft[:, BPP:] = up[:, :-BPP]
+    p = left + up - upleft
+    pa, pb, pc = np.abs(p - left), np.abs(p - up), np.abs(p - upleft)
+    predictor = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, upleft))
+    candidates = np.stack([rows, rows - left, rows - up, rows - predictor]).astype(np.uint8)
+    costs = np.abs(candidates.view(np.int8).astype(np.int32)).sum(axis=2)
+    best = costs.argmin(axis=0)
+    out = np.empty((strip.shape[0], strip.shape[1] + 1), dtype=np.uint8)
+    out[:, 0] = np.array([0, 1, 2, 4], dtype=np.uint8)[best]
+    out[:, 1:] = candidates[best, np.arange(strip.shape[0])]
+    return out
+
+
+def iter_filtered_scanlines(pixels):
+    """Yield filtered scanline bytes (type byte + data) for an RGBA image."""
+    if np is not None and isinstance(pixels, np.ndarray):
+        height = pixels.shape[0]
+        flat = np.ascontiguousarray(pixels).reshape(height, -1)
+        prev = np.zeros(flat.shape[1], dtype=np.uint8)
+        for top in range(0, height, FILTER_STRIP_ROWS):
+            strip = flat[top:top + FILTER_STRIP_ROWS]
+            yield filter_strip(strip, prev).tobytes()
+            prev = strip[-1]
+        return
+    prev = bytes(len(pixels[0]) * BPP)
     for row in pixels:
-        raw.append(0)
-        for r, g, b, a in row:
-            raw.extend((r, g, b, a))
-    compressed = zlib.compress(bytes(raw))
-
-    def chunk(tag: bytes, data: bytes) -> bytes:
-        return (
-            struct.pack(">I", len(data))
-            + tag
-            + data
-            + struct.pack(">I", binascii.crc32(tag + data) & 0xFFFFFFFF)
-        )
+        raw = bytes(v for px in row for v in px)
+        yield filter_scanline(raw, prev)
+        prev = raw
+
 
-    ihdr = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
-    png = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", compressed) + chunk(b"IEND", b"")
+def save_png(pixels, path: Path, level: int = PNG_COMPRESS_LEVEL):
+    """
+    Stream pixels (an (h, w, 4) uint8 array or rows of RGBA tuples) to path as
+    an RGBA PNG. Filtered scanlines feed an incremental zlib compressor and
+    IDAT chunks are written as the compressed output accumulates.
+    """
+    if np is not None and isinstance(pixels, np.ndarray):
+        height, width = pixels.shape[:2]
+    else:
+        height, width = len(pixels), len(pixels[0])
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_bytes(png)
+    tmp = path.with_name(path.name + ".part")
+    compressor = zlib.compressobj(level)
+    pending = bytearray()
+    with open(tmp, "wb") as f:
+        f.write(PNG_SIGNATURE)
+        f.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        for scanlines in iter_filtered_scanlines(pixels):
+            pending += compressor.compress(scanlines)
+            while len(pending) >= IDAT_CHUNK_SIZE:
+                f.write(png_chunk(b"IDAT", bytes(pending[:IDAT_CHUNK_SIZE])))
+                del pending[:IDAT_CHUNK_SIZE]
+        pending += compressor.flush()
+        if pending:
+            f.write(png_chunk(b"IDAT", bytes(pending)))
+        f.write(png_chunk(b"IEND", b""))
+    os.replace(tmp, path)
+
+
+# ---------------------------
+# Incremental builds
+# ---------------------------
+
+MANIFEST_NAME = ".icon_manifest.json"
+
+
+def file_digest(path: Path):
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def pixels_digest(pixels, level: int) -> str:
+    """Hash of the pixel content plus encoder settings, i.e. what a PNG is built from."""
+    h = hashlib.sha256(f"rgba8 level={level}\n".encode("ascii"))
+    if np is not None and isinstance(pixels, np.ndarray):
+        h.update(struct.pack(">II", *pixels.shape[:2]))
+        h.update(np.ascontiguousarray(pixels).tobytes())
+    else:
+        h.update(struct.pack(">II", len(pixels), len(pixels[0])))
+        for row in pixels:
+            h.update(bytes(v for px in row for v in px))
+    return h.hexdigest()
+
+
+class AssetManifest:
+    """
+    Content-hash manifest of the generated assets. Each entry records the
+    hash of what the file was built from ("source") and of the file itself,
+    so an asset is rewritten only when its input changed or the file on disk
+    no longer matches what was written.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            data = {}
+        self.generator = data.get("generator")
+        self.files = data.get("files", {})
+        self.written = []
+
+    def _key(self, path: Path) -> str:
+        return path.relative_to(ASSETS).as_posix()
+
+    def is_current(self, path: Path, source: str) -> bool:
+        entry = self.files.get(self._key(path))
+        return bool(entry) and entry.get("source") == source and entry.get("sha256") == file_digest(path)
+
+    def all_current(self) -> bool:
+        return bool(self.files) and all(
+            entry.get("sha256") == file_digest(ASSETS / key) for key, entry in self.files.items()
+        )
+
+    def record(self, path: Path, source: str) -> None:
+        self.files[self._key(path)] = {"source": source, "sha256": file_digest(path)}
+        self.written.append(path)
+
+    def save(self) -> None:
+        data = {"generator": self.generator, "files": dict(sorted(self.files.items()))}
+        self.path.write_text(json.dumps(data, indent=2) + "\n")
+
+
+def generator_digest(level: int, base_size: int) -> str:
+    """Hash of this script and its settings; if unchanged, no asset needs re-rendering."""
+    h = hashlib.sha256(Path(__file__).read_bytes())
+    h.update(f"level={level} base={base_size} numpy={np is not None}".encode("ascii"))
+    return h.hexdigest()
 
 
-def build_iconset(base_pixels):
+def write_png_if_changed(pixels, path: Path, manifest: AssetManifest, level: int) -> bool:
+    source = pixels_digest(pixels, level)
+    if manifest.is_current(path, source):
+        return False
+    save_png(pixels, path, level)
+    manifest.record(path, source)
+    return True
+
+
+def iconset_targets():
+    """(side, path) for every iconset PNG plus the web icon."""
+    targets = []
+    for size in ICON_SIZES:
+        targets.append((size, ICONSET / f"icon_{size}x{size}.png"))
+        targets.append((size * 2, ICONSET / f"icon_{size}x{size}@2x.png"))
+    targets.append((WEB_ICON_SIZE, ASSETS / "cartoonizer_web_icon.png"))
+    return targets
+
+
+def build_iconset(base_pixels, manifest: AssetManifest, level: int = PNG_COMPRESS_LEVEL):
+    ICONSET.mkdir(parents=True, exist_ok=True)
+    for size, path in iconset_targets():
+        write_png_if_changed(resize(base_pixels, size), path, manifest, level)
+
+
+def build_iconset_array(base, manifest: AssetManifest, level: int = PNG_COMPRESS_LEVEL):
+    """Derive every size from a mip chain of base and write the changed ones in parallel."""
     ICONSET.mkdir(parents=True, exist_ok=True)
-    for size in (16, 32, 128, 256, 512):
-        normal = resize(base_pixels, size)
-        save_png(normal, ICONSET / f"icon_{size}x{size}.png")
-        double = resize(base_pixels, size * 2)
-        save_png(double, ICONSET / f"icon_{size}x{size}@2x.png")
-
-
-def build_icns():
-    entries = [
-        ("ic10", "icon_512x512@2x.png"),
-        ("ic09", "icon_512x512.png"),
-        ("ic14", "icon_256x256@2x.png"),
-        ("ic08", "icon_256x256.png"),
-        ("ic13", "icon_128x128@2x.png"),
-        ("ic07", "icon_128x128.png"),
-        ("ic12", "icon_32x32@2x.png"),
-        ("ic11", "icon_16x16@2x.png"),
-        ("ic05", "icon_32x32.png"),
-        ("ic04", "icon_16x16.png"),
-    ]
+    levels = build_mip_chain(base, min(ICON_SIZES))
+
+    def write(target):
+        size, path = target
+        pixels = from_mip_chain(levels, size)
+        source = pixels_digest(pixels, level)
+        if manifest.is_current(path, source):
+            return None
+        save_png(pixels, path, level)
+        return path, source
+
+    # NumPy and zlib release the GIL, so threads give real parallelism here.
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as pool:
+        results = list(pool.map(write, iconset_targets()))
+    for result in results:
+        if result is not None:
+            manifest.record(*result)
+
+
+ICNS_ENTRIES = [
+    ("ic10", "icon_512x512@2x.png"),
+    ("ic09", "icon_512x512.png"),
+    ("ic14", "icon_256x256@2x.png"),
+    ("ic08", "icon_256x256.png"),
+    ("ic13", "icon_128x128@2x.png"),
+    ("ic07", "icon_128x128.png"),
+    ("ic12", "icon_32x32@2x.png"),
+    ("ic11", "icon_16x16@2x.png"),
+    ("ic05", "icon_32x32.png"),
+    ("ic04", "icon_16x16.png"),
+]
+
+
+def build_icns(manifest: AssetManifest):
+    """Pack the iconset into Cartoonizer.icns unless none of its PNGs changed."""
+    icns = ASSETS / "Cartoonizer.icns"
+    h = hashlib.sha256()
+    for tag, name in ICNS_ENTRIES:
+        h.update(f"{tag} {file_digest(ICONSET / name)}\n".encode("ascii"))
+    source = h.hexdigest()
+    if manifest.is_current(icns, source):
+        return
     chunks = []
-    for tag, name in entries:
+    for tag, name in ICNS_ENTRIES:
         data = (ICONSET / name).read_bytes()
         chunks.append((tag.encode("ascii"), data))
     total_len = 8 + sum(len(data) + 8 for _, data in chunks)
@@ -201,16 +584,94 @@ def build_icns():
         out.extend(tag)
         out.extend(struct.pack(">I", len(data) + 8))
         out.extend(data)
-    (ASSETS / "Cartoonizer.icns").write_bytes(bytes(out))
+    icns.write_bytes(bytes(out))
+    manifest.record(icns, source)
+
+
+# ---------------------------
+# Regression check
+# ---------------------------
+
+CHECK_SIZES = (64, 257, 1024)
+
+
+def check(sizes=CHECK_SIZES) -> bool:
+    """
+    Compare the NumPy path with the pure-Python reference at each size:
+    render_base_array must match render_base pixel for pixel, save_png must
+    write the same bytes for the array as for rows of tuples, and with Pillow
+    installed the PNG must decode back to the same pixels and every power-of-two
+    mip level must be within 1 of Pillow's box filter. Prints one line per size.
+    """
+    if np is None:
+        print("--check compares the NumPy renderer with the reference; install NumPy first")
+        return False
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        array_png, rows_png = Path(tmp) / "array.png", Path(tmp) / "rows.png"
+        for size in sizes:
+            reference = render_base(size)
+            expected = np.array(reference, dtype=np.uint8)
+            pixels = render_base_array(size)
+            problems = []
+            if not np.array_equal(pixels, expected):
+                diff = np.abs(pixels.astype(np.int16) - expected).max(axis=-1)
+                problems.append(f"{np.count_nonzero(diff)} pixels differ from render_base (max {diff.max()})")
+            save_png(pixels, array_png)
+            save_png(reference, rows_png)
+            if array_png.read_bytes() != rows_png.read_bytes():
+                problems.append("PNG bytes differ from the pure-Python writer")
+            if Image is not None:
+                with Image.open(array_png) as img:
+                    if not np.array_equal(np.asarray(img.convert("RGBA")), pixels):
+                        problems.append("PNG does not decode to the rendered pixels")
+                levels = build_mip_chain(pixels, min(ICON_SIZES))
+                for side in sorted(side for side in levels if size % side == 0 and side < size):
+                    box = np.asarray(Image.fromarray(pixels).resize((side, side), Image.BOX), dtype=np.int16)
+                    if np.abs(from_mip_chain(levels, side) - box).max() > 1:
+                        problems.append(f"{side}px mip level differs from a box filter")
+            print(f"{size}px: {'; '.join(problems) or 'OK'}")
+            ok = ok and not problems
+    return ok
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--compress-level", type=int, default=PNG_COMPRESS_LEVEL, choices=range(10), metavar="0-9",
+                    help=f"zlib level for the PNGs (default {PNG_COMPRESS_LEVEL})")
+    ap.add_argument("--force", action="store_true", help="Rewrite every asset even if the manifest says it is current.")
+    ap.add_argument("--check", nargs="*", type=int, metavar="SIZE",
+                    help="Check the NumPy renderer and PNG writer against the pure-Python reference at these "
+                    f"sizes (default {' '.join(map(str, CHECK_SIZES))}) and exit; writes no assets.")
+    args = ap.parse_args(argv)
+    if args.check is not None:
+        raise SystemExit(0 if check(args.check or CHECK_SIZES) else 1)
+    level = args.compress_level
 
+    manifest = AssetManifest(ASSETS / MANIFEST_NAME)
+    if args.force:
+        manifest.files = {}
+    generator = generator_digest(level, BASE_SIZE)
+    if manifest.generator == generator and manifest.all_current():
+        print("Icon assets up to date in", ASSETS)
+        return
+    manifest.generator = generator
 
-def main():
-    base_pixels = render_base()
-    save_png(base_pixels, ASSETS / "cartoonizer_icon_1024.png")
-    build_iconset(base_pixels)
-    build_icns()
-    save_png(resize(base_pixels, 512), ASSETS / "cartoonizer_web_icon.png")
-    print("Icon assets written to", ASSETS)
+    if np is not None:
+        base = render_base_array()
+        write_png_if_changed(base, ASSETS / "cartoonizer_icon_1024.png", manifest, level)
+        build_iconset_array(base, manifest, level)
+    else:
+        base_pixels = render_base()
+        write_png_if_changed(base_pixels, ASSETS / "cartoonizer_icon_1024.png", manifest, level)
+        build_iconset(base_pixels, manifest, level)
+    build_icns(manifest)
+    manifest.save()
+    print(f"Icon assets written to {ASSETS} ({len(manifest.written)} changed)")
 
 
 if __name__ == "__main__":
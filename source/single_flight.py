@@ -0,0 +1,117 @@
+"""
+Single-flight coalescing for GUI jobs.
+Identical requests that arrive while one is already computing attach to that
+computation and all receive its result, instead of queueing to compute the
+same image again. Only deterministic (seeded) requests may share a key. The
+computation runs on its own thread, so a cancelled request frees its queue
+worker at once even while others still wait for the result.
+"""
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from PIL import Image
+
+from job_control import CANCELLED, CancelToken, JobCancelled
+
+T = TypeVar("T")
+
+
+def request_key(image: Image.Image, mask: Optional[Image.Image], params: Dict) -> str:
+    """Hash of the input pixels, optional mask and every parameter that affects the result."""
+    h = hashlib.sha256()
+    for img in (image, mask):
+        if img is None:
+            h.update(b"-")
+            continue
+        h.update(f"{img.mode} {img.width}x{img.height}\n".encode("ascii"))
+        h.update(img.tobytes())
+    h.update(repr(sorted(params.items())).encode("utf-8"))
+    return h.hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.token = CancelToken()
+        self.subscribers: List[Optional[CancelToken]] = []
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    do(key, fn, token) runs fn(flight_token) once per key at a time, on a
+    worker thread of its own. Every caller, including the one that started
+    the flight, waits with its own token and returns as soon as that token
+    is cancelled. The flight's token is cancelled only when every attached
+    caller has cancelled, so one user cancelling does not abort a shared
+    computation.
+    """
+
+    def __init__(self, poll_interval: float = 0.1, max_workers: int = 2):
+        self.poll_interval = poll_interval
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="flight")
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+
+    def _watch(self, flight: _Flight, token: Optional[CancelToken]) -> None:
+        """Cancel the flight once token and every other subscriber have cancelled."""
+        if token is None:
+            return
+
+        def on_cancel(reason: str) -> None:
+            with self._lock:
+                if all(t is not None and t.cancelled for t in flight.subscribers):
+                    flight.token.cancel(reason)
+
+        # Outside self._lock: an already cancelled token runs on_cancel right away.
+        token.on_cancel(on_cancel)
+
+    def _run(self, key: str, flight: _Flight, fn: Callable[[CancelToken], T]) -> None:
+        try:
+            flight.result = fn(flight.token)
+        except BaseException as exc:
+            flight.error = exc
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[CancelToken], T],
+        token: Optional[CancelToken] = None,
+        on_step: Optional[Callable[[int, int], None]] = None,
+    ) -> Tuple[T, bool]:
+        """
+        Return (result, shared); shared is True if another caller started the
+        computation. on_step(step, steps) reports the flight's denoising steps.
+        Raises JobCancelled once token is cancelled, without waiting for fn.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            shared = flight is not None and not flight.token.cancelled
+            if not shared:
+                flight = _Flight()
+                self._flights[key] = flight
+            # Join under the same lock that on_cancel checks subscribers with,
+            # so a flight cannot be cancelled while a live caller is joining it.
+            flight.subscribers.append(token)
+        if not shared:
+            self._pool.submit(self._run, key, flight, fn)
+        self._watch(flight, token)
+
+        step = 0
+        while not flight.done.wait(self.poll_interval):
+            if token is not None and token.cancelled:
+                raise JobCancelled(token.reason or CANCELLED, flight.token.step)
+            if on_step is not None and flight.token.step != step and flight.token.steps:
+                step = flight.token.step
+                on_step(step, flight.token.steps)
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, shared
@@ -0,0 +1,155 @@
+"""
+Timed startup stages for Cartoonizer.
+Each stage (imports, from_pretrained, device move, patching, UI build,
+server bind, ...) is logged, published to the progress window and appended
+as one JSON line to startup_timings.jsonl so cold starts can be compared
+across runs. Every line carries the run id and the run's environment, plus
+a startup id shared by every run of the same process, which links the GUI's
+start with its first model load.
+"""
+import json
+import platform
+import socket
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from app_paths import support_path
+from logs import log
+from progress_channel import ProgressPublisher
+
+TIMINGS_FILE = "startup_timings.jsonl"
+STARTUP_ID = uuid.uuid4().hex[:12]
+
+
+def load_stage_history(path: str, mode: str, runs: int = 20) -> Dict[str, float]:
+    """Median seconds per stage over the last successful runs of mode."""
+    per_run: Dict[str, Dict[str, float]] = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event.get("mode") == mode and event.get("ok"):
+                    per_run.setdefault(event["run"], {})[event["stage"]] = event["seconds"]
+    except OSError:
+        return {}
+    recent = [stages for stages in per_run.values() if "total" in stages][-runs:]
+    history: Dict[str, float] = {}
+    for name in {name for stages in recent for name in stages}:
+        values = sorted(stages[name] for stages in recent if name in stages)
+        history[name] = values[len(values) // 2]
+    return history
+
+
+class StageTimer:
+    """
+    Record named stages of one run.
+    expected: the stages this run should go through, used to turn progress
+    into a percentage for the progress window.
+    publisher / log_path: where events go besides stdout (None to skip).
+    """
+
+    def __init__(
+        self,
+        expected: Sequence[str] = (),
+        publisher: Optional[ProgressPublisher] = None,
+        log_path: Optional[str] = None,
+        origin: Optional[float] = None,
+        context: Optional[Dict] = None,
+    ):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.expected = list(expected)
+        self.publisher = publisher
+        self.log_path = log_path
+        self.origin = time.perf_counter() if origin is None else origin
+        self.context = dict(context or {})
+        self.stages: List[Dict] = []
+        self.history: Dict[str, float] = {}
+
+    @classmethod
+    def for_startup(cls, mode: str, expected: Sequence[str], origin: Optional[float] = None, **context) -> "StageTimer":
+        """Timer that publishes to the progress window and appends to startup_timings.jsonl."""
+        context.update(
+            mode=mode,
+            startup=STARTUP_ID,
+            host=socket.gethostname(),
+            platform=platform.platform(),
+            python=platform.python_version(),
+            argv=sys.argv[1:],
+        )
+        timer = cls(
+            expected=expected,
+            publisher=ProgressPublisher(),
+            log_path=str(support_path(TIMINGS_FILE)),
+            origin=origin,
+            context=context,
+        )
+        timer.history = load_stage_history(timer.log_path, mode)
+        return timer
+
+    def _remaining(self) -> List[str]:
+        names = {s["stage"] for s in self.stages if s["ok"]}
+        return [name for name in self.expected if name not in names]
+
+    def _progress(self):
+        """Percent done and ETA, weighted by earlier runs' stage times when known."""
+        if not self.expected:
+            return None, None
+        remaining = self._remaining()
+        if all(name in self.history for name in self.expected):
+            total = sum(self.history[name] for name in self.expected) or 1.0
+            eta = sum(self.history[name] for name in remaining)
+            return 100.0 * (1 - eta / total), eta
+        return 100.0 * (len(self.expected) - len(remaining)) / len(self.expected), None
+
+    def record(self, stage: str, seconds: float, ok: bool = True, **extra) -> None:
+        event = {
+            "run": self.run_id,
+            "ts": time.time(),
+            "stage": stage,
+            "seconds": round(seconds, 4),
+            "since_start": round(time.perf_counter() - self.origin, 4),
+            "ok": ok,
+        }
+        event.update(extra)
+        self.stages.append(event)
+        log(f"[timing] {stage}: {seconds:.2f}s" + ("" if ok else " (failed)"))
+        self._write(dict(event, **self.context))
+
+    @contextmanager
+    def stage(self, name: str, message: Optional[str] = None, **extra) -> Iterator[None]:
+        """Time the enclosed block as stage name."""
+        if self.publisher is not None:
+            percent, eta = self._progress()
+            self.publisher.update(name, message or f"{name}...", percent=percent, eta=eta)
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(name, time.perf_counter() - start, ok=False, **extra)
+            raise
+        self.record(name, time.perf_counter() - start, **extra)
+
+    def finish(self) -> None:
+        """Log the totals, mark the run complete and close the progress window."""
+        total = time.perf_counter() - self.origin
+        breakdown = ", ".join(f"{s['stage']} {s['seconds']:.2f}s" for s in self.stages)
+        log(f"[timing] startup total {total:.2f}s ({breakdown})")
+        event = {"run": self.run_id, "ts": time.time(), "stage": "total", "seconds": round(total, 4), "ok": True}
+        self._write(dict(event, **self.context))
+        if self.publisher is not None:
+            self.publisher.close_window()
+
+    def _write(self, event: Dict) -> None:
+        if not self.log_path:
+            return
+        try:
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(event, default=str) + "\n")
+        except OSError as exc:
+            log(f"Could not write startup timings to {self.log_path}: {exc}")
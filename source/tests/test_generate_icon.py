@@ -0,0 +1,39 @@
+"""
+Regression test for scripts/generate_icon.py: the NumPy renderer and PNG
+writer must keep producing exactly what the pure-Python reference does.
+Run from the source folder: python3 -m unittest discover -s tests
+"""
+import contextlib
+import io
+import unittest
+
+from scripts import generate_icon
+
+
+@unittest.skipIf(generate_icon.np is None, "needs NumPy")
+class GenerateIconTest(unittest.TestCase):
+    def test_matches_reference(self):
+        # Small sizes keep the pure-Python reference fast; 257 exercises odd sides.
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            ok = generate_icon.check((64, 257))
+        self.assertTrue(ok, out.getvalue())
+
+    def test_detects_drift(self):
+        original = generate_icon.render_base_array
+
+        def drifted(size):
+            pixels = original(size)
+            pixels[size // 2, size // 2, 0] ^= 1
+            return pixels
+
+        generate_icon.render_base_array = drifted
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertFalse(generate_icon.check((32,)))
+        finally:
+            generate_icon.render_base_array = original
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Unit tests for job_control.py (GUI job cancellation and supersede).
+Run from the source folder: python3 -m unittest discover -s tests
+"""
+import unittest
+
+from job_control import CANCELLED, SUPERSEDED, CancelToken, JobCancelled, SessionJobs
+
+
+class FakePipe:
+    num_timesteps = 10
+
+
+class CancelTokenTest(unittest.TestCase):
+    def test_step_callback_raises_once_cancelled(self):
+        token = CancelToken()
+        self.assertEqual(token.step_callback(FakePipe(), 2, None, {"k": 1}), {"k": 1})
+        self.assertEqual((token.step, token.steps), (3, 10))
+        token.cancel(CANCELLED)
+        with self.assertRaises(JobCancelled) as ctx:
+            token.step_callback(FakePipe(), 3, None, {})
+        self.assertEqual((ctx.exception.reason, ctx.exception.step), (CANCELLED, 4))
+
+    def test_on_cancel_runs_once_even_if_already_cancelled(self):
+        token = CancelToken()
+        calls = []
+        token.on_cancel(calls.append)
+        token.cancel("first")
+        token.cancel("second")
+        token.on_cancel(calls.append)
+        self.assertEqual(calls, ["first", "first"])
+        self.assertEqual(token.reason, "first")
+
+
+class SessionJobsTest(unittest.TestCase):
+    def setUp(self):
+        self.jobs = SessionJobs()
+
+    def assert_forgotten(self, session: str):
+        for table in (self.jobs._latest, self.jobs._cancelled_upto, self.jobs._begun, self.jobs._running):
+            self.assertNotIn(session, table)
+
+    def test_resubmit_supersedes_running_job(self):
+        first = self.jobs.submit("s")
+        token = self.jobs.begin("s", first)
+        self.assertFalse(token.cancelled)
+        second = self.jobs.submit("s")
+        self.assertEqual(token.reason, SUPERSEDED)
+        self.assertFalse(self.jobs.begin("s", second).cancelled)
+
+    def test_resubmit_supersedes_queued_job(self):
+        first = self.jobs.submit("s")
+        second = self.jobs.submit("s")
+        self.assertEqual(self.jobs.begin("s", first).reason, SUPERSEDED)
+        self.assertFalse(self.jobs.begin("s", second).cancelled)
+
+    def test_sessions_are_independent(self):
+        a = self.jobs.begin("a", self.jobs.submit("a"))
+        self.jobs.submit("b")
+        self.assertFalse(self.jobs.cancel("c"))
+        self.assertFalse(a.cancelled)
+
+    def test_cancel_before_begin(self):
+        job_id = self.jobs.submit("s")
+        self.assertTrue(self.jobs.cancel("s"))
+        self.assertEqual(self.jobs.begin("s", job_id).reason, CANCELLED)
+
+    def test_cancel_after_begin(self):
+        token = self.jobs.begin("s", self.jobs.submit("s"))
+        self.assertTrue(self.jobs.cancel("s"))
+        self.assertEqual(token.reason, CANCELLED)
+        self.assertFalse(self.jobs.cancel("s"))
+
+    def test_cancel_with_nothing_submitted(self):
+        self.assertFalse(self.jobs.cancel("s"))
+        self.assert_forgotten("s")
+
+    def test_job_after_cancel_runs(self):
+        self.jobs.begin("s", self.jobs.submit("s"))
+        self.jobs.cancel("s")
+        self.assertFalse(self.jobs.begin("s", self.jobs.submit("s")).cancelled)
+
+    def test_end_forgets_session(self):
+        token = self.jobs.begin("s", self.jobs.submit("s"))
+        self.jobs.cancel("s")
+        self.jobs.end("s", token)
+        self.assert_forgotten("s")
+
+    def test_end_keeps_state_for_queued_job(self):
+        token = self.jobs.begin("s", self.jobs.submit("s"))
+        queued = self.jobs.submit("s")
+        self.assertTrue(self.jobs.cancel("s"))
+        self.jobs.end("s", token)
+        # The queued job was cancelled too, and must still see that when it starts.
+        late = self.jobs.begin("s", queued)
+        self.assertEqual(late.reason, CANCELLED)
+        self.jobs.end("s", late)
+        self.assert_forgotten("s")
+
+    def test_end_of_stale_token_is_ignored(self):
+        old = self.jobs.begin("s", self.jobs.submit("s"))
+        new = self.jobs.begin("s", self.jobs.submit("s"))
+        self.jobs.end("s", old)
+        self.assertTrue(self.jobs.cancel("s"))
+        self.assertEqual(new.reason, CANCELLED)
+
+
+if __name__ == "__main__":
+    unittest.main()
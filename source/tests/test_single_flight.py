@@ -0,0 +1,172 @@
+"""
+Unit tests for single_flight.py (coalescing of identical GUI requests).
+Run from the source folder: python3 -m unittest discover -s tests
+"""
+import threading
+import time
+import unittest
+
+from job_control import CANCELLED, SUPERSEDED, CancelToken, JobCancelled
+from single_flight import SingleFlight
+
+TIMEOUT = 5.0
+
+
+class FakePipe:
+    num_timesteps = 4
+
+
+def wait_until(condition, timeout: float = TIMEOUT) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.001)
+
+
+class Caller(threading.Thread):
+    """Runs flights.do(key, fn, token) on a thread of its own and keeps the outcome."""
+
+    def __init__(self, flights: SingleFlight, key: str, fn, token=None, on_step=None):
+        super().__init__(daemon=True)
+        self.args = (key, fn, token, on_step)
+        self.flights = flights
+        self.result = self.error = None
+        self.start()
+
+    def run(self) -> None:
+        try:
+            self.result = self.flights.do(*self.args)
+        except BaseException as exc:
+            self.error = exc
+
+    def outcome(self):
+        self.join(TIMEOUT)
+        assert not self.is_alive(), "caller did not return"
+        return self.result, self.error
+
+
+class GatedJob:
+    """A fake job that blocks until released (or its flight token is cancelled)."""
+
+    def __init__(self, result="image", error=None):
+        self.result, self.error = result, error
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+        self.tokens = []
+
+    def __call__(self, token: CancelToken):
+        self.calls += 1
+        self.tokens.append(token)
+        self.started.set()
+        while not self.release.wait(0.001):
+            token.raise_if_cancelled()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.flights = SingleFlight(poll_interval=0.001)
+
+    def subscribers(self, key: str) -> int:
+        with self.flights._lock:
+            flight = self.flights._flights.get(key)
+            return len(flight.subscribers) if flight is not None else 0
+
+    def test_identical_requests_share_one_computation(self):
+        job = GatedJob()
+        first = Caller(self.flights, "k", job, CancelToken())
+        job.started.wait(TIMEOUT)
+        second = Caller(self.flights, "k", job, CancelToken())
+        wait_until(lambda: self.subscribers("k") == 2)
+        job.release.set()
+        self.assertEqual(first.outcome(), (("image", False), None))
+        self.assertEqual(second.outcome(), (("image", True), None))
+        self.assertEqual(job.calls, 1)
+
+    def test_different_keys_do_not_share(self):
+        job = GatedJob()
+        job.release.set()
+        self.assertEqual(self.flights.do("a", job), ("image", False))
+        self.assertEqual(self.flights.do("b", job), ("image", False))
+        self.assertEqual(job.calls, 2)
+
+    def test_failure_reaches_every_caller(self):
+        job = GatedJob(error=ValueError("out of memory"))
+        first = Caller(self.flights, "k", job, CancelToken())
+        job.started.wait(TIMEOUT)
+        second = Caller(self.flights, "k", job, CancelToken())
+        wait_until(lambda: self.subscribers("k") == 2)
+        job.release.set()
+        for caller in (first, second):
+            result, error = caller.outcome()
+            self.assertIsInstance(error, ValueError)
+        # A failed flight is not reused.
+        wait_until(lambda: self.subscribers("k") == 0)
+        job.error = None
+        self.assertEqual(self.flights.do("k", job), ("image", False))
+
+    def test_cancelled_starter_returns_while_follower_waits(self):
+        job = GatedJob()
+        starter_token, follower_token = CancelToken(), CancelToken()
+        starter = Caller(self.flights, "k", job, starter_token)
+        job.started.wait(TIMEOUT)
+        follower = Caller(self.flights, "k", job, follower_token)
+        wait_until(lambda: self.subscribers("k") == 2)
+        starter_token.cancel(SUPERSEDED)
+        result, error = starter.outcome()  # returns without waiting for the job
+        self.assertIsInstance(error, JobCancelled)
+        self.assertEqual(error.reason, SUPERSEDED)
+        self.assertFalse(job.tokens[0].cancelled)
+        job.release.set()
+        self.assertEqual(follower.outcome(), (("image", True), None))
+
+    def test_all_callers_cancelled_cancels_the_job(self):
+        job = GatedJob()
+        tokens = [CancelToken(), CancelToken()]
+        first = Caller(self.flights, "k", job, tokens[0])
+        job.started.wait(TIMEOUT)
+        second = Caller(self.flights, "k", job, tokens[1])
+        wait_until(lambda: self.subscribers("k") == 2)
+        tokens[0].cancel(CANCELLED)
+        self.assertFalse(job.tokens[0].cancelled)
+        tokens[1].cancel(CANCELLED)
+        self.assertTrue(job.tokens[0].cancelled)
+        for caller in (first, second):
+            self.assertIsInstance(caller.outcome()[1], JobCancelled)
+        # The next identical request starts over instead of joining the cancelled flight.
+        job.started.clear()
+        third = Caller(self.flights, "k", job, CancelToken())
+        job.started.wait(TIMEOUT)
+        job.release.set()
+        self.assertEqual(third.outcome(), (("image", False), None))
+        self.assertEqual(job.calls, 2)
+
+    def test_cancelled_before_joining(self):
+        job = GatedJob()
+        token = CancelToken()
+        token.cancel(CANCELLED)
+        with self.assertRaises(JobCancelled):
+            self.flights.do("k", job, token)
+        wait_until(lambda: self.subscribers("k") == 0)
+        self.assertTrue(all(t.cancelled for t in job.tokens))
+
+    def test_callers_see_step_progress(self):
+        steps = []
+        at_step = threading.Event()
+
+        def job(token: CancelToken):
+            token.step_callback(FakePipe(), 1, None, {})
+            at_step.wait(TIMEOUT)
+            return "image"
+
+        caller = Caller(self.flights, "k", job, CancelToken(), on_step=lambda *s: (steps.append(s), at_step.set()))
+        self.assertEqual(caller.outcome(), (("image", False), None))
+        self.assertEqual(steps, [(2, 4)])
+
+
+if __name__ == "__main__":
+    unittest.main()
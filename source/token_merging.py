@@ -0,0 +1,208 @@
+"""
+Token merging (ToMe) for the Stable Diffusion UNet.
+Before each self-attention in the highest-resolution transformer blocks, the
+most similar latent tokens are merged (bipartite soft matching, one
+destination token per 2x2 patch), attention runs on the shorter sequence, and
+the result is copied back to every merged token. The pipeline is patched once;
+the merge ratio is per request, so it can change between jobs without
+reloading the model.
+"""
+import math
+from typing import Callable, List, Optional, Tuple
+
+import torch
+
+from logs import log
+
+# Fraction of tokens merged is capped here; above it quality falls off quickly.
+MAX_RATIO = 0.75
+# Only blocks whose token grid is at most this many times smaller than the
+# latent are merged (1 = only the full-resolution blocks, where attention costs most).
+DEFAULT_MAX_DOWNSAMPLE = 1
+
+Merge = Callable[[torch.Tensor], torch.Tensor]
+
+
+class MergeState:
+    """Per-pipeline settings shared by all patched attention layers."""
+
+    def __init__(self):
+        self.ratio = 0.0
+        self.max_downsample = DEFAULT_MAX_DOWNSAMPLE
+        self.latent_size: Optional[Tuple[int, int]] = None
+        # Destination tokens are picked at random within each patch; a fixed
+        # seed keeps seeded requests reproducible.
+        self.generator = torch.Generator(device="cpu")
+
+    def describe(self) -> str:
+        return f"token merging {self.ratio:.0%}" if self.ratio > 0 else "token merging off"
+
+
+# ---------------------------
+# Bipartite soft matching
+# ---------------------------
+
+def _gather(x: torch.Tensor, dim: int, index: torch.Tensor) -> torch.Tensor:
+    # MPS returns wrong results for gather on a trailing dimension of size 1.
+    if x.device.type == "mps" and x.shape[-1] == 1:
+        return torch.gather(x.unsqueeze(-1), dim - 1 if dim < 0 else dim, index.unsqueeze(-1)).squeeze(-1)
+    return torch.gather(x, dim, index)
+
+
+def bipartite_soft_matching(
+    metric: torch.Tensor,
+    width: int,
+    height: int,
+    r: int,
+    generator: Optional[torch.Generator] = None,
+) -> Tuple[Merge, Merge]:
+    """
+    Plan merging r of the width*height tokens of metric (B, N, C).
+    One token in every 2x2 patch is a destination; each other (source) token
+    is matched to its most similar destination and the r best-matched
+    sources are averaged into their destinations. Returns (merge, unmerge).
+    """
+    batch, tokens, _ = metric.shape
+    patches_y, patches_x = height // 2, width // 2
+    num_dst = patches_y * patches_x
+    r = min(r, tokens - num_dst)
+    if r <= 0 or num_dst == 0:
+        return (lambda x: x), (lambda x: x)
+
+    with torch.no_grad():
+        # -1 marks the destination of each patch; argsort puts destinations first.
+        pick = torch.randint(4, size=(patches_y, patches_x, 1), generator=generator).to(metric.device)
+        grid = torch.zeros(patches_y, patches_x, 4, device=metric.device, dtype=torch.int64)
+        grid.scatter_(2, pick, -torch.ones_like(pick))
+        grid = grid.view(patches_y, patches_x, 2, 2).transpose(1, 2).reshape(patches_y * 2, patches_x * 2)
+        if grid.shape != (height, width):
+            full = torch.zeros(height, width, device=metric.device, dtype=torch.int64)
+            full[: patches_y * 2, : patches_x * 2] = grid
+            grid = full
+        order = grid.reshape(1, -1, 1).argsort(dim=1)
+        src_tokens = order[:, num_dst:, :]
+        dst_tokens = order[:, :num_dst, :]
+
+        def split(x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+            channels = x.shape[-1]
+            src = _gather(x, 1, src_tokens.expand(x.shape[0], tokens - num_dst, channels))
+            dst = _gather(x, 1, dst_tokens.expand(x.shape[0], num_dst, channels))
+            return src, dst
+
+        metric = metric / metric.norm(dim=-1, keepdim=True)
+        a, b = split(metric)
+        scores = a @ b.transpose(-1, -2)
+        best, best_dst = scores.max(dim=-1)
+        ranked = best.argsort(dim=-1, descending=True)[..., None]
+        kept = ranked[..., r:, :]
+        merged = ranked[..., :r, :]
+        merged_dst = _gather(best_dst[..., None], -2, merged)
+
+    def merge(x: torch.Tensor) -> torch.Tensor:
+        src, dst = split(x)
+        n, t, c = src.shape
+        unmerged = _gather(src, -2, kept.expand(n, t - r, c))
+        src = _gather(src, -2, merged.expand(n, r, c))
+        dst = dst.scatter_reduce(-2, merged_dst.expand(n, r, c), src, reduce="mean")
+        return torch.cat([unmerged, dst], dim=1)
+
+    def unmerge(x: torch.Tensor) -> torch.Tensor:
+        kept_len = kept.shape[1]
+        unmerged, dst = x[..., :kept_len, :], x[..., kept_len:, :]
+        c = x.shape[-1]
+        src = _gather(dst, -2, merged_dst.expand(batch, r, c))
+        out = torch.zeros(batch, tokens, c, device=x.device, dtype=x.dtype)
+        src_index = src_tokens.expand(batch, src_tokens.shape[1], 1)
+        out.scatter_(-2, dst_tokens.expand(batch, num_dst, c), dst)
+        out.scatter_(-2, _gather(src_index, 1, kept).expand(batch, kept_len, c), unmerged)
+        out.scatter_(-2, _gather(src_index, 1, merged).expand(batch, r, c), src)
+        return out
+
+    return merge, unmerge
+
+
+# ---------------------------
+# Pipeline patching
+# ---------------------------
+
+class TokenMergingProcessor:
+    """
+    Wraps a self-attention processor (plain, sliced or xFormers) so it runs on
+    merged tokens. Cross-attention and lower-resolution blocks pass through.
+    """
+
+    def __init__(self, inner, state: MergeState):
+        self.inner = inner
+        self.state = state
+
+    def _plan(self, hidden_states: torch.Tensor) -> Optional[Tuple[Merge, Merge]]:
+        state = self.state
+        if state.ratio <= 0 or state.latent_size is None or hidden_states.ndim != 3:
+            return None
+        latent_h, latent_w = state.latent_size
+        tokens = hidden_states.shape[1]
+        downsample = math.ceil(math.sqrt(latent_h * latent_w / tokens))
+        if downsample > state.max_downsample:
+            return None
+        height, width = math.ceil(latent_h / downsample), math.ceil(latent_w / downsample)
+        if height * width != tokens:
+            return None
+        r = int(tokens * state.ratio)
+        return bipartite_soft_matching(hidden_states, width, height, r, state.generator)
+
+    def __call__(self, attn, hidden_states, encoder_hidden_states=None, attention_mask=None, **kwargs):
+        plan = None if encoder_hidden_states is not None else self._plan(hidden_states)
+        if plan is None:
+            return self.inner(attn, hidden_states, encoder_hidden_states, attention_mask, **kwargs)
+        merge, unmerge = plan
+        out = self.inner(attn, merge(hidden_states), None, attention_mask, **kwargs)
+        return unmerge(out)
+
+
+def _self_attention_layers(unet) -> List[torch.nn.Module]:
+    from diffusers.models.attention import BasicTransformerBlock
+
+    return [block.attn1 for block in unet.modules() if isinstance(block, BasicTransformerBlock)]
+
+
+def _wrap_layers(layers: List[torch.nn.Module], state: MergeState) -> None:
+    # Attention slicing (chosen per job by the memory governor) replaces the
+    # processors, so they are re-wrapped before every UNet call.
+    for attn in layers:
+        if not isinstance(attn.processor, TokenMergingProcessor):
+            attn.set_processor(TokenMergingProcessor(attn.processor, state))
+
+
+def _install(pipe) -> MergeState:
+    state = getattr(pipe, "_token_merging", None)
+    if state is not None:
+        return state
+    state = MergeState()
+    layers = _self_attention_layers(pipe.unet)
+
+    def before_unet(module, args):
+        if args:
+            state.latent_size = tuple(args[0].shape[-2:])
+        if state.ratio > 0:
+            _wrap_layers(layers, state)
+
+    pipe.unet.register_forward_pre_hook(before_unet)
+    pipe._token_merging = state
+    return state
+
+
+def set_token_merging(pipe, ratio: float, max_downsample: int = DEFAULT_MAX_DOWNSAMPLE) -> None:
+    """
+    Merge this fraction of tokens (0 disables) in the UNet's self-attention
+    for the pipeline's following runs. Cheap; call it before every request.
+    """
+    if not 0.0 <= ratio <= MAX_RATIO:
+        raise ValueError(f"token merging ratio must be between 0 and {MAX_RATIO}, got {ratio}")
+    if ratio == 0 and getattr(pipe, "_token_merging", None) is None:
+        return
+    state = _install(pipe)
+    if ratio != state.ratio:
+        log(f"Token merging: {ratio:.0%} of tokens" if ratio > 0 else "Token merging off")
+    state.ratio = ratio
+    state.max_downsample = max_downsample
+    state.generator.manual_seed(0)